@@ -17,6 +17,12 @@ import glob
 import os
 import shutil 
 import pandas
+from lxml import etree
+
+## Decorator for tests which build very large models or compare
+## timings. They are skipped unless PYCOTOOLS_SLOW_TESTS is set.
+slow = unittest.skipUnless(os.environ.get('PYCOTOOLS_SLOW_TESTS'),
+                           'slow test. Set PYCOTOOLS_SLOW_TESTS=1 to run it')
 
 
 class _BaseTest(unittest.TestCase):
@@ -41,6 +47,23 @@ class _BaseTest(unittest.TestCase):
         # self.GMQ = pycotools.pycopi.GetModelQuantities(self.copasi_file)
         self.model = pycotools.model.Model(self.copasi_file)
 
+    def rewritten_model(self, change):
+        """
+        Write the test model, change its xml and write it again.
+        Used to build large synthetic models
+        :param change:
+            callable. Takes the xml of the test model and changes it in place
+        :return:
+            :py:class:`model.Model`. Freshly read from file
+        """
+        with open(self.copasi_file, 'w') as f:
+            f.write(test_models.TestModels.get_model1())
+        xml = pycotools.model.Model(self.copasi_file).xml
+        change(xml)
+        with open(self.copasi_file, 'w') as f:
+            f.write(etree.tostring(xml))
+        return pycotools.model.Model(self.copasi_file)
+
     def tearDown(self):
         tear_down = True
         delete_dirs = True
@@ -0,0 +1,130 @@
+#-*-coding: utf-8 -*-
+"""
+
+ This file is part of pycotools.
+
+ pycotools is free software: you can redistribute it and/or modify
+ it under the terms of the GNU Lesser General Public License as published by
+ the Free Software Foundation, either version 3 of the License, or
+ (at your option) any later version.
+
+ pycotools is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ GNU Lesser General Public License for more details.
+
+ You should have received a copy of the GNU Lesser General Public License
+ along with pycotools.  If not, see <http://www.gnu.org/licenses/>.
+
+
+ $Author: Ciaran Welsh
+
+Memory benchmark for the model components. A synthetic
+model with 10000 species is built by cloning the metabolites
+of the test model.
+"""
+
+import pycotools
+from pycotools import xpaths
+from pycotools.Tests import _test_base
+from lxml import etree
+import sys
+import unittest
+
+
+def add_metabolites(xml, n):
+    """
+    Add n metabolites to the compartment
+    of the test model
+    :param xml:
+        :py:class:`etree._Element`
+    :param n:
+        `int`. Number of metabolites to add
+    :return:
+        None
+    """
+    tag = xpaths.tag
+    model_element = xml.find(tag('Model'))
+    metabolites = model_element.find(tag('ListOfMetabolites'))
+    state_template = model_element.find(tag('StateTemplate'))
+    initial_state = model_element.find(tag('InitialState'))
+    for i in range(n):
+        key = 'Metabolite_{}'.format(i + 1000)
+        etree.SubElement(metabolites, tag('Metabolite'),
+                         attrib={'key': key,
+                                 'name': 'S{}'.format(i),
+                                 'simulationType': 'reactions',
+                                 'compartment': 'Compartment_1'})
+        etree.SubElement(state_template, tag('StateTemplateVariable'),
+                         attrib={'objectReference': key})
+    initial_state.text = '{} {} \n'.format(initial_state.text.strip(),
+                                           ' '.join(['6.022140857e+20'] * n))
+
+
+class _Record(object):
+    """
+    A component with its attributes in a __dict__,
+    as the components were before they used __slots__
+    """
+    def __init__(self, attributes):
+        self.__dict__.update(attributes)
+
+
+class ComponentMemoryTests(_test_base._BaseTest):
+    def setUp(self):
+        super(ComponentMemoryTests, self).setUp()
+
+    def synthetic_model(self, n):
+        """
+        :param n:
+            `int`. Number of metabolites to add
+        :return:
+            :py:class:`model.Model`. The test model with n more metabolites
+        """
+        return self.rewritten_model(lambda xml: add_metabolites(xml, n))
+
+    @staticmethod
+    def footprint(objects):
+        """
+        :param objects:
+            `list`. Objects to measure
+
+        :return:
+            `int`. Bytes used by the objects themselves and their
+            __dict__, not counting the attribute values they share
+        """
+        size = 0
+        for i in objects:
+            size += sys.getsizeof(i)
+            if hasattr(i, '__dict__'):
+                size += sys.getsizeof(i.__dict__)
+        return size
+
+    def test_species_read_correctly(self):
+        mod = self.synthetic_model(10)
+        self.assertEqual(mod.get('metabolite', 'S9', by='name').key, 'Metabolite_1009')
+
+    def test_components_have_no_dict(self):
+        mod = self.model
+        components = [mod.compartments[0], mod.metabolites[0], mod.global_quantities[0],
+                      mod.reactions[0], mod.reactions[0].substrates[0], mod.functions[0],
+                      mod.functions[0].list_of_parameter_descriptions[0],
+                      mod.local_parameters[0]]
+        for i in components:
+            self.assertFalse(hasattr(i, '__dict__'), type(i).__name__)
+
+    def test_species_footprint(self):
+        """
+        10000 species take less than half the memory
+        they took with a __dict__ each
+        """
+        n = 10000
+        metabolites = self.synthetic_model(n).metabolites
+        ## 3 metabolites are already in the test model
+        self.assertEqual(len(metabolites), n + 3)
+        records = [_Record(pycotools.model._attributes(i)) for i in metabolites]
+        self.assertLess(self.footprint(metabolites), self.footprint(records) / 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
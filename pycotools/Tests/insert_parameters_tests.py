@@ -62,6 +62,14 @@ class InsertParametersTests(_test_base._BaseTest):
         # print df
         # print new_model.local_parameters[0].__dict__
 
+    def test_insert_local_full_precision(self):
+        value = 0.12345678901234567
+        InsertParameters(self.model, parameter_dict={'(B2C).k2': value}).insert_locals()
+        element = self.model._local_parameter_elements(self.model.xml)['(B2C).k2'][0]
+        self.assertEqual(float(element.attrib['value']), value)
+        self.assertEqual(float(self.model.get('local_parameter', '(B2C).k2',
+                                              by='global_name').value), value)
+
 
 
     
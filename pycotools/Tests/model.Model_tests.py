@@ -30,11 +30,13 @@ site.addsitedir('/home/b3053674/Documents/pycotools')
 import pycotools
 from pycotools.Tests import _test_base
 
-import os, glob
+import os, glob, shutil
+import threading
 import pandas
 import unittest
 from lxml import etree
 from collections import OrderedDict
+from copy import deepcopy
 
 class ModelLevelAttributeTests(_test_base._BaseTest):
     """
@@ -127,6 +129,103 @@ class ModelLevelAttributeTests(_test_base._BaseTest):
         new_model.save()
         self.assertTrue(os.path.isfile(new_filename))
 
+    def test_copies_share_xml(self):
+        """
+        Copies share the xml of the original
+        until they are changed
+        :return:
+        """
+        copy1 = self.model.copy(os.path.join(self.model.root, 'CopasiModel2.cps'))
+        copy2 = self.model.copy(os.path.join(self.model.root, 'CopasiModel3.cps'))
+        self.assertIs(copy1._template, copy2._template)
+        self.assertIsNone(copy1._xml)
+
+    def test_copy_independent(self):
+        """
+        Changing a copy does not change the original
+        and vice versa
+        :return:
+        """
+        new_model = self.model.copy(os.path.join(self.model.root, 'CopasiModel2.cps'))
+        new_model.remove('metabolite', 'A')
+        self.model.remove('metabolite', 'B')
+        self.assertEqual(self.model.get('metabolite', 'B'), [])
+        self.assertNotEqual(self.model.get('metabolite', 'A'), [])
+        self.assertEqual(new_model.get('metabolite', 'A'), [])
+        self.assertNotEqual(new_model.get('metabolite', 'B'), [])
+
+    def test_save_unchanged_copy(self):
+        """
+        :return:
+        """
+        new_filename = os.path.join(self.model.root, 'CopasiModel2.cps')
+        self.model.copy(new_filename).save()
+        with open(new_filename) as f:
+            saved = f.read()
+        self.assertEqual(saved, etree.tostring(self.model.xml, pretty_print=True))
+
+    def test_save(self):
+        """
+        Saving writes the xml once and leaves no
+        temporary files behind
+        :return:
+        """
+        self.model.save()
+        with open(self.copasi_file) as f:
+            saved = f.read()
+        self.assertEqual(saved, etree.tostring(self.model.xml, pretty_print=True))
+        self.assertListEqual(glob.glob(os.path.join(self.model.root, '*.tmp')), [])
+
+    def test_lazy_components(self):
+        """
+        A lazy model reads the same components
+        :return:
+        """
+        model = pycotools.model.Model(self.copasi_file, lazy=True)
+        self.assertListEqual([i.name for i in model.metabolites],
+                             [i.name for i in self.model.metabolites])
+        self.assertListEqual([i.name for i in model.reactions],
+                             [i.name for i in self.model.reactions])
+
+    def test_lazy_skipped_are_empty(self):
+        """
+        :return:
+        """
+        model = pycotools.model.Model(self.copasi_file, lazy=True)
+        miriam = list(model.xml.iter('{http://www.copasi.org/static/schema}MiriamAnnotation'))
+        self.assertNotEqual(miriam, [])
+        for i in miriam:
+            self.assertEqual(len(i), 0)
+
+    def test_lazy_save_verbatim(self):
+        """
+        Skipped sections are written exactly as
+        they were in the file
+        :return:
+        """
+        with open(self.copasi_file) as f:
+            original = f.read()
+        model = pycotools.model.Model(self.copasi_file, lazy=True)
+        model.save()
+        with open(self.copasi_file) as f:
+            saved = f.read()
+        for i in model._skipped:
+            self.assertIn(i, original)
+            self.assertIn(i, saved)
+        new = pycotools.model.Model(self.copasi_file)
+        tag = '{http://www.copasi.org/static/schema}MiriamAnnotation'
+        self.assertEqual(len(list(new.xml.iter(tag))),
+                         len(list(self.model.xml.iter(tag))))
+
+    def test_save_to_new_directory(self):
+        """
+        :return:
+        """
+        new_filename = os.path.join(self.model.root, 'SaveDirectory', 'CopasiModel2.cps')
+        self.model.save(new_filename)
+        self.assertTrue(os.path.isfile(new_filename))
+        shutil.rmtree(os.path.dirname(new_filename))
+
     def test_new_model1(self):
         """
         Test building of empty new model
@@ -225,7 +324,7 @@ class ModelComponentAttributeTests(_test_base._BaseTest):
                                           key=k,
                                           name='k1',
                                           reaction_name='v1')
-        self.assertTrue('global_name' in L.__dict__.keys())
+        self.assertTrue(hasattr(L, 'global_name'))
 
     def test_functions(self):
         self.assertTrue(len(self.model.functions), 2)
@@ -305,6 +404,123 @@ class SetTests(_test_base._BaseTest):
         self.assertListEqual([float(i) for i in state_numbers],
                              [float(i) for i in self.model.states.values()])
 
+    def test_change_states_updates_components(self):
+        """
+        Components read before the states change
+        should not be left stale
+        :return:
+        """
+        self.model.metabolites
+        state_numbers = [0.0, 1, 2, 3, 3, 4, 5, 6, 7]
+        self.model.states = state_numbers
+        metab = self.model.get('metabolite', 'Metabolite_1', by='key')
+        self.assertEqual(float(metab.particle_numbers), 1.0)
+
+    def test_change_states_saved(self):
+        """
+        States are written to the xml when the model is saved
+        :return:
+        """
+        state_numbers = [0.0, 1, 2, 3, 3, 4, 5, 6, 7]
+        self.model.states = state_numbers
+        self.model.save()
+        model = pycotools.model.Model(self.copasi_file)
+        self.assertListEqual([float(i) for i in state_numbers],
+                             list(model.states.values()))
+
+    def test_get_states(self):
+        """
+        States by key, list of keys and slice
+        :return:
+        """
+        values = self.model.states.values()
+        keys = self.model.states.keys()
+        self.assertEqual(self.model.states[keys[1]], values[1])
+        self.assertListEqual(list(self.model.states[[keys[2], keys[0]]]),
+                             [values[2], values[0]])
+        self.assertListEqual(list(self.model.states[1:3]), values[1:3])
+
+    def test_set_states_by_keys(self):
+        """
+        :return:
+        """
+        self.model.metabolites
+        self.model.states[['Metabolite_1', 'Compartment_1']] = [6.022140857e+20 * 2, 2]
+        self.assertAlmostEqual(self.model.get('compartment', 'nuc').initial_value, 2)
+        self.assertAlmostEqual(float(self.model.get('metabolite', 'A').concentration), 1)
+
+    def test_set_states_by_slice_saved(self):
+        """
+        :return:
+        """
+        self.model.states[0:3] = 7
+        self.model.save()
+        model = pycotools.model.Model(self.copasi_file)
+        self.assertListEqual(list(model.states.array[:3]), [7.0, 7.0, 7.0])
+
+    def test_set_single_state(self):
+        """
+        Changing one state only updates the components which
+        depend on it and keeps their order
+        :return:
+        """
+        names = [i.name for i in self.model.metabolites]
+        self.model._set_state('Metabolite_1', 6.022140857e+20 * 2)
+        self.assertEqual([i.name for i in self.model.metabolites], names)
+        self.assertAlmostEqual(float(self.model.get('metabolite', 'A').concentration), 2)
+        self.assertAlmostEqual(float(self.model.parameters['A']), 2)
+
+    def test_set_compartment_state(self):
+        """
+        Metabolite concentrations depend on the compartment volume
+        :return:
+        """
+        self.model.metabolites
+        self.model._set_state('Compartment_1', 2)
+        self.assertEqual(self.model.get('compartment', 'nuc').initial_value, 2)
+        self.assertAlmostEqual(float(self.model.get('metabolite', 'A').concentration), 0.5)
+
+    def test_remove_state(self):
+        keys = self.model.states.keys()
+        self.model.remove_state(keys[2])
+        template = [i.attrib['objectReference'] for i in self.model.sections['StateTemplate']]
+        self.assertEqual(template, keys[:2] + keys[3:])
+        self.assertEqual(self.model.states.keys(), template)
+
+    def test_remove_state_with_comment_in_template(self):
+        keys = self.model.states.keys()
+        self.model.sections['StateTemplate'].insert(0, etree.Comment('comment'))
+        self.model.remove_state(keys[2])
+        template = [i.get('objectReference') for i in self.model.sections['StateTemplate']
+                    if i.tag is not etree.Comment]
+        self.assertEqual(template, keys[:2] + keys[3:])
+
+    def test_add_existing_state(self):
+        n = len(self.model.sections['StateTemplate'])
+        self.model.add_state('Metabolite_1', 5)
+        self.assertEqual(len(self.model.sections['StateTemplate']), n)
+        self.assertEqual(self.model.states['Metabolite_1'], 5)
+
+    def test_multiple_initial_states(self):
+        """
+        States are read from the first InitialState
+        and any others are dropped when writing
+        :return:
+        """
+        values = self.model.states.values()
+        initial_state = self.model.sections['InitialState']
+        stale = etree.Element(initial_state.tag)
+        stale.text = ' '.join(['1'] * len(values))
+        initial_state.addnext(stale)
+        self.model.save()
+        model = pycotools.model.Model(self.copasi_file)
+        self.assertListEqual(model.states.values(), values)
+        model.remove_state('Metabolite_1')
+        model.save()
+        model = pycotools.model.Model(self.copasi_file)
+        self.assertEqual(len(model.sections['Model'].findall(initial_state.tag)), 1)
+        self.assertListEqual(model.states.values(), values[:1] + values[2:])
+
     def test_set_global_initial_value(self):
         """
 
@@ -431,6 +647,61 @@ class SetTests(_test_base._BaseTest):
         glob = self.model.get('global_quantity', 'IveBeenChanged')
         self.assertEqual(glob.name, 'IveBeenChanged')
 
+    def test_set_in_place_keeps_order(self):
+        """
+        Components changed in place are not moved
+        to the end of the model
+        :return:
+        """
+        self.model = self.model.set('metabolite', 'A', 'Ay')
+        self.model = self.model.set('metabolite', 'B', 5, change_field='concentration')
+        self.assertEqual([i.name for i in self.model.metabolites], ['Ay', 'B', 'C'])
+        self.assertEqual(self.model.states.keys(), pycotools.model.Model(self.copasi_file).states.keys())
+
+    def test_set_name_saved(self):
+        """
+        The name is changed in the existing element
+        :return:
+        """
+        n = len(self.model.sections['ListOfModelValues'])
+        self.model.set('global_quantity', 'A2B', 'G')
+        self.model.save()
+        model = pycotools.model.Model(self.copasi_file)
+        self.assertEqual([i.name for i in model.global_quantities], ['G', 'B2C', 'ThisIsAssignment'])
+        self.assertEqual(len(model.sections['ListOfModelValues']), n)
+
+    def test_set_compartment_name_updates_metabolites(self):
+        self.model.metabolites
+        self.model.set('compartment', 'nuc', 'nucleus')
+        self.assertEqual(self.model.get('metabolite', 'A').compartment.name, 'nucleus')
+
+    def test_set_existing_name(self):
+        with self.assertRaises(pycotools.errors.AlreadyExistsError):
+            self.model.set('compartment', 'nuc', 'cyt')
+
+    def test_set_local_parameter_value(self):
+        self.model.set('local_parameter', '(B2C).k2', 0.5, match_field='global_name', change_field='value')
+        self.assertEqual(float(self.model.get('local_parameter', '(B2C).k2', by='global_name').value), 0.5)
+        self.assertAlmostEqual(float(self.model.parameters['(B2C).k2']), 0.5)
+
+    def test_set_dict(self):
+        self.model.set('metabolite', {'A': 2, 'C': 3}, change_field='concentration')
+        self.assertAlmostEqual(float(self.model.get('metabolite', 'A').concentration), 2)
+        self.assertAlmostEqual(float(self.model.get('metabolite', 'C').concentration), 3)
+
+    def test_set_values(self):
+        self.model.set_values({'A': 2, 'A2B': 5, '(C2A).k1': 0.5, 'cyt': 4})
+        self.model.save()
+        model = pycotools.model.Model(self.copasi_file)
+        self.assertAlmostEqual(float(model.parameters['A']), 2)
+        self.assertAlmostEqual(float(model.parameters['A2B']), 5)
+        self.assertAlmostEqual(float(model.parameters['(C2A).k1']), 0.5)
+        self.assertAlmostEqual(model.get('compartment', 'cyt').initial_value, 4)
+
+    def test_set_values_not_in_model(self):
+        with self.assertRaises(pycotools.errors.InputError):
+            self.model.set_values({'NotInModel': 1})
+
             # def test_change_reaction_name(self):
     #     """
     #     At present this test fails.
@@ -505,6 +776,36 @@ class GetTests(_test_base._BaseTest):
         names = ['k1', 'k2']
         self.assertListEqual(names, [i.name for i in r.parameters])
 
+    def test_get_by_unindexed_attribute(self):
+        """
+        Attributes not held in the component index fall back
+        to a linear search
+        :return:
+        """
+        res = self.model.get('metabolite', 'reactions', by='simulation_type')
+        self.assertIn('A', [i.name for i in res])
+
+    def test_index_updated_on_add(self):
+        """
+        A newly added metabolite should be retrievable without
+        a refresh
+        :return:
+        """
+        metab = pycotools.model.Metabolite(self.model, name='NewMetab',
+                                           concentration=5,
+                                           compartment=self.model.get('compartment', 'nuc'))
+        self.model.add_metabolite(metab)
+        res = self.model.get('metabolite', 'NewMetab')
+        self.assertEqual(res.name, 'NewMetab')
+
+    def test_index_updated_on_remove(self):
+        """
+        A removed metabolite should no longer be retrievable
+        :return:
+        """
+        self.model.remove_metabolite('A', by='name')
+        self.assertEqual(self.model.get('metabolite', 'A'), [])
+
 
 class RemoveTests(_test_base._BaseTest):
     """
@@ -1125,6 +1426,715 @@ class InsertParameterTests(_test_base._BaseTest):
         conc = [i.concentration for i in self.model.metabolites if i.name == 'B']
         self.assertAlmostEqual(float(conc[0]), float(35))
 
+    def test_insert_parameters_local_value(self):
+        """
+        The new value is in both the reaction and
+        the parameter set
+        :return:
+        """
+        self.model = pycotools.model.InsertParameters(
+            self.model, parameter_dict={'(B2C).k2': 64}).model
+        loc = [i for i in self.model.local_parameters if i.global_name == '(B2C).k2'][0]
+        self.assertAlmostEqual(float(loc.value), float(64))
+        self.model.save()
+        mod = pycotools.model.Model(self.copasi_file)
+        loc = [i for i in mod.local_parameters if i.global_name == '(B2C).k2'][0]
+        self.assertAlmostEqual(float(loc.value), float(64))
+
+    def test_insert_parameters_compartment_and_metabolite(self):
+        """
+        Concentrations are inserted with the new
+        volume of their compartment
+        :return:
+        """
+        self.model = pycotools.model.InsertParameters(
+            self.model, parameter_dict={'nuc': 2, 'B': 35}).model
+        metab = self.model.get('metabolite', 'B')
+        self.assertAlmostEqual(self.model.get('compartment', 'nuc').initial_value, 2)
+        self.assertAlmostEqual(float(metab.concentration), float(35))
+
+    def test_insert_parameters_df_index(self):
+        """
+
+        :return:
+        """
+        df = pandas.DataFrame({'B': [35, 36],
+                               'A2B': [597, 598]})
+        self.model = pycotools.model.InsertParameters(self.model, df=df, index=1).model
+        val = self.model.get('global_quantity', 'A2B').initial_value
+        self.assertAlmostEqual(float(val), float(598))
+
+    def test_insert_parameters_to_models(self):
+        """
+
+        :return:
+        """
+        df = pandas.DataFrame({'B': [35, 36],
+                               'A2B': [597, 598]})
+        models = pycotools.model.InsertParameters(self.model, df=df).to_models()
+        self.assertEqual(len(models), 2)
+        self.assertAlmostEqual(float(models[1].get('metabolite', 'B').concentration), float(36))
+        self.assertNotEqual(models[0].copasi_file, models[1].copasi_file)
+
+    def test_insert_parameters_to_files(self):
+        """
+
+        :return:
+        """
+        df = pandas.DataFrame({'B': [35, 36],
+                               'A2B': [597, 598]})
+        filenames = [os.path.join(os.path.dirname(self.copasi_file), 'variant{}.cps'.format(i))
+                     for i in range(2)]
+        I = pycotools.model.InsertParameters(self.model, df=df)
+        I.to_files(filenames)
+        mod = pycotools.model.Model(filenames[1])
+        self.assertAlmostEqual(float(mod.get('global_quantity', 'A2B').initial_value), float(598))
+
+
+class FitItemTests(_test_base._BaseTest):
+    """
+    Test the fit items of a model configured for
+    parameter estimation
+    """
+    def setUp(self):
+        super(FitItemTests, self).setUp()
+        df = pandas.DataFrame({'Time': range(10)})
+        for i in self.model.metabolites:
+            df[i.name] = range(10)
+        experiment_file = os.path.join(self.model.root, 'experiment_data.txt')
+        df.to_csv(experiment_file, sep='\t', index=False)
+        self.PE = pycotools.tasks.ParameterEstimation(self.model, experiment_file,
+                                                      report_name='PE_report_name.csv')
+        self.PE.write_config_file()
+        self.PE.setup()
+        self.model = self.PE.model
+
+    def test_fit_items(self):
+        fit_items = self.model.fit_items
+        self.assertListEqual(list(fit_items.index), self.model.fit_item_order)
+        self.assertListEqual(list(fit_items.columns),
+                             ['type', 'lower_bound', 'upper_bound', 'start_value', 'cn'])
+
+    def test_fit_item_types(self):
+        fit_items = self.model.fit_items
+        self.assertEqual(fit_items.loc['A', 'type'], 'metabolite')
+        self.assertEqual(fit_items.loc['(ADeg).k1', 'type'], 'local_parameter')
+        self.assertEqual(fit_items.loc['A', 'lower_bound'], 1e-6)
+        self.assertEqual(fit_items.loc['A', 'upper_bound'], 1e6)
+
+    def test_fit_items_cached(self):
+        self.model.fit_items
+        cached = self.model._fit_items[1]
+        self.model.fit_item_order
+        self.assertIs(self.model._fit_items[1], cached)
+
+    def test_fit_items_read_again_when_removed(self):
+        order = self.model.fit_item_order
+        self.model = self.PE.remove_fit_item(order[0])
+        self.assertListEqual(self.model.fit_item_order, order[1:])
+
+    def test_remove_all_fit_items(self):
+        self.model = self.PE.remove_all_fit_items()
+        self.assertListEqual(self.model.fit_item_order, [])
+        self.assertTrue(self.model.fit_items.empty)
+
+    def test_copy_reads_shared_xml(self):
+        new = self.model.copy(os.path.join(self.model.root, 'CopasiModel2.cps'))
+        self.assertListEqual(new.fit_item_order, self.model.fit_item_order)
+        self.assertIsNone(new._xml)
+
+
+class KeyAllocatorTests(_test_base._BaseTest):
+    """
+    Test generating keys with the KeyAllocator of a model
+    """
+    def setUp(self):
+        super(KeyAllocatorTests, self).setUp()
+
+    def test_allocate_from_largest_suffix(self):
+        keys = pycotools.model.KeyAllocator()
+        keys.use('Metabolite_4').use('Metabolite_1')
+        self.assertEqual(keys.allocate('Metabolite', 2), ['Metabolite_5', 'Metabolite_6'])
+        self.assertIn('Metabolite_6', keys)
+
+    def test_keys_not_in_model(self):
+        for type, component in [('metabolite', 'metabolites'),
+                                ('compartment', 'compartments'),
+                                ('global_quantity', 'global_quantities'),
+                                ('reaction', 'reactions'),
+                                ('constant', 'constants'),
+                                ('function', 'functions'),
+                                ('function_parameter', 'parameter_descriptions')]:
+            keys = pycotools.model.KeyFactory(self.model, type=type).generate(5)
+            existing = [i.key for i in getattr(self.model, component)]
+            self.assertEqual(len(set(keys)), 5)
+            for i in keys:
+                self.assertNotIn(i, existing)
+
+    def test_keys_not_generated_twice(self):
+        first = pycotools.model.KeyFactory(self.model, type='metabolite').generate()
+        second = pycotools.model.KeyFactory(self.model, type='metabolite').generate()
+        self.assertNotEqual(first, second)
+
+    def test_global_quantity_prefix(self):
+        key = pycotools.model.KeyFactory(self.model, type='global_quantity').generate()
+        self.assertTrue(key.startswith('ModelValue_'))
+
+    def test_added_key_not_generated(self):
+        self.model.add('metabolite', name='X', key='Metabolite_500')
+        key = pycotools.model.KeyFactory(self.model, type='metabolite').generate()
+        self.assertEqual(key, 'Metabolite_501')
+
+    def test_keys_after_snapshot(self):
+        self.model.to_snapshot()
+        mod = pycotools.model.Model.from_snapshot(self.copasi_file)
+        keys = pycotools.model.KeyFactory(mod, type='metabolite').generate(3)
+        existing = [i.key for i in mod.metabolites]
+        for i in keys:
+            self.assertNotIn(i, existing)
+
+    def test_many_keys(self):
+        n = 100000
+        keys = pycotools.model.KeyFactory(self.model, type='constant').generate(n)
+        self.assertEqual(len(set(keys)), n)
+
+
+class AddManyTests(_test_base._BaseTest):
+    """
+    Test adding and removing components in batches
+    """
+    def setUp(self):
+        super(AddManyTests, self).setUp()
+        self.names = ['X{}'.format(i) for i in range(20)]
+
+    def test_add_metabolites(self):
+        self.model.add_many('metabolite', self.names)
+        names = [i.name for i in self.model.metabolites]
+        for i in self.names:
+            self.assertIn(i, names)
+
+    def test_keys_unique(self):
+        self.model.add_many('metabolite', self.names)
+        keys = [i.key for i in self.model.metabolites]
+        self.assertEqual(len(keys), len(set(keys)))
+
+    def test_states_added(self):
+        n = len(self.model.states)
+        self.model.add_many('metabolite', self.names)
+        self.assertEqual(len(self.model.states), n + len(self.names))
+        for i in self.names:
+            self.assertIn(self.model.get('metabolite', i, by='name').key, self.model.states)
+
+    def test_same_as_add(self):
+        self.model.add_many('metabolite', [{'name': 'X', 'concentration': 5}])
+        self.model.add('metabolite', name='Y', concentration=5)
+        self.model.save()
+        mod = pycotools.model.Model(self.copasi_file)
+        X = mod.get('metabolite', 'X', by='name')
+        Y = mod.get('metabolite', 'Y', by='name')
+        self.assertEqual(float(X.concentration), float(Y.concentration))
+        self.assertEqual(X.compartment.name, Y.compartment.name)
+
+    def test_prebuilt_components_given_new_keys(self):
+        ## built against the same model so they all have the same key
+        gqs = [pycotools.model.GlobalQuantity(self.model, name=i, initial_value=3)
+               for i in self.names]
+        self.model.add_many('global_quantity', gqs)
+        keys = [i.key for i in self.model.global_quantities]
+        self.assertEqual(len(keys), len(set(keys)))
+        self.assertEqual(len(keys), len(self.names) + 3)
+
+    def test_existing_names_skipped(self):
+        self.model.add_many('compartment', ['nuc', 'new', 'new'])
+        self.assertListEqual(sorted([i.name for i in self.model.compartments]),
+                             ['cyt', 'new', 'nuc'])
+
+    def test_add_reactions(self):
+        reactions = [{'name': 'R{}'.format(i), 'expression': 'A -> B', 'rate_law': 'k1*A'}
+                     for i in range(5)]
+        mod = self.model.add_many('reaction', reactions)
+        names = [i.name for i in mod.reactions]
+        for i in reactions:
+            self.assertIn(i['name'], names)
+        self.assertIn('(R4).k1', [i.global_name for i in mod.local_parameters])
+
+    def test_add_existing_reaction(self):
+        with self.assertRaises(pycotools.errors.ReactionAlreadyExists):
+            self.model.add_many('reaction', [{'name': 'A2B', 'expression': 'A -> B',
+                                              'rate_law': 'k1*A'}])
+
+    def test_remove_metabolites(self):
+        self.model.add_many('metabolite', self.names)
+        n = len(self.model.states)
+        self.model.remove_many('metabolite', self.names)
+        names = [i.name for i in self.model.metabolites]
+        for i in self.names:
+            self.assertNotIn(i, names)
+        self.assertEqual(len(self.model.states), n - len(self.names))
+        self.model.save()
+        self.assertListEqual(sorted([i.name for i in pycotools.model.Model(self.copasi_file).metabolites]),
+                             ['A', 'B', 'C'])
+
+    def test_remove_with_comment_in_state_template(self):
+        self.model.add_many('metabolite', self.names)
+        state_template, initial_state = self.model._state_elements()
+        state_template.insert(0, etree.Comment('state template'))
+        self.model.remove_many('metabolite', self.names)
+        names = [i.name for i in self.model.metabolites]
+        for i in self.names:
+            self.assertNotIn(i, names)
+
+    def test_remove_missing(self):
+        with self.assertRaises(pycotools.errors.ComponentDoesNotExistError):
+            self.model.remove_many('metabolite', ['A', 'NotAMetabolite'])
+        self.assertIn('A', [i.name for i in self.model.metabolites])
+
+    def test_remove_reactions(self):
+        self.model.remove_many('reaction', ['A2B', 'B2C'])
+        self.assertNotIn('A2B', [i.name for i in self.model.reactions])
+        self.assertNotIn('B2C', [i.name for i in self.model.reactions])
+
+
+class QuantityTests(_test_base._BaseTest):
+    """
+    Test the table of model quantities
+    """
+    def setUp(self):
+        super(QuantityTests, self).setUp()
+
+    def test_columns(self):
+        self.assertListEqual(list(self.model.quantities.columns),
+                             ['name', 'type', 'key', 'compartment',
+                              'value', 'simulation_type', 'cn'])
+
+    def test_one_row_per_quantity(self):
+        counts = self.model.quantities['type'].value_counts()
+        self.assertEqual(counts['metabolite'], len(self.model.metabolites))
+        self.assertEqual(counts['global_quantity'], len(self.model.global_quantities))
+        self.assertEqual(counts['local_parameter'], len(self.model.local_parameters))
+        self.assertEqual(counts['compartment'], len(self.model.compartments))
+
+    def test_names(self):
+        self.assertListEqual(list(self.model.quantities['name']),
+                             self.model.all_variable_names)
+
+    def test_metabolite(self):
+        q = self.model.quantities.set_index('name')
+        A = self.model.get('metabolite', 'A', by='name')
+        self.assertEqual(q.loc['A', 'key'], A.key)
+        self.assertEqual(q.loc['A', 'compartment'], A.compartment.name)
+        self.assertEqual(q.loc['A', 'value'], float(A.concentration))
+        self.assertEqual(q.loc['A', 'cn'], 'CN=Root,Model=New Model,Vector=Compartments[nuc],'
+                                           'Vector=Metabolites[A],Reference=InitialConcentration')
+
+    def test_local_parameter(self):
+        q = self.model.quantities.set_index('name')
+        self.assertEqual(q.loc['(B2C).k2', 'cn'], 'CN=Root,Model=New Model,Vector=Reactions[B2C],'
+                                                  'ParameterGroup=Parameters,Parameter=k2,Reference=Value')
+
+    def test_particle_numbers(self):
+        model = pycotools.model.Model(self.copasi_file, quantity_type='particle_numbers')
+        q = model.quantities.set_index('name')
+        self.assertEqual(q.loc['A', 'value'],
+                         float(model.get('metabolite', 'A', by='name').particle_numbers))
+
+    def test_table_kept(self):
+        self.assertIs(self.model._quantity_table(), self.model._quantity_table())
+
+    def test_table_is_not_shared(self):
+        q = self.model.quantities
+        q['value'] = 0
+        self.assertNotEqual(self.model.quantities['value'].sum(), 0)
+
+    def test_set_updates_table(self):
+        self.model.set('global_quantity', 'B2C', 20, match_field='name', change_field='initial_value')
+        q = self.model.quantities.set_index('name')
+        self.assertEqual(q.loc['B2C', 'value'], 20)
+
+    def test_add_updates_table(self):
+        self.model.add('metabolite', name='D', concentration=5)
+        self.assertIn('D', list(self.model.quantities['name']))
+
+    def test_remove_updates_table(self):
+        self.model.remove('metabolite', 'A')
+        self.assertNotIn('A', list(self.model.quantities['name']))
+
+    def test_insert_parameters_updates_table(self):
+        self.model.insert_parameters(parameter_dict={'B2C': 15, 'A': 3, '(B2C).k2': 2})
+        q = self.model.quantities.set_index('name')
+        self.assertAlmostEqual(q.loc['B2C', 'value'], 15)
+        self.assertAlmostEqual(q.loc['A', 'value'], 3)
+        self.assertAlmostEqual(q.loc['(B2C).k2', 'value'], 2)
+
+    def test_parameters(self):
+        q = self.model.quantities
+        q = q[q['type'] != 'compartment'].set_index('name')['value']
+        parameters = self.model.parameters
+        self.assertListEqual(sorted(parameters.columns), sorted(q.index))
+        for i in parameters.columns:
+            self.assertEqual(parameters.loc[0, i], q[i])
+
+
+class BulkWriterTests(_test_base._BaseTest):
+    """
+    Test the BulkWriter class
+    """
+    def setUp(self):
+        super(BulkWriterTests, self).setUp()
+        self.df = pandas.DataFrame({'A': [2, 3],
+                                    'nuc': [4, 5],
+                                    'A2B': [6, 7],
+                                    '(B2C).k2': [8, 9],
+                                    'Elementary Flux Modes': ['report0.txt', 'report1.txt'],
+                                    'RSS': [10, 11]})
+        self.filenames = [os.path.join(os.path.dirname(self.copasi_file), 'variant{}.cps'.format(i))
+                          for i in range(2)]
+        self.BW = pycotools.model.BulkWriter(self.model, self.df, self.filenames)
+
+    def test_write(self):
+        self.BW.write()
+        for i in self.filenames:
+            self.assertTrue(os.path.isfile(i))
+
+    def test_metabolite(self):
+        self.BW.write()
+        mod = pycotools.model.Model(self.filenames[1])
+        self.assertAlmostEqual(mod.get('metabolite', 'A').concentration, 3)
+
+    def test_compartment(self):
+        self.BW.write()
+        mod = pycotools.model.Model(self.filenames[1])
+        self.assertAlmostEqual(mod.get('compartment', 'nuc').initial_value, 5)
+
+    def test_global_quantity(self):
+        self.BW.write()
+        mod = pycotools.model.Model(self.filenames[1])
+        self.assertAlmostEqual(float(mod.get('global_quantity', 'A2B').initial_value), 7)
+
+    def test_local_parameter(self):
+        self.BW.write()
+        mod = pycotools.model.Model(self.filenames[1])
+        loc = [i for i in mod.local_parameters if i.global_name == '(B2C).k2'][0]
+        self.assertAlmostEqual(float(loc.value), 9)
+        values = [i.attrib['value'] for i in mod.xml.iter('{http://www.copasi.org/static/schema}Constant')
+                  if i.attrib['name'] == 'k2']
+        self.assertEqual(values, ['9.0'])
+
+    def test_report(self):
+        self.BW.write()
+        mod = pycotools.model.Model(self.filenames[0])
+        targets = [i.attrib['target'] for i in mod.xml.xpath('//*[@target]')
+                   if i.attrib['target'] != '']
+        self.assertEqual(targets, ['report0.txt'])
+
+    def test_base_model_unchanged(self):
+        self.BW.write()
+        self.assertAlmostEqual(self.model.get('metabolite', 'A').concentration, 1)
+
+    def test_to_model(self):
+        mod = self.BW.to_model(1)
+        self.assertEqual(mod.copasi_file, self.filenames[1])
+        self.assertAlmostEqual(mod.get('metabolite', 'A').concentration, 3)
+
+    def test_same_as_save(self):
+        """
+        Without any columns to fill in the variant
+        is the same as saving the model
+        :return:
+        """
+        BW = pycotools.model.BulkWriter(self.model, self.df[['RSS']], self.filenames)
+        BW.write()
+        self.model.save()
+        with open(self.filenames[0]) as f:
+            variant = f.read()
+        with open(self.copasi_file) as f:
+            self.assertEqual(variant, f.read())
+
+    def test_wrong_number_of_filenames(self):
+        with self.assertRaises(pycotools.errors.InputError):
+            pycotools.model.BulkWriter(self.model, self.df, self.filenames[:1])
+
+
+class ConcurrentSetupTests(_test_base._BaseTest):
+    def setUp(self):
+        super(ConcurrentSetupTests, self).setUp()
+        self.dirs = [os.path.join(os.path.dirname(self.copasi_file), 'concurrent{}'.format(i))
+                     for i in range(8)]
+        self.files = []
+        for d in self.dirs:
+            if not os.path.isdir(d):
+                os.makedirs(d)
+            fle = os.path.join(d, 'test_model.cps')
+            shutil.copy(self.copasi_file, fle)
+            self.files.append(fle)
+
+    def tearDown(self):
+        super(ConcurrentSetupTests, self).tearDown()
+        for d in self.dirs:
+            if os.path.isdir(d):
+                shutil.rmtree(d)
+
+    def setup_model(self, i):
+        """
+        Read, change and save the i'th model
+        :param i:
+            `int`. Index into self.files
+        :return:
+            None
+        """
+        mod = pycotools.model.Model(self.files[i])
+        mod.set('global_quantity', 'B2C', i, match_field='name', change_field='initial_value')
+        mod.save()
+
+    def test_copasi_file_is_absolute(self):
+        cwd = os.getcwd()
+        try:
+            os.chdir(self.dirs[0])
+            mod = pycotools.model.Model('test_model.cps')
+        finally:
+            os.chdir(cwd)
+        self.assertEqual(mod.copasi_file, self.files[0])
+        self.assertEqual(mod.root, self.dirs[0])
+
+    def test_relative_experiment_file(self):
+        """
+        Relative experiment files are found next to the
+        model whatever the working directory is
+        """
+        experiment_file = os.path.join(self.dirs[0], 'experiment.txt')
+        with open(experiment_file, 'w') as f:
+            f.write('Time\tA\tB\n0\t1\t2\n1\t2\t3\n')
+        cwd = os.getcwd()
+        try:
+            os.chdir(self.dirs[1])
+            mod = pycotools.model.Model(self.files[0])
+            EM = pycotools.tasks.ExperimentMapper(mod, 'experiment.txt')
+        finally:
+            os.chdir(cwd)
+        self.assertListEqual(EM.experiment_files, [experiment_file])
+        ## files next to the model are stored by name
+        file_names = [i.attrib['value'] for i in pycotools.xpaths.FILE_NAMES(EM.model.xml)]
+        self.assertIn('experiment.txt', file_names)
+
+    def test_working_directory_unchanged(self):
+        cwd = os.getcwd()
+        pycotools.model.Model(self.files[0])
+        self.assertEqual(os.getcwd(), cwd)
+
+    def test_setup_from_threads(self):
+        cwd = os.getcwd()
+        errors = []
+
+        def target(i):
+            try:
+                self.setup_model(i)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=target, args=(i,))
+                   for i in range(len(self.files))]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(os.getcwd(), cwd)
+        values = [float(pycotools.model.Model(f).get('global_quantity', 'B2C', by='name').initial_value)
+                  for f in self.files]
+        self.assertListEqual(values, [float(i) for i in range(len(self.files))])
+
+
+class SnapshotTests(_test_base._BaseTest):
+    """
+    Test writing and loading model snapshots
+    """
+    def setUp(self):
+        super(SnapshotTests, self).setUp()
+        self.snapshot = self.copasi_file[:-4] + '.snapshot'
+
+    def tearDown(self):
+        super(SnapshotTests, self).tearDown()
+        if os.path.isfile(self.snapshot):
+            os.remove(self.snapshot)
+
+    def test_snapshot_written(self):
+        self.assertEqual(self.model.to_snapshot(), self.snapshot)
+        self.assertTrue(os.path.isfile(self.snapshot))
+
+    def test_components_equal(self):
+        self.model.to_snapshot()
+        new = pycotools.model.Model.from_snapshot(self.copasi_file)
+        for prop in self.model._component_properties().values():
+            self.assertListEqual([str(i) for i in getattr(new, prop)],
+                                 [str(i) for i in getattr(self.model, prop)])
+        self.assertListEqual(list(new.states.items()), list(self.model.states.items()))
+
+    def test_loaded_without_reading_components(self):
+        self.model.to_snapshot()
+        new = pycotools.model.Model.from_snapshot(self.copasi_file)
+        for component in self.model._model_components():
+            self.assertIn(component, new._component_index)
+        self.assertIs(new.metabolites[0].model, new)
+
+    def test_xml_equal(self):
+        self.model.to_snapshot()
+        new = pycotools.model.Model.from_snapshot(self.copasi_file)
+        self.assertEqual(etree.tostring(new.xml), etree.tostring(self.model.xml))
+
+    def test_loaded_model_can_be_changed(self):
+        self.model.to_snapshot()
+        new = pycotools.model.Model.from_snapshot(self.copasi_file)
+        new.set('global_quantity', 'B2C', 9, match_field='name', change_field='initial_value')
+        new.save()
+        self.assertEqual(float(pycotools.model.Model(self.copasi_file).get(
+            'global_quantity', 'B2C', by='name').initial_value), 9)
+
+    def test_unsaved_changes_not_lost(self):
+        self.model.set('global_quantity', 'B2C', 99, match_field='name', change_field='initial_value')
+        self.model.to_snapshot()
+        new = pycotools.model.Model.from_snapshot(self.copasi_file)
+        on_disk = pycotools.model.Model(self.copasi_file)
+        self.assertEqual(float(on_disk.get('global_quantity', 'B2C', by='name').initial_value), 99)
+        self.assertEqual(float(new.get('global_quantity', 'B2C', by='name').initial_value), 99)
+
+    def test_xml_parsed_when_used(self):
+        self.model.to_snapshot()
+        new = pycotools.model.Model.from_snapshot(self.copasi_file)
+        new.metabolites
+        self.assertIsNone(new._xml)
+        self.assertIsNone(new.__dict__.get('_shared_xml'))
+        self.assertEqual(etree.tostring(new.xml), etree.tostring(self.model.xml))
+
+    def test_copy_of_loaded_model(self):
+        self.model.to_snapshot()
+        new = pycotools.model.Model.from_snapshot(self.copasi_file)
+        copy = deepcopy(new)
+        self.assertEqual(etree.tostring(copy.xml), etree.tostring(self.model.xml))
+
+    def test_missing_snapshot_written(self):
+        self.assertFalse(os.path.isfile(self.snapshot))
+        pycotools.model.Model.from_snapshot(self.copasi_file)
+        self.assertTrue(os.path.isfile(self.snapshot))
+
+    def test_stale_snapshot_not_used(self):
+        self.model.to_snapshot()
+        self.model.set('global_quantity', 'B2C', 9, match_field='name', change_field='initial_value')
+        self.model.save()
+        new = pycotools.model.Model.from_snapshot(self.copasi_file)
+        self.assertEqual(float(new.get('global_quantity', 'B2C', by='name').initial_value), 9)
+
+    def test_other_quantity_type_not_used(self):
+        self.model.to_snapshot()
+        new = pycotools.model.Model.from_snapshot(self.copasi_file, quantity_type='particle_numbers')
+        self.assertEqual(new.quantity_type, 'particle_numbers')
+
+    def test_lazy(self):
+        mod = pycotools.model.Model(self.copasi_file, lazy=True)
+        mod.to_snapshot()
+        new = pycotools.model.Model.from_snapshot(self.copasi_file, lazy=True)
+        self.assertEqual(new._serialize(new.xml), mod._serialize(mod.xml))
+
+
+class PatchTests(_test_base._BaseTest):
+    """
+    Test diffing models and applying the patches
+    """
+    def setUp(self):
+        super(PatchTests, self).setUp()
+        self.variant_file = self.copasi_file[:-4] + '_variant.cps'
+        self.patch_file = self.copasi_file[:-4] + '.patch'
+
+    def tearDown(self):
+        super(PatchTests, self).tearDown()
+        for i in [self.variant_file, self.patch_file]:
+            if os.path.isfile(i):
+                os.remove(i)
+
+    def variant(self, change):
+        """
+        :param change:
+            callable. Changes a copy of the model
+
+        :return:
+            :py:class:`model.Model`. The changed copy, saved and read again
+        """
+        mod = self.model.copy(self.variant_file)
+        mod = change(mod) or mod
+        mod.save()
+        return pycotools.model.Model(self.variant_file)
+
+    def assertApplies(self, variant):
+        patch = self.model.diff(variant)
+        mod = self.model.copy(self.copasi_file).apply(patch)
+        self.assertEqual(etree.tostring(mod.xml), etree.tostring(variant.xml))
+        return patch
+
+    def test_no_changes(self):
+        self.assertEqual(len(self.model.diff(self.model.copy(self.variant_file))), 0)
+
+    def test_states(self):
+        variant = self.variant(lambda m: m.set_values({'A': 2, 'A2B': 5}))
+        patch = self.assertApplies(variant)
+        self.assertEqual(sorted(patch.states.keys()), ['Metabolite_1', 'ModelValue_0'])
+        self.assertEqual(patch.xml, [])
+
+    def test_local_parameters(self):
+        variant = self.variant(lambda m: m.set_values({'(B2C).k2': 0.7}))
+        patch = self.assertApplies(variant)
+        self.assertEqual(patch.values, {'(B2C).k2': 0.7})
+        self.assertEqual(patch.xml, [])
+
+    def test_add_components(self):
+        def change(mod):
+            mod.add('metabolite', name='Z', concentration=4)
+            mod.add('global_quantity', name='G', initial_value=3)
+            return mod.add_reaction(pycotools.model.Reaction(
+                mod, name='newR', expression='A -> Z', rate_law='k*A'))
+        variant = self.variant(change)
+        patch = self.assertApplies(variant)
+        inserted = set(i[2] for i in patch.xml if i[0] == 'insert')
+        for i in ['ListOfMetabolites', 'ListOfModelValues', 'ListOfReactions', 'StateTemplate']:
+            self.assertIn(i, inserted)
+        self.assertNotIn('replace_section', [i[0] for i in patch.xml])
+
+    def test_remove_components(self):
+        def change(mod):
+            mod.remove('reaction', 'ADeg')
+            return mod.remove('global_quantity', 'B2C')
+        self.assertApplies(self.variant(change))
+
+    def test_rename(self):
+        variant = self.variant(lambda m: m.set('compartment', 'nuc', 'nucleus'))
+        patch = self.assertApplies(variant)
+        self.assertEqual([i[0] for i in patch.xml], ['replace'])
+
+    def test_components_read_again(self):
+        self.model.metabolites
+        variant = self.variant(lambda m: m.add('metabolite', name='Z', concentration=4))
+        self.model.apply(self.model.diff(variant))
+        self.assertAlmostEqual(float(self.model.get('metabolite', 'Z').concentration), 4)
+
+    def test_base_unchanged(self):
+        xml = etree.tostring(self.model.xml)
+        variant = self.variant(lambda m: m.set('metabolite', 'A', 'Ay'))
+        self.model.copy(self.variant_file).apply(self.model.diff(variant))
+        self.assertEqual(etree.tostring(self.model.xml), xml)
+
+    def test_save_and_load(self):
+        variant = self.variant(lambda m: m.set_values({'A': 2, '(B2C).k2': 0.7}))
+        patch = self.model.diff(variant)
+        patch.save(self.patch_file)
+        self.assertEqual(pycotools.model.Patch.load(self.patch_file).to_dict(), patch.to_dict())
+        mod = self.model.copy(self.copasi_file).apply(self.patch_file)
+        self.assertEqual(etree.tostring(mod.xml), etree.tostring(variant.xml))
+
+    def test_patch_does_not_apply(self):
+        variant = self.variant(lambda m: m.remove('reaction', 'ADeg'))
+        patch = self.model.diff(variant)
+        mod = self.model.copy(self.copasi_file).apply(patch)
+        with self.assertRaises(pycotools.errors.InputError):
+            mod.apply(patch)
+
 
 class NewModelTests(unittest.TestCase):
     """
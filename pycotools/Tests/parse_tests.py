@@ -24,13 +24,105 @@ Module that tests the operations of the _Base base test
 """
 import site
 site.addsitedir('/home/b3053674/Documents/pycotools')
+import pycotools
 from pycotools import tasks, model, utils, viz
+from pycotools.Tests import _test_base
 import os, glob
 import unittest
 
 
 
 
+class ReportTailerTests(_test_base._BaseTest):
+    """
+    Set up a multi parameter estimation without running it
+    and write rows to its reports as CopasiSE would
+    """
+    def setUp(self):
+        super(ReportTailerTests, self).setUp()
+        experiment_file = os.path.join(os.path.dirname(self.copasi_file), 'experiment.txt')
+        with open(experiment_file, 'w') as f:
+            f.write('Time\tA\tB\n0\t1\t2\n1\t2\t3\n')
+        self.MPE = tasks.MultiParameterEstimation(
+            self.model, experiment_file, copy_number=2, pe_number=3,
+            run_mode=False, method='genetic_algorithm',
+            population_size=5, number_of_generations=5
+        )
+        self.MPE.write_config_file()
+        self.MPE.setup()
+        self.reports = self.MPE.enumerate_PE_output()
+        self.n = len(self.MPE.model.fit_item_order)
+
+    def write(self, copy_number, text):
+        with open(self.reports[copy_number], 'a') as f:
+            f.write(text)
+
+    def row(self, value, rss):
+        return '(\t{}\t)\t{}\n'.format('\t'.join([str(value)] * self.n), rss)
+
+    def test_reads_appended_rows(self):
+        tailer = viz.ReportTailer(self.MPE)
+        self.write(0, 'TaskList[Parameter Estimation].Best Parameters\tBest Value\n')
+        self.write(0, self.row(1, 10) + self.row(2, 20))
+        rows = tailer.read()
+        self.assertEqual([i['RSS'] for i in rows], [10, 20])
+        self.assertEqual(list(rows[0].index), self.MPE.model.fit_item_order + ['RSS'])
+        self.assertEqual(tailer.read(), [])
+        self.write(0, self.row(3, 30))
+        self.assertEqual([i['RSS'] for i in tailer.read()], [30])
+
+    def test_partial_line(self):
+        tailer = viz.ReportTailer(self.MPE)
+        row = self.row(1, 10)
+        self.write(1, row[:5])
+        self.assertEqual(tailer.read(), [])
+        self.write(1, row[5:])
+        rows = tailer.read()
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0].name, os.path.abspath(self.reports[1]))
+
+    def test_leaderboard(self):
+        tailer = viz.ReportTailer(self.MPE)
+        self.assertTrue(tailer.leaderboard.empty)
+        self.write(0, self.row(1, 10) + self.row(2, 5))
+        self.write(1, self.row(3, 7))
+        tailer.read()
+        self.assertEqual(list(tailer.leaderboard['RSS']), [5, 7])
+        self.write(1, self.row(4, 1))
+        tailer.read()
+        self.assertEqual(list(tailer.leaderboard['RSS']), [1, 5])
+
+    def test_follow(self):
+        tailer = viz.ReportTailer(self.MPE)
+        self.write(0, self.row(1, 10))
+        reads = []
+
+        def until():
+            ## rows written before until returns True are still read
+            reads.append(None)
+            self.write(1, self.row(2, len(reads)))
+            return len(reads) == 3
+
+        rows = list(tailer.follow(interval=0, until=until))
+        self.assertEqual([i['RSS'] for i in rows], [10, 1, 2, 3])
+
+    def test_folder(self):
+        self.write(0, self.row(1, 10))
+        tailer = viz.ReportTailer(self.MPE.results_directory,
+                                  copasi_file=self.MPE.model.copasi_file)
+        self.assertEqual(len(tailer.read()), 1)
+
+    def test_folder_needs_copasi_file(self):
+        with self.assertRaises(pycotools.errors.InputError):
+            viz.ReportTailer(self.MPE.results_directory)
+
+    def test_wrong_number_of_values(self):
+        tailer = viz.ReportTailer(self.MPE)
+        self.write(0, '(\t1\t)\t10\n')
+        with self.assertRaises(pycotools.errors.SomethingWentHorriblyWrongError):
+            tailer.read()
+
+
 class TestParse(unittest.TestCase):
     def setUp(self):
         self.working_directory = os.path.join(os.path.dirname(__file__), 'viz_tests')
@@ -0,0 +1,131 @@
+#-*-coding: utf-8 -*-
+"""
+
+ This file is part of pycotools.
+
+ pycotools is free software: you can redistribute it and/or modify
+ it under the terms of the GNU Lesser General Public License as published by
+ the Free Software Foundation, either version 3 of the License, or
+ (at your option) any later version.
+
+ pycotools is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ GNU Lesser General Public License for more details.
+
+ You should have received a copy of the GNU Lesser General Public License
+ along with pycotools.  If not, see <http://www.gnu.org/licenses/>.
+
+
+ $Author: Ciaran Welsh
+
+Regression benchmark for reading reactions from large models.
+Synthetic models are built by cloning mass action reactions
+between the metabolites of the test model.
+"""
+
+import pycotools
+from pycotools import xpaths
+from pycotools.Tests import _test_base
+from lxml import etree
+import time
+import unittest
+
+
+def add_reactions(xml, n):
+    """
+    Add n irreversible mass action reactions
+    from A to B to the xml of the test model
+    :param xml:
+        :py:class:`etree._Element`
+    :param n:
+        `int`. Number of reactions to add
+    :return:
+        None
+    """
+    tag = xpaths.tag
+    reactions = xml.find(tag('Model')).find(tag('ListOfReactions'))
+    kinetic_parameters = xml.xpath('//*[@cn="String=Kinetic Parameters"]')[0]
+    model_cn = 'CN=Root,Model=New Model'
+    for i in range(n):
+        name = 'R{}'.format(i)
+        reaction = etree.SubElement(reactions, tag('Reaction'),
+                                    attrib={'key': 'Reaction_{}'.format(i + 100),
+                                            'name': name,
+                                            'reversible': 'false',
+                                            'fast': 'false'})
+        substrates = etree.SubElement(reaction, tag('ListOfSubstrates'))
+        etree.SubElement(substrates, tag('Substrate'),
+                         attrib={'metabolite': 'Metabolite_1', 'stoichiometry': '1'})
+        products = etree.SubElement(reaction, tag('ListOfProducts'))
+        etree.SubElement(products, tag('Product'),
+                         attrib={'metabolite': 'Metabolite_3', 'stoichiometry': '1'})
+        constants = etree.SubElement(reaction, tag('ListOfConstants'))
+        etree.SubElement(constants, tag('Constant'),
+                         attrib={'key': 'Parameter_{}'.format(i + 10000),
+                                 'name': 'k1', 'value': '0.1'})
+        etree.SubElement(reaction, tag('KineticLaw'),
+                         attrib={'function': 'Function_13',
+                                 'unitType': 'Default'})
+
+        group = etree.SubElement(kinetic_parameters, tag('ModelParameterGroup'),
+                                 attrib={'cn': '{},Vector=Reactions[{}]'.format(model_cn, name),
+                                         'type': 'Reaction'})
+        etree.SubElement(group, tag('ModelParameter'),
+                         attrib={'cn': '{},Vector=Reactions[{}],ParameterGroup=Parameters,'
+                                       'Parameter=k1'.format(model_cn, name),
+                                 'value': '0.1',
+                                 'type': 'ReactionParameter',
+                                 'simulationType': 'fixed'})
+
+
+class ReactionScalingTests(_test_base._BaseTest):
+    def setUp(self):
+        super(ReactionScalingTests, self).setUp()
+
+    def synthetic_model(self, n):
+        """
+        :param n:
+            `int`. Number of reactions to add
+        :return:
+            :py:class:`model.Model`. The test model with n more reactions
+        """
+        return self.rewritten_model(lambda xml: add_reactions(xml, n))
+
+    def time_reactions(self, n):
+        """
+        Time reading the reactions of a synthetic model
+        :param n:
+            `int`. Number of synthetic reactions
+        :return:
+            `float`. Seconds
+        """
+        mod = self.synthetic_model(n)
+        start = time.time()
+        reactions = mod.reactions
+        duration = time.time() - start
+        ## 4 reactions are already in the test model
+        self.assertEqual(len(reactions), n + 4)
+        return duration
+
+    def test_reactions_read_correctly(self):
+        mod = self.synthetic_model(10)
+        r = mod.get('reaction', 'R9')
+        self.assertEqual(r.expression, 'A -> B')
+        self.assertEqual(r.parameters[0].key, 'Parameter_10009')
+
+    @_test_base.slow
+    def test_reactions_scale_linearly(self):
+        """
+        Reading 10 times as many reactions should take
+        roughly 10 times longer. A quadratic reader would
+        take roughly 100 times longer.
+        :return:
+        """
+        small = self.time_reactions(1000)
+        large = self.time_reactions(10000)
+        self.assertLess(large / small, 30)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -37,6 +37,8 @@ import glob
 import os
 import shutil 
 import pandas
+import stat
+import tempfile
 from pycotools.Tests import _test_base
 import time
 
@@ -159,6 +161,138 @@ class MultiParameterEstimationTests(_test_base._BaseTest):
 
 
 
+class EarlyStoppingTests(_test_base._BaseTest):
+    """
+    Run a multi parameter estimation with a stub CopasiSE which
+    appends a row to the scan report for each RSS in $STUB_RSS
+    """
+    stub = """#!/bin/sh
+touch "$1.ran"
+report=$(grep -o 'target="[^"]*MultipleParameterEstimationResults[^"]*"' "$1" | sed 's/^target="//;s/"$//')
+for rss in $STUB_RSS; do
+    sleep 0.1
+    printf '(\t{}\t)\t%s\n' "$rss" >> "$report"
+done
+"""
+
+    def setUp(self):
+        super(EarlyStoppingTests, self).setUp()
+        experiment_file = os.path.join(os.path.dirname(self.copasi_file), 'experiment.txt')
+        with open(experiment_file, 'w') as f:
+            f.write('Time\tA\tB\n0\t1\t2\n1\t2\t3\n')
+        self.MPE = pycotools.tasks.MultiParameterEstimation(
+            self.model, experiment_file, copy_number=2, pe_number=10,
+            run_mode=False, method='genetic_algorithm',
+            population_size=5, number_of_generations=5
+        )
+        self.MPE.write_config_file()
+        self.MPE.setup()
+
+        self.bin = tempfile.mkdtemp()
+        copasi_se = os.path.join(self.bin, 'CopasiSE')
+        values = '\\t'.join(['1'] * len(self.MPE.model.fit_item_order))
+        with open(copasi_se, 'w') as f:
+            f.write(self.stub.format(values))
+        os.chmod(copasi_se, os.stat(copasi_se).st_mode | stat.S_IEXEC)
+        self.path = os.environ['PATH']
+        os.environ['PATH'] = self.bin + os.pathsep + self.path
+
+    def tearDown(self):
+        super(EarlyStoppingTests, self).tearDown()
+        os.environ['PATH'] = self.path
+        os.environ.pop('STUB_RSS', None)
+        shutil.rmtree(self.bin)
+        for i in glob.glob(os.path.join(os.path.dirname(self.copasi_file), '*.ran')):
+            os.remove(i)
+
+    def ran(self, copy_number):
+        return os.path.isfile(self.MPE.models[copy_number].copasi_file + '.ran')
+
+    def test_patience(self):
+        ES = pycotools.tasks.EarlyStopping(self.MPE, patience=3)
+        self.assertFalse(ES.update(5))
+        self.assertFalse(ES.update(4))
+        self.assertFalse(ES.update(4))
+        self.assertFalse(ES.update(6))
+        self.assertFalse(ES.update(3))
+        self.assertEqual(ES.since_improvement, 0)
+        self.assertFalse(ES.update(3))
+        self.assertFalse(ES.update(3))
+        self.assertTrue(ES.update(3))
+
+    def test_top_k(self):
+        ES = pycotools.tasks.EarlyStopping(self.MPE, top_k=3, tolerance=0.1)
+        self.assertFalse(ES.update(10))
+        self.assertFalse(ES.update(2))
+        self.assertFalse(ES.update(2.1))
+        self.assertTrue(ES.update(2.15))
+        self.assertListEqual(ES.rss, [2, 2.1, 2.15, 10])
+
+    def test_checks(self):
+        with self.assertRaises(pycotools.errors.InputError):
+            pycotools.tasks.EarlyStopping(self.MPE)
+        with self.assertRaises(pycotools.errors.InputError):
+            pycotools.tasks.EarlyStopping(self.MPE, top_k=3)
+        with self.assertRaises(pycotools.errors.InputError):
+            pycotools.tasks.EarlyStopping(self.MPE, top_k=1, tolerance=0.1)
+        del self.MPE.models
+        with self.assertRaises(pycotools.errors.IncorrectUsageError):
+            pycotools.tasks.EarlyStopping(self.MPE, patience=3)
+
+    def test_stops_running_and_skips_queued(self):
+        os.environ['STUB_RSS'] = '5 4 3 3 3 3 3 3 3 3'
+        self.MPE.max_active = 1
+        ES = pycotools.tasks.EarlyStopping(self.MPE, patience=3, interval=0.05)
+        results = ES.run()
+        self.assertTrue(ES.converged)
+        self.assertEqual(len(ES.rss), 6)
+        self.assertEqual(ES.rss[0], 3)
+        self.assertTrue(self.ran(0))
+        self.assertFalse(self.ran(1))
+        self.assertLess(results.loc[self.MPE.models[0].copasi_file, 'returncode'], 0)
+        self.assertEqual(list(ES.leaderboard['RSS']), [3])
+
+    def test_stops_on_top_k(self):
+        os.environ['STUB_RSS'] = '10 2 2 2 2 2 2 2 2 2'
+        ES = pycotools.tasks.EarlyStopping(self.MPE, top_k=3, tolerance=1e-3, interval=0.05)
+        results = ES.run()
+        self.assertTrue(ES.converged)
+        self.assertLess(len(ES.rss), 20)
+        self.assertTrue(self.ran(0))
+        self.assertTrue(self.ran(1))
+        self.assertLess(min(results['returncode']), 0)
+
+    def test_runs_to_completion(self):
+        os.environ['STUB_RSS'] = '5 4 3'
+        ES = pycotools.tasks.EarlyStopping(self.MPE, patience=10, interval=0.05)
+        results = ES.run()
+        self.assertFalse(ES.converged)
+        self.assertEqual(len(ES.rss), 6)
+        self.assertListEqual(list(results['returncode']), [0, 0])
+
+    def test_earlier_runs_not_on_leaderboard(self):
+        os.environ['STUB_RSS'] = '1'
+        pycotools.tasks.EarlyStopping(self.MPE, patience=10, interval=0.05).run()
+        os.environ['STUB_RSS'] = '5 4 3'
+        ES = pycotools.tasks.EarlyStopping(self.MPE, patience=10, interval=0.05)
+        ES.run()
+        self.assertEqual(len(ES.rss), 6)
+        self.assertListEqual(list(ES.leaderboard['RSS']), [3, 3])
+
+    def test_runner_error_raised(self):
+        def run_parallel(runner):
+            raise pycotools.errors.InputError('stub error')
+
+        original = pycotools.tasks.RunParallel.run_parallel
+        pycotools.tasks.RunParallel.run_parallel = run_parallel
+        try:
+            ES = pycotools.tasks.EarlyStopping(self.MPE, patience=3, interval=0.05)
+            with self.assertRaises(pycotools.errors.InputError):
+                ES.run()
+        finally:
+            pycotools.tasks.RunParallel.run_parallel = original
+
+
 if __name__=='__main__':
     unittest.main()
 
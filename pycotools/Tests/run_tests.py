@@ -33,6 +33,10 @@ import glob
 import os
 import shutil
 import pandas
+import stat
+import tempfile
+import time
+import threading
 from pycotools.Tests import _test_base
 from lxml import etree
 
@@ -126,6 +130,163 @@ class RunTests(_test_base._BaseTest):
 
 
 
+class RunParallelTests(_test_base._BaseTest):
+    """
+    Run models with a stub CopasiSE which sleeps, writes
+    the file it was given to stderr and fails for files
+    with 'fail' in their name. Files with 'slow' in their
+    name wait, for up to 20 seconds, for a .release file
+    next to them before they finish. While it runs the stub keeps
+    a file named after its pid in $RUNNING and logs how
+    many are there when it starts to $RUNNING.log
+    """
+    stub = """#!/bin/sh
+touch "$1.ran"
+touch "$RUNNING/$$"
+ls "$RUNNING" | wc -l >> "$RUNNING.log"
+case "$1" in *slow*)
+    i=0
+    while [ ! -f "$1.release" ] && [ $i -lt 400 ]; do sleep 0.05; i=$((i + 1)); done;;
+esac
+sleep 0.5
+rm "$RUNNING/$$"
+echo "$1" >&2
+case "$1" in *fail*) exit 2;; esac
+"""
+
+    def setUp(self):
+        super(RunParallelTests, self).setUp()
+        self.bin = tempfile.mkdtemp()
+        copasi_se = os.path.join(self.bin, 'CopasiSE')
+        with open(copasi_se, 'w') as f:
+            f.write(self.stub)
+        os.chmod(copasi_se, os.stat(copasi_se).st_mode | stat.S_IEXEC)
+        self.path = os.environ['PATH']
+        os.environ['PATH'] = self.bin + os.pathsep + self.path
+        self.running = os.path.join(self.bin, 'running')
+        os.mkdir(self.running)
+        os.environ['RUNNING'] = self.running
+        self.models = [self.model.copy(self.copasi_file[:-4] + '_{}.cps'.format(i))
+                       for i in range(4)]
+
+    def tearDown(self):
+        super(RunParallelTests, self).tearDown()
+        os.environ['PATH'] = self.path
+        del os.environ['RUNNING']
+        shutil.rmtree(self.bin)
+        for i in self.models:
+            for f in [i.copasi_file, i.copasi_file + '.ran', i.copasi_file + '.release']:
+                if os.path.isfile(f):
+                    os.remove(f)
+
+    def test_results(self):
+        RP = pycotools.tasks.RunParallel(self.models, task='time_course', max_active=4)
+        self.assertListEqual(list(RP.results.index), [i.copasi_file for i in self.models])
+        self.assertListEqual(list(RP.results['returncode']), [0] * 4)
+        for copasi_file, job in RP.results.iterrows():
+            self.assertGreaterEqual(job['wall_time'], 0.5)
+            self.assertEqual(job['stderr'].strip(), copasi_file)
+
+    def test_exit_code(self):
+        self.models[1].copasi_file = self.copasi_file[:-4] + '_fail.cps'
+        RP = pycotools.tasks.RunParallel(self.models, task='time_course')
+        self.assertListEqual(list(RP.results['returncode']), [0, 2, 0, 0])
+
+    def active(self):
+        """
+        :return:
+            `list` of `int`. How many stubs were running
+            as each one started
+        """
+        with open(self.running + '.log') as f:
+            return [int(i) for i in f.read().split()]
+
+    def wait_for_running(self, n):
+        """
+        Wait until n stubs are running
+        """
+        for i in range(1000):
+            if len(os.listdir(self.running)) >= n:
+                return
+            time.sleep(0.01)
+        self.fail('{} CopasiSE stubs did not start'.format(n))
+
+    def test_max_active(self):
+        RP = pycotools.tasks.RunParallel(self.models, task='time_course', max_active=2)
+        self.assertListEqual(list(RP.results['returncode']), [0] * 4)
+        self.assertEqual(len(self.active()), 4)
+        self.assertLessEqual(max(self.active()), 2)
+
+    @_test_base.slow
+    def test_no_idle_cpu(self):
+        """
+        Waiting for CopasiSE uses next to no cpu
+        """
+        start = time.time()
+        cpu = sum(os.times()[:2])
+        pycotools.tasks.RunParallel(self.models, task='time_course', max_active=2)
+        self.assertLess(sum(os.times()[:2]) - cpu, 0.5 * (time.time() - start))
+
+    def test_stop_shared_copasi_file(self):
+        """
+        stop terminates every run, even of
+        models which share a copasi file
+        """
+        models = [self.models[0], self.models[0]]
+        RP = pycotools.tasks.RunParallel(models, task='time_course', run=False)
+        thread = threading.Thread(target=RP.run_parallel)
+        thread.start()
+        self.wait_for_running(2)
+        RP.stop()
+        thread.join()
+        self.assertNotIn(0, list(RP.results['returncode']))
+
+    def test_run_after_stop(self):
+        RP = pycotools.tasks.RunParallel(self.models, task='time_course', run=False)
+        RP.stop()
+        RP.run_parallel()
+        self.assertListEqual(list(RP.results['returncode']), [0] * 4)
+
+    def test_run_false(self):
+        RP = pycotools.tasks.RunParallel(self.models, task='time_course', run=False)
+        self.assertFalse(hasattr(RP, 'results'))
+        self.assertFalse(os.path.isfile(self.models[0].copasi_file + '.ran'))
+
+    def test_run_many(self):
+        """
+        Models are yielded as they finish, while
+        the slow one is still running
+        """
+        self.models[0].copasi_file = self.copasi_file[:-4] + '_slow.cps'
+        finished = []
+        for m, returncode, wall_time, stderr in pycotools.tasks.run_many(
+                self.models, task='time_course', concurrency=4):
+            finished.append(m)
+            self.assertEqual(returncode, 0)
+            self.assertEqual(stderr.strip(), m.copasi_file)
+            if len(finished) == 3:
+                ## the slow model only finishes once the others are yielded
+                open(self.models[0].copasi_file + '.release', 'w').close()
+        self.assertEqual(len(finished), 4)
+        self.assertIs(finished[-1], self.models[0])
+
+    def test_run_many_abandoned(self):
+        """
+        Runs which have not started when iteration
+        stops are never started
+        """
+        jobs = pycotools.tasks.run_many(self.models, task='time_course', concurrency=1)
+        next(jobs)
+        jobs.close()
+        time.sleep(1.2)
+        ran = [os.path.isfile(i.copasi_file + '.ran') for i in self.models]
+        self.assertLess(sum(ran), 4)
+
+    def test_max_active_at_least_one(self):
+        with self.assertRaises(pycotools.errors.InputError):
+            pycotools.tasks.RunParallel(self.models, task='time_course', max_active=0)
+
+
 
 
 if __name__=='__main__':
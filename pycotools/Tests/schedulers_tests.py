@@ -0,0 +1,390 @@
+#-*-coding: utf-8 -*-
+"""
+
+ This file is part of pycotools.
+
+ pycotools is free software: you can redistribute it and/or modify
+ it under the terms of the GNU Lesser General Public License as published by
+ the Free Software Foundation, either version 3 of the License, or
+ (at your option) any later version.
+
+ pycotools is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ GNU Lesser General Public License for more details.
+
+ You should have received a copy of the GNU Lesser General Public License
+ along with pycotools.  If not, see <http://www.gnu.org/licenses/>.
+
+
+ $Author: Ciaran Welsh
+
+Tests for the scheduler backends. CopasiSE and the
+cluster commands are stub scripts which record their
+arguments in calls.log
+"""
+
+import pycotools
+from pycotools import schedulers
+from pycotools.Tests import _test_base
+import os
+import glob
+import stat
+import shutil
+import tempfile
+import time
+import Queue
+import pandas
+import unittest
+
+TIME_COURSE = '{http://www.copasi.org/static/schema}Task[@type="timeCourse"]'
+
+
+class _StubTest(_test_base._BaseTest):
+    """
+    Put a directory of stub commands at the front of PATH
+    """
+    def setUp(self):
+        super(_StubTest, self).setUp()
+        self.bin = tempfile.mkdtemp()
+        self.log = os.path.join(self.bin, 'calls.log')
+        self.path = os.environ['PATH']
+        os.environ['PATH'] = self.bin + os.pathsep + self.path
+
+    def tearDown(self):
+        super(_StubTest, self).tearDown()
+        os.environ['PATH'] = self.path
+        shutil.rmtree(self.bin)
+        os.environ.pop('STUB_STATE', None)
+        os.environ.pop('STUB_QUEUE', None)
+        ## job scripts are kept next to the copasi files
+        for i in glob.glob(os.path.join(os.path.dirname(self.copasi_file), '*.sh')):
+            os.remove(i)
+
+    def stub(self, name, body):
+        """
+        :param name:
+            `str`. Command to stub
+        :param body:
+            `str`. Shell run after the call is logged
+        """
+        command = os.path.join(self.bin, name)
+        with open(command, 'w') as f:
+            f.write('#!/bin/sh\necho "{} $@" >> "{}"\n{}\n'.format(name, self.log, body))
+        os.chmod(command, os.stat(command).st_mode | stat.S_IEXEC)
+
+    def calls(self):
+        if not os.path.isfile(self.log):
+            return []
+        with open(self.log) as f:
+            return f.read().splitlines()
+
+    def copies(self, n):
+        return [self.model.copy(self.copasi_file[:-4] + '_{}.cps'.format(i)).copasi_file
+                for i in range(n)]
+
+
+class FakeSchedulerTests(unittest.TestCase):
+    def test_wait(self):
+        scheduler = schedulers.FakeScheduler(polls=3)
+        job_ids = scheduler.submit_array(['a.cps', 'b.cps'])
+        self.assertListEqual(job_ids, ['fake-1', 'fake-2'])
+        self.assertEqual(scheduler.status('fake-1'), 'running')
+        self.assertDictEqual(scheduler.wait(job_ids, interval=0),
+                             {'fake-1': 'done', 'fake-2': 'done'})
+        self.assertEqual(scheduler.jobs['fake-1']['polls'], 3)
+
+    def test_cancel(self):
+        scheduler = schedulers.FakeScheduler(polls=10)
+        job_ids = scheduler.submit_array(['a.cps', 'b.cps'])
+        scheduler.cancel(job_ids[0])
+        scheduler.cancel(job_ids[1])
+        self.assertDictEqual(scheduler.wait(job_ids, interval=0),
+                             {'fake-1': 'cancelled', 'fake-2': 'cancelled'})
+
+    def test_submit_array_job_name(self):
+        scheduler = schedulers.FakeScheduler()
+        scheduler.submit_array(['a.cps', 'b.cps'])
+        self.assertListEqual([i['job_name'] for i in scheduler.jobs.values()], [None, None])
+        scheduler.submit_array(['c.cps'], job_name='c')
+        self.assertEqual(scheduler.jobs['fake-3']['job_name'], 'c')
+
+    def test_timeout(self):
+        scheduler = schedulers.FakeScheduler(polls=1000)
+        job_id = scheduler.submit('a.cps')
+        with self.assertRaises(pycotools.errors.SchedulerError):
+            scheduler.wait(job_id, interval=0.01, timeout=0.05)
+
+
+class LocalSchedulerTests(_StubTest):
+    """
+    While it runs the CopasiSE stub keeps a file named after
+    its pid in running and logs how many are there when it
+    starts to running.log
+    """
+    def setUp(self):
+        super(LocalSchedulerTests, self).setUp()
+        self.running = os.path.join(self.bin, 'running')
+        os.mkdir(self.running)
+        self.stub('CopasiSE', '\n'.join([
+            'touch "{0}/$$"',
+            'ls "{0}" | wc -l >> "{0}.log"',
+            'sleep 0.3',
+            'rm "{0}/$$"',
+            'echo "$1" >&2',
+            'case "$1" in *_1.cps) exit 4;; esac']).format(self.running))
+
+    def wait_for_status(self, scheduler, job_id, status):
+        for i in range(1000):
+            if scheduler.status(job_id) == status:
+                return
+            time.sleep(0.01)
+        self.fail('job "{}" is not {}'.format(job_id, status))
+
+    def test_submit_array(self):
+        scheduler = schedulers.LocalScheduler(max_active=3)
+        copasi_files = self.copies(3)
+        job_ids = scheduler.submit_array(copasi_files)
+        self.assertDictEqual(scheduler.wait(job_ids),
+                             {'1': 'done', '2': 'failed', '3': 'done'})
+        self.assertEqual(scheduler.jobs['2']['returncode'], 4)
+        self.assertEqual(scheduler.jobs['3']['stderr'].strip(), copasi_files[2])
+
+    def test_max_active(self):
+        scheduler = schedulers.LocalScheduler(max_active=2)
+        scheduler.wait(scheduler.submit_array(self.copies(4)))
+        with open(self.running + '.log') as f:
+            active = [int(i) for i in f.read().split()]
+        self.assertEqual(len(active), 4)
+        self.assertLessEqual(max(active), 2)
+
+    def test_done_queue(self):
+        done = Queue.Queue()
+        scheduler = schedulers.LocalScheduler(max_active=2, done=done)
+        job_ids = scheduler.submit_array(self.copies(3))
+        finished = [done.get(timeout=10) for i in job_ids]
+        self.assertListEqual(sorted(finished), job_ids)
+        for i in job_ids:
+            self.assertGreaterEqual(scheduler.jobs[i]['wall_time'], 0.3)
+
+    def test_cancel(self):
+        self.stub('CopasiSE', 'exec sleep 5')
+        scheduler = schedulers.LocalScheduler(max_active=1)
+        job_ids = scheduler.submit_array(self.copies(2))
+        self.wait_for_status(scheduler, job_ids[0], 'running')
+        scheduler.cancel(job_ids[1])
+        scheduler.cancel(job_ids[0])
+        self.assertDictEqual(scheduler.wait(job_ids),
+                             {job_ids[0]: 'cancelled', job_ids[1]: 'cancelled'})
+        ## the running job was terminated and the other never started
+        self.assertLess(scheduler.jobs[job_ids[0]]['returncode'], 0)
+        self.assertEqual(len(self.calls()), 1)
+
+    def test_timeout(self):
+        scheduler = schedulers.LocalScheduler()
+        job_id = scheduler.submit(self.copies(1)[0])
+        with self.assertRaises(pycotools.errors.SchedulerError):
+            scheduler.wait(job_id, timeout=0.1)
+
+    def test_unknown_job(self):
+        with self.assertRaises(pycotools.errors.SchedulerError):
+            schedulers.LocalScheduler().status('1')
+
+
+class SlurmSchedulerTests(_StubTest):
+    def setUp(self):
+        super(SlurmSchedulerTests, self).setUp()
+        self.stub('sbatch', 'echo "42;cluster"')
+        self.stub('sacct', 'echo "$STUB_STATE"')
+        self.stub('squeue', 'echo "$STUB_QUEUE"')
+        self.stub('scancel', '')
+        self.scheduler = schedulers.SlurmScheduler(options=['--time', '1:00:00'])
+
+    def test_submit(self):
+        job_id = self.scheduler.submit(self.copasi_file)
+        self.assertEqual(job_id, '42')
+        script = self.copasi_file[:-4] + '.sh'
+        self.assertEqual(self.calls(), ['sbatch --parsable --time 1:00:00 {}'.format(script)])
+        ## the script is kept
+        with open(script) as f:
+            text = f.read()
+        self.assertIn('#SBATCH --job-name=test_model\n', text)
+        self.assertIn('module add COPASI/4.22.170\n', text)
+        self.assertIn('CopasiSE {}'.format(self.copasi_file), text)
+
+    def test_submit_array(self):
+        copasi_files = self.copies(3)
+        job_ids = self.scheduler.submit_array(copasi_files, script=os.path.join(self.bin, 'array.sh'))
+        self.assertListEqual(job_ids, ['42_0', '42_1', '42_2'])
+        with open(os.path.join(self.bin, 'array.sh')) as f:
+            text = f.read()
+        self.assertIn('#SBATCH --array=0-2\n', text)
+        self.assertIn('files=({})'.format(' '.join(copasi_files)), text)
+
+    def test_status(self):
+        for state, status in [('RUNNING', 'running'),
+                              ('COMPLETED', 'done'), ('CANCELLED by 1000', 'cancelled'),
+                              ('TIMEOUT', 'failed')]:
+            os.environ['STUB_STATE'] = state
+            self.assertEqual(self.scheduler.status('42_1'), status)
+        self.assertEqual(self.calls()[-1], 'sacct -j 42_1 -n -X -P -o State')
+
+    def test_status_without_accounting_record(self):
+        os.environ['STUB_STATE'] = ''
+        os.environ['STUB_QUEUE'] = 'PENDING'
+        self.assertEqual(self.scheduler.status('42_1'), 'pending')
+        self.assertEqual(self.calls()[-1], 'squeue -h -j 42_1 -o %T')
+        os.environ['STUB_QUEUE'] = ''
+        self.assertEqual(self.scheduler.status('42_1'), 'done')
+
+    def test_status_without_accounting(self):
+        self.stub('sacct', 'echo "accounting storage is disabled" >&2\nexit 1')
+        os.environ['STUB_QUEUE'] = 'RUNNING'
+        self.assertEqual(self.scheduler.status('42'), 'running')
+        self.stub('squeue', 'echo "Invalid job id specified" >&2\nexit 1')
+        self.assertEqual(self.scheduler.status('42'), 'done')
+
+    def test_wait_and_cancel(self):
+        os.environ['STUB_STATE'] = 'COMPLETED'
+        self.assertDictEqual(self.scheduler.wait(['42_0', '42_1'], interval=0),
+                             {'42_0': 'done', '42_1': 'done'})
+        self.scheduler.cancel('42_0')
+        self.assertEqual(self.calls()[-1], 'scancel 42_0')
+
+    def test_submit_fails(self):
+        self.stub('sbatch', 'echo "invalid option" >&2\nexit 1')
+        with self.assertRaises(pycotools.errors.SchedulerError):
+            self.scheduler.submit(self.copasi_file)
+
+
+class SGESchedulerTests(_StubTest):
+    qstat = """<?xml version='1.0'?>
+<job_info>
+  <queue_info>
+    <job_list state="running">
+      <JB_job_number>17</JB_job_number>
+      <state>r</state>
+      <tasks>2</tasks>
+    </job_list>
+  </queue_info>
+  <job_info>
+    <job_list state="pending">
+      <JB_job_number>17</JB_job_number>
+      <state>qw</state>
+      <tasks>3-5:1</tasks>
+    </job_list>
+  </job_info>
+</job_info>"""
+
+    def setUp(self):
+        super(SGESchedulerTests, self).setUp()
+        self.stub('qsub', 'echo "17.1-5:1"')
+        self.stub('qstat', "cat <<'EOF'\n{}\nEOF".format(self.qstat))
+        self.stub('qacct', 'case "$4" in 1) echo "failed 0"; echo "exit_status 1";; '
+                           '*) echo "failed 0"; echo "exit_status 0";; esac')
+        self.stub('qdel', '')
+        self.scheduler = schedulers.SGEScheduler()
+
+    def test_submit_array(self):
+        copasi_files = self.copies(5)
+        job_ids = self.scheduler.submit_array(copasi_files)
+        self.assertListEqual(job_ids, ['17.{}'.format(i) for i in range(1, 6)])
+        script = copasi_files[0][:-4] + '_array.sh'
+        self.assertEqual(self.calls(), ['qsub -terse -N test_model_0_array {}'.format(script)])
+        with open(script) as f:
+            text = f.read()
+        self.assertIn('#$ -t 1-5\n', text)
+        self.assertIn('CopasiSE "${files[$((SGE_TASK_ID - 1))]}"', text)
+
+    def test_status(self):
+        self.assertEqual(self.scheduler.status('17.2'), 'running')
+        self.assertEqual(self.scheduler.status('17.4'), 'pending')
+        self.assertEqual(self.scheduler.status('17.1'), 'failed')
+        self.assertEqual(self.scheduler.status('18'), 'done')
+
+    def test_cancel(self):
+        self.scheduler.cancel('17.3')
+        self.assertEqual(self.calls(), ['qdel 17 -t 3'])
+
+
+class RunWithSchedulerTests(_StubTest):
+    def test_run(self):
+        scheduler = schedulers.FakeScheduler()
+        R = pycotools.tasks.Run(self.model, task='time_course', scheduler=scheduler)
+        self.assertEqual(R.job_id, 'fake-1')
+        self.assertEqual(scheduler.jobs['fake-1']['copasi_file'], self.copasi_file)
+        task = pycotools.model.Model(self.copasi_file).xml.find('.//' + TIME_COURSE)
+        self.assertEqual(task.attrib['scheduled'], 'true')
+
+    def test_scheduler_type(self):
+        with self.assertRaises(pycotools.errors.InputError):
+            pycotools.tasks.Run(self.model, task='time_course', scheduler='slurm')
+
+    def test_slurm_mode_keeps_script(self):
+        self.stub('sbatch', 'echo 42')
+        script = os.path.join(self.bin, 'job.sh')
+        R = pycotools.tasks.Run(self.model, task='time_course', mode='slurm',
+                                sge_job_filename=script)
+        self.assertEqual(R.job_id, '42')
+        self.assertTrue(os.path.isfile(script))
+        self.assertEqual(self.calls(), ['sbatch --parsable {}'.format(script)])
+
+    def multi_parameter_estimation(self, scheduler=None, copy_number=3):
+        experiment_file = os.path.join(os.path.dirname(self.copasi_file), 'experiment.txt')
+        with open(experiment_file, 'w') as f:
+            f.write('Time\tA\tB\n0\t1\t2\n1\t2\t3\n')
+        MPE = pycotools.tasks.MultiParameterEstimation(
+            self.model, experiment_file, copy_number=copy_number, pe_number=2,
+            run_mode=False, scheduler=scheduler, method='genetic_algorithm',
+            population_size=5, number_of_generations=5
+        )
+        MPE.write_config_file()
+        MPE.setup()
+        return MPE
+
+    def profile_likelihood(self, scheduler, run):
+        """
+        Profile the first two fit items of a model
+        with its parameter estimation set up
+        """
+        mod = self.multi_parameter_estimation(copy_number=1).models[0]
+        df = pandas.DataFrame([[0.5] * len(mod.fit_item_order)], columns=mod.fit_item_order)
+        return pycotools.tasks.ProfileLikelihood(mod, df=df, index=0, intervals=2,
+                                                 x=mod.fit_item_order[:2],
+                                                 scheduler=scheduler, run=run)
+
+    def test_profile_likelihood(self):
+        scheduler = schedulers.FakeScheduler()
+        PL = self.profile_likelihood(scheduler, run=True)
+        copasi_files = [PL.model_dct[0][i].copasi_file for i in PL.x]
+        self.assertListEqual(PL.job_ids, ['fake-1', 'fake-2'])
+        self.assertListEqual([scheduler.jobs[i]['copasi_file'] for i in PL.job_ids], copasi_files)
+        for copasi_file in copasi_files:
+            scan = pycotools.model.Model(copasi_file).xml.find(
+                './/{http://www.copasi.org/static/schema}Task[@name="Scan"]')
+            self.assertEqual(scan.attrib['scheduled'], 'true')
+
+    def test_profile_likelihood_run_false(self):
+        scheduler = schedulers.FakeScheduler()
+        PL = self.profile_likelihood(scheduler, run=False)
+        self.assertIsNone(PL.job_ids)
+        self.assertEqual(len(scheduler.jobs), 0)
+        self.assertListEqual(PL.run_analysis(), ['fake-1', 'fake-2'])
+
+    def test_multi_parameter_estimation(self):
+        scheduler = schedulers.FakeScheduler()
+        MPE = self.multi_parameter_estimation(scheduler)
+        job_ids = MPE.run()
+        self.assertListEqual(job_ids, MPE.job_ids)
+        self.assertEqual(len(job_ids), 3)
+        self.assertListEqual([scheduler.jobs[i]['copasi_file'] for i in job_ids],
+                             [i.copasi_file for i in MPE.models.values()])
+        for copasi_file in [i.copasi_file for i in MPE.models.values()]:
+            scan = pycotools.model.Model(copasi_file).xml.find(
+                './/{http://www.copasi.org/static/schema}Task[@name="Scan"]')
+            self.assertEqual(scan.attrib['scheduled'], 'true')
+        self.assertEqual(set(scheduler.wait(job_ids, interval=0).values()), {'done'})
+
+
+if __name__ == '__main__':
+    unittest.main()
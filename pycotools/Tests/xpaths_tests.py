@@ -0,0 +1,188 @@
+#-*-coding: utf-8 -*-
+"""
+
+ This file is part of pycotools.
+
+ pycotools is free software: you can redistribute it and/or modify
+ it under the terms of the GNU Lesser General Public License as published by
+ the Free Software Foundation, either version 3 of the License, or
+ (at your option) any later version.
+
+ pycotools is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ GNU Lesser General Public License for more details.
+
+ You should have received a copy of the GNU Lesser General Public License
+ along with pycotools.  If not, see <http://www.gnu.org/licenses/>.
+
+
+ $Author: Ciaran Welsh
+
+Tests for the precompiled queries and section handles
+in xpaths and a benchmark of the model properties which
+use them against the string queries they replaced.
+"""
+
+import pycotools
+
+from pycotools.Tests import _test_base
+from pycotools import xpaths
+import os
+import time
+import pandas
+import unittest
+
+
+class SectionsTests(_test_base._BaseTest):
+    def setUp(self):
+        super(SectionsTests, self).setUp()
+
+    def test_model_section(self):
+        mod = self.model.xml.find(xpaths.tag('Model'))
+        self.assertIs(self.model.sections['Model'], mod)
+
+    def test_nested_section(self):
+        metabolites = self.model.xml.find(xpaths.tag('Model')).find(xpaths.tag('ListOfMetabolites'))
+        self.assertIs(self.model.sections['ListOfMetabolites'], metabolites)
+
+    def test_top_level_section(self):
+        tasks = self.model.xml.find(xpaths.tag('ListOfTasks'))
+        self.assertIs(self.model.sections['ListOfTasks'], tasks)
+
+    def test_handles_resolved_once(self):
+        sections = self.model.sections
+        sections['ListOfReports']
+        self.assertIs(self.model.sections, sections)
+        self.assertIn('ListOfReports', sections.handles)
+
+    def test_missing_section_found_once_added(self):
+        mod = self.model.sections['Model']
+        mod.remove(self.model.sections['ListOfModelValues'])
+        self.assertIsNone(self.model.sections['ListOfModelValues'])
+        gq = pycotools.model.GlobalQuantity(self.model, name='NewGlobal', initial_value=5)
+        self.model.add_global_quantity(gq)
+        self.assertIsNotNone(self.model.sections['ListOfModelValues'])
+        self.assertEqual([i.name for i in self.model.global_quantities], ['NewGlobal'])
+
+    def test_new_xml_new_handles(self):
+        sections = self.model.sections
+        self.model.xml = pycotools.tasks.CopasiMLParser(self.copasi_file).xml
+        self.assertIsNot(self.model.sections, sections)
+        self.assertIs(self.model.sections['Model'].getparent(), self.model.xml)
+
+    def test_copies_do_not_share_handles(self):
+        new = self.model.copy(self.copasi_file[:-4] + '2.cps')
+        self.assertIsNot(new.sections['Model'], self.model.sections['Model'])
+
+
+class QueryTests(_test_base._BaseTest):
+    """
+    The precompiled queries find the same elements
+    as the // queries they replaced
+    """
+    def setUp(self):
+        super(QueryTests, self).setUp()
+        names = [i.name for i in self.model.metabolites]
+        df = pandas.DataFrame({'Time': range(10)})
+        for i in names:
+            df[i] = range(10)
+        self.experiment_file = os.path.join(self.model.root, 'experiment_data.txt')
+        df.to_csv(self.experiment_file, sep='\t', index=False)
+
+        PE = pycotools.tasks.ParameterEstimation(self.model, self.experiment_file,
+                                                 method='genetic_algorithm',
+                                                 population_size=10,
+                                                 number_of_generations=10,
+                                                 report_name='PE_report_name.csv')
+        PE.write_config_file()
+        PE.setup()
+        self.model = PE.model
+        self.model = pycotools.tasks.Scan(self.model, variable=names[0], minimum=1,
+                                          maximum=2, number_of_steps=2,
+                                          scan_type='scan', run=False).model
+        ## the time course task is replaced by one without the copasi namespace
+        self.model = pycotools.tasks.TimeCourse(self.model, end=10, step_size=1,
+                                                intervals=10, run=False).model
+        self.queries = {
+            'KINETIC_PARAMETERS': '//*[@cn="String=Kinetic Parameters"]',
+            'PARAMETER_DESCRIPTIONS': '//copasi:ParameterDescription',
+            'TIME_COURSE': '//*[@type="timeCourse"]',
+            'SCAN': '//*[@name="Scan"]',
+            'PARAMETER_FITTING': '//*[@type="parameterFitting"]',
+            'PARAMETER_ESTIMATION': '//*[@name="Parameter Estimation"]',
+            'SCAN_ITEMS': '//*[@name="ScanItems"]',
+            'EXPERIMENT_SET': '//*[@name="Experiment Set"]',
+            'VALIDATION_SET': '//*[@name="Validation Set"]',
+            'FIT_ITEMS': '//*[@name="FitItem"]',
+            'FILE_NAMES': '//*[@name="File Name"]',
+            'TARGETS': '//*[@target]',
+        }
+
+    def test_queries(self):
+        for name, query in self.queries.items():
+            expected = self.model.xml.xpath(query, namespaces=xpaths.NAMESPACES)
+            self.assertNotEqual(expected, [])
+            self.assertEqual(getattr(xpaths, name)(self.model.xml), expected)
+
+    def test_fit_item_order(self):
+        self.assertEqual(len(self.model.fit_item_order),
+                         len(self.model.xml.xpath(self.queries['FIT_ITEMS'])))
+
+
+class QueryBenchmarkTests(_test_base._BaseTest):
+    """
+    The model properties used to run string xpath queries
+    over the whole document every time they were read. The
+    timing comparisons are slow tests since they depend on
+    the load on the machine.
+    """
+    def setUp(self):
+        super(QueryBenchmarkTests, self).setUp()
+        self.n = 1000
+
+    def time(self, f):
+        """
+        :param f:
+            callable. Function to time
+        :return:
+            `float`. Seconds to call f self.n times
+        """
+        start = time.time()
+        for i in range(self.n):
+            f()
+        return time.time() - start
+
+    def test_time_unit(self):
+        query = '//*[@timeUnit]'
+        self.assertEqual(self.model.time_unit,
+                         self.model.xml.xpath(query)[0].attrib['timeUnit'])
+
+    def test_parameter_description_count(self):
+        tag = '{http://www.copasi.org/static/schema}ParameterDescription'
+        self.assertEqual(len(self.model.parameter_descriptions),
+                         len([i for i in self.model.xml.iter() if i.tag == tag]))
+
+    @_test_base.slow
+    def test_unit_properties_benchmark(self):
+        xml = self.model.xml
+        before = self.time(lambda: xml.xpath('//*[@timeUnit]')[0].attrib['timeUnit'])
+        after = self.time(lambda: self.model.time_unit)
+        self.assertLess(after, before)
+
+    @_test_base.slow
+    def test_queries_benchmark(self):
+        xml = self.model.xml
+        before = self.time(lambda: xml.xpath('//*[@name="FitItem"]'))
+        after = self.time(lambda: xpaths.FIT_ITEMS(xml))
+        self.assertLess(after, before)
+
+    @_test_base.slow
+    def test_parameter_descriptions_benchmark(self):
+        tag = '{http://www.copasi.org/static/schema}ParameterDescription'
+        before = self.time(lambda: [i for i in self.model.xml.iter() if i.tag == tag])
+        after = self.time(lambda: self.model.parameter_descriptions)
+        self.assertLess(after, before)
+
+if __name__ == '__main__':
+    unittest.main()
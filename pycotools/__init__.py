@@ -5,6 +5,8 @@ import os
 import misc
 import model
 import models
+import xpaths
+import schedulers
 
 import logging
 import logging.config
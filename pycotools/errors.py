@@ -71,4 +71,7 @@ class NonFormattedPEFileError(Exception):
     pass
 
 class AlreadyExistsError(Exception):
-    pass
\ No newline at end of file
+    pass
+
+class SchedulerError(Exception):
+    pass
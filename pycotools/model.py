@@ -24,20 +24,29 @@
 
 import logging
 import os
+import gc
+import zlib
+import hashlib
+import cPickle
+import json
+import uuid
 from collections import OrderedDict, Counter
-from random import randint
+from itertools import izip, islice
+from io import BytesIO
+from xml.sax.saxutils import escape
 
 from lxml import etree
 
 # site.addsitedir('C:\Users\Ciaran\Documents\PyCoTools')
 # import PyCoTools
-import errors, misc, viz
+import errors, misc, viz, xpaths
 import _base
 import tasks
 import pandas
 import re
+import numpy
 import sys, inspect
-from copy import deepcopy
+from copy import deepcopy, copy as shallow_copy
 from mixin import mixin, Mixin
 from functools import wraps
 from cached_property import cached_property_with_ttl, cached_property
@@ -145,11 +154,12 @@ class ComparisonMethodsMixin(Mixin):
                 \"""
                  pass
     """
+    __slots__ = ()
 
     def __eq__(self, other):
         """Override the default Equals behavior"""
         if isinstance(other, self.__class__):
-            return self.__dict__ == other.__dict__
+            return _attributes(self) == _attributes(other)
         return NotImplemented
 
     def __ne__(self, other):
@@ -160,7 +170,29 @@ class ComparisonMethodsMixin(Mixin):
 
     def __hash__(self):
         """Override the default hash behavior (that returns the id or the object)"""
-        return hash(tuple(sorted(self.__dict__.items())))
+        return hash(tuple(sorted(_attributes(self).items())))
+
+
+def _attributes(obj):
+    """
+    For Developers
+
+    The attributes of obj which have been set. Model
+    components keep their attributes in `__slots__`
+    rather than a `__dict__`.
+
+    :param obj:
+        Any object, i.e. a :py:class:`Metabolite`
+
+    :return:
+        `dict`
+    """
+    attributes = dict(getattr(obj, '__dict__', {}))
+    for cls in type(obj).__mro__:
+        for attr in cls.__dict__.get('__slots__', ()):
+            if hasattr(obj, attr):
+                attributes[attr] = getattr(obj, attr)
+    return attributes
 
 
 class Build(object):
@@ -320,6 +352,7 @@ class Model(_base._Base):
     key                         Model key
     states                      List of states in correct order defined
                                 by copasi StateTemplate element.
+    fit_items                   DataFrame of the parameters being fitted
     fit_item_order              Order in which fit items appear
     all_variable_names          List of reactions, metabolites, global_quantities
                                 local_parameters, compartment names as string
@@ -329,13 +362,15 @@ class Model(_base._Base):
 
     Properties get re-evaluate each time they are called which
     is expensive due to re-reading the xml and unnecessary.
-    The :py:mod:`cached_property` module written by Daniel Greenfeld and redistributed
-    in pycotools enables these components to be read once and cached for later use. This
-    cache set on instantiation is reset each time a new component is added or changed.
-    The following components are cached_properties:
+    Instead, model components are read from the xml once, the first
+    time they are needed, into a :py:class:`ComponentIndex` which is kept
+    up to date by the add and remove methods. The index is keyed by
+    `key`, `name` and `global_name` so that :py:meth:`Model.get` does
+    not need to search a list. The following components are
+    derived from the index:
 
     =======================     =======================
-    Cached Property                    Description
+    Indexed Property            Description
     =======================     =======================
     compartments                List of :py:class:`model.Compartment`
     metabolites                 List of :py:class:`model.Metabolite`
@@ -345,17 +380,26 @@ class Model(_base._Base):
     constants                   List of :py:class:`LocalParameter`
     reactions                   List of :py:class:`Reaction`
     parameters                  List of :py:class:'LocalParameter`
+    quantities                  DataFrame with a row for each metabolite,
+                                global quantity, local parameter and compartment
     =======================     =======================
 
+    Likewise the states are read from the xml once and written back
+    when the model is saved. When a component changes only the index
+    entries which depend on it are updated, i.e. changing the volume of
+    a compartment updates the concentration of its metabolites.
+
     Usage:
         >>> from pycotools.model import Model
         >>> model_path = r'/full/path/to/model.cps'
         >>> model = Model(model_path) ##work in concentration units
         >>> model = Model(model_path, quantity_type='particle_numbers') ## work in particle numbers
+        >>> model = Model(model_path, lazy=True) ## do not parse annotations, layouts, etc.
+        >>> model = Model.from_snapshot(model_path) ## reload an unchanged model without parsing it
 
     """
     def __init__(self, copasi_file, quantity_type='concentration',
-                 new=False, **kwargs):
+                 new=False, lazy=False, **kwargs):
         """
         :param copasi_file:
             `str`. Full path to a copasi file
@@ -366,16 +410,30 @@ class Model(_base._Base):
         :param new:
             `bool`. Begin new empty model. Untested.
 
+        :param lazy:
+            `bool`. default=False. Keep the sections of the file which
+            pycotools does not use, such as annotations and layouts,
+            as raw bytes rather than parsing them. They are written
+            back unchanged when the model is saved.
+            See :py:class:`tasks.CopasiMLParser`
+
         :param kwargs:
             Unused.
         """
         super(Model, self).__init__(**kwargs)
-        self._copasi_file = copasi_file
+        ## resolve once so nothing depends on the current working directory
+        self._copasi_file = os.path.abspath(copasi_file)
         self.quantity_type = quantity_type
         self.new_model = new
+        self.lazy = lazy
         if self.new_model:
             misc.new_model(copasi_file)
-        self.xml = tasks.CopasiMLParser(copasi_file).copasiML
+        parser = tasks.CopasiMLParser(copasi_file, lazy=self.lazy)
+        self.xml = parser.copasiML
+        ## raw bytes of the sections not parsed when lazy
+        self._skipped = parser.skipped
+        ## set when states are changed but not yet written to the xml
+        self._states_modified = False
         ## fill this dict after class is finished
         self.default_properties = {}
         self.default_properties.update(kwargs)
@@ -401,6 +459,12 @@ class Model(_base._Base):
         :return:
             :py:class:`Model`
         """
+        indexed = dict((v, k) for k, v in self._component_properties().items())
+        if prop in indexed:
+            self._component_index.discard(indexed[prop])
+            getattr(self, prop)
+            return self
+
         if prop not in self.__dict__:
             raise errors.InputError('Property "{}" does not '
                                     'exist from model.Model class'.format(prop))
@@ -408,6 +472,164 @@ class Model(_base._Base):
         getattr(self, prop)
         return self
 
+    @cached_property
+    def _component_index(self):
+        """
+        For Developers
+
+        The :py:class:`ComponentIndex` holding this models
+        components. Components are read into the index by
+        :py:meth:`Model._get_index`
+
+        :return:
+            :py:class:`ComponentIndex`
+        """
+        return ComponentIndex()
+
+    def _get_index(self, component):
+        """
+        For Developers
+
+        Get the :py:class:`ComponentIndex`, reading `component`
+        from the xml first if it has not already been read.
+
+        :param component:
+            `str`. One of :py:meth:`Model._model_components`
+
+        :return:
+            :py:class:`ComponentIndex`
+        """
+        index = self._component_index
+        if component not in index:
+            if component == 'reaction':
+                index.build('reaction', self._read_reactions())
+            else:
+                self._read_components()
+        return index
+
+    def _section(self, name):
+        """
+        For Developers
+
+        Get the elements listed under a top level section
+        of the model such as `ListOfMetabolites`.
+
+        :param name:
+            `str`. Section tag without the copasi namespace
+
+        :return:
+            `list` of :py:class:`etree._Element`. Empty when the
+            section does not exist
+        """
+        section = self.sections[name]
+        if section is None:
+            return []
+        return list(section)
+
+    def _model_section(self, name, after):
+        """
+        For Developers
+
+        Get a section of the `Model` element, creating
+        it when it does not exist yet.
+
+        :param name:
+            `str`. Section tag without the copasi namespace
+
+        :param after:
+            `str`. Tag of the section which a new section
+            is inserted after
+
+        :return:
+            :py:class:`etree._Element`
+        """
+        section = self.sections[name]
+        if section is None:
+            mod = self.sections['Model']
+            idx = 0
+            for i in range(len(mod)):
+                if mod[i].tag == xpaths.tag(after):
+                    idx = i + 1
+            section = etree.Element(xpaths.tag(name))
+            mod.insert(idx, section)
+        return section
+
+    def _read_components(self):
+        """
+        For Developers
+
+        Read compartments, metabolites, global quantities,
+        functions and local parameters into the
+        :py:class:`ComponentIndex` in a single pass over
+        the model sections. Components which are
+        already indexed are not read again.
+
+        :return:
+            :py:class:`Model`
+        """
+        index = self._component_index
+        states = self._states
+        quantity_unit = self.quantity_unit
+        if 'compartment' not in index:
+            index.build('compartment', [self._compartment_from_xml(i, states)
+                                        for i in self._section('ListOfCompartments')])
+
+        if 'metabolite' not in index:
+            index.build('metabolite', [self._metabolite_from_xml(i, states, quantity_unit)
+                                       for i in self._section('ListOfMetabolites')])
+
+        if 'global_quantity' not in index:
+            index.build('global_quantity', [self._global_quantity_from_xml(i, states)
+                                            for i in self._section('ListOfModelValues')])
+
+        if 'function' not in index:
+            index.build('function', [self._function_from_xml(i)
+                                     for i in self._section('ListOfFunctions')])
+
+        if 'local_parameter' not in index:
+            index.build('local_parameter', self._read_constants())
+        return self
+
+    def _index_element(self, component, element):
+        """
+        For Developers
+
+        Add the component defined by a newly inserted xml
+        element to the :py:class:`ComponentIndex`. Nothing
+        is done when `component` has not been read yet since
+        it will be read from the xml when needed.
+
+        :param component:
+            `str`. One of :py:meth:`Model._model_components`
+
+        :param element:
+            :py:class:`etree._Element`
+
+        :return:
+            :py:class:`Model`
+        """
+        index = self._component_index
+        if component not in index:
+            return self
+
+        if component == 'compartment':
+            obj = self._compartment_from_xml(element, self._states)
+
+        elif component == 'metabolite':
+            obj = self._metabolite_from_xml(element, self._states, self.quantity_unit)
+
+        elif component == 'global_quantity':
+            obj = self._global_quantity_from_xml(element, self._states)
+
+        elif component == 'function':
+            obj = self._function_from_xml(element)
+
+        else:
+            raise errors.InputError('Cannot index "{}" from a single element'.format(component))
+
+        index.add(component, obj)
+        return self
+
     @property
     def copasi_file(self):
         """
@@ -432,11 +654,139 @@ class Model(_base._Base):
         fle, ext = os.path.splitext(filename)
         if ext != '.cps':
             raise errors.InputError('expected a .cps file. Got {} instead'.format(ext))
-        self._copasi_file = filename
+        self._copasi_file = os.path.abspath(filename)
+
+    @property
+    def xml(self):
+        """
+        The copasiML as :py:class:`etree._Element`. Copies of a model
+        share a read only snapshot of its xml and only make their
+        own copy of it the first time it is used here.
+
+        :return:
+            :py:class:`etree._Element`
+        """
+        if self._xml is None:
+            packed = self.__dict__.get('_packed_xml')
+            if packed is not None:
+                self._xml = self._unpack_xml(packed)
+            else:
+                self._xml = deepcopy(self._template)
+        ## the caller may change the xml so the snapshot is out of date
+        self._template = None
+        return self._xml
+
+    @xml.setter
+    def xml(self, xml):
+        """
+        :param xml:
+            :py:class:`etree._Element`
+
+        :return:
+            None
+        """
+        self._xml = xml
+        self._template = None
+
+    @property
+    def _template(self):
+        """
+        For Developers
+
+        The read only snapshot of the xml shared between copies of
+        a model. A model loaded by :py:meth:`Model.from_snapshot` keeps
+        its xml compressed and only parses it the first time it is used.
+
+        :return:
+            :py:class:`etree._Element` or None
+        """
+        packed = self.__dict__.get('_packed_xml')
+        if packed is not None:
+            self.__dict__['_shared_xml'] = self._unpack_xml(packed)
+            self._packed_xml = None
+        return self.__dict__.get('_shared_xml')
+
+    @_template.setter
+    def _template(self, template):
+        """
+        :param template:
+            :py:class:`etree._Element` or None
+
+        :return:
+            None
+        """
+        self._packed_xml = None
+        self.__dict__['_shared_xml'] = template
+
+    @staticmethod
+    def _unpack_xml(packed):
+        """
+        For Developers
+
+        :param packed:
+            `str`. xml compressed by :py:meth:`Model.to_snapshot`
+
+        :return:
+            :py:class:`etree._Element`
+        """
+        return etree.fromstring(zlib.decompress(packed))
+
+    @property
+    def sections(self):
+        """
+        Direct handles on the top level sections of the
+        model, i.e. `ListOfMetabolites` or `ListOfTasks`.
+        Handles are resolved once and kept until the
+        xml is replaced.
+
+        :return:
+            :py:class:`xpaths.Sections`
+        """
+        xml = self.xml
+        sections = self.__dict__.get('_sections')
+        if sections is None or sections.xml is not xml:
+            sections = xpaths.Sections(xml)
+            self._sections = sections
+        return sections
+
+    def _share_xml(self):
+        """
+        For Developers
+
+        Get a read only snapshot of the xml for copies of this model
+        to share. The same snapshot is handed out until the xml is next
+        used through :py:attr:`Model.xml`.
+
+        :return:
+            :py:class:`etree._Element`
+        """
+        if self._template is None:
+            self._write_states()
+            self._template = deepcopy(self._xml)
+        return self._template
+
+    def __deepcopy__(self, memo):
+        """
+        Copy the model without copying its xml. The copy
+        shares a snapshot from :py:meth:`Model._share_xml`
+        and reads its components again when they are needed.
+        """
+        new = self.__class__.__new__(self.__class__)
+        memo[id(self)] = new
+        template = self._share_xml()
+        for attr, value in self.__dict__.items():
+            if attr in ['_xml', '_shared_xml', '_packed_xml', '_component_index',
+                        '_sections', '_fit_items', '_quantities']:
+                continue
+            new.__dict__[attr] = deepcopy(value, memo)
+        new._xml = None
+        new._template = template
+        return new
 
     def copy(self, filename):
         """
-        Copy the model to `filename`
+        Copy the model to `filename`. The copy shares
+        the xml of this model until either is changed.
 
         :return:
             :py:class:`Model`
@@ -500,8 +850,7 @@ class Model(_base._Base):
         :return:
             `str` current time unit defined by copasi
         """
-        query = '//*[@timeUnit]' and '//*[@volumeUnit]' and '//*[@areaUnit]'
-        return self.xml.xpath(query)[0].attrib['timeUnit']
+        return self.sections['Model'].attrib['timeUnit']
 
     @property
     def name(self):
@@ -510,8 +859,7 @@ class Model(_base._Base):
         :return:
             `str`. The model name
         """
-        query = '//*[@timeUnit]' and '//*[@volumeUnit]' and '//*[@areaUnit]'
-        return self.xml.xpath(query)[0].attrib['name']
+        return self.sections['Model'].attrib['name']
 
     @name.setter
     def name(self, name):
@@ -524,8 +872,7 @@ class Model(_base._Base):
 
         :return: :py:class:`Model`
         """
-        query = '//*[@timeUnit]' and '//*[@volumeUnit]' and '//*[@areaUnit]'
-        self.xml.xpath(query)[0].attrib['name'] = str(name)
+        self.sections['Model'].attrib['name'] = str(name)
         return self
 
     @property
@@ -535,8 +882,7 @@ class Model(_base._Base):
         :return:
             `str`. The currently defined volume unit
         """
-        query = '//*[@timeUnit]' and '//*[@volumeUnit]' and '//*[@areaUnit]'
-        return self.xml.xpath(query)[0].attrib['volumeUnit']
+        return self.sections['Model'].attrib['volumeUnit']
 
     @property
     def quantity_unit(self):
@@ -545,8 +891,7 @@ class Model(_base._Base):
         :return:
             `str`. The currently defined quantity unit
         """
-        query = '//*[@timeUnit]' and '//*[@volumeUnit]' and '//*[@areaUnit]'
-        return self.xml.xpath(query)[0].attrib['quantityUnit']
+        return self.sections['Model'].attrib['quantityUnit']
 
     @property
     def area_unit(self):
@@ -555,8 +900,7 @@ class Model(_base._Base):
         :return:
             `str`. The currently defined area unit.
         """
-        query = '//*[@timeUnit]' and '//*[@volumeUnit]' and '//*[@areaUnit]'
-        return self.xml.xpath(query)[0].attrib['areaUnit']
+        return self.sections['Model'].attrib['areaUnit']
 
     @property
     def length_unit(self):
@@ -565,8 +909,7 @@ class Model(_base._Base):
         :return:
             `str`
         """
-        query = '//*[@timeUnit]' and '//*[@volumeUnit]' and '//*[@areaUnit]'
-        return self.xml.xpath(query)[0].attrib['lengthUnit']
+        return self.sections['Model'].attrib['lengthUnit']
 
     @property
     def avagadro(self):
@@ -578,8 +921,7 @@ class Model(_base._Base):
         :return:
             `int`
         """
-        query = '//*[@timeUnit]' and '//*[@volumeUnit]' and '//*[@areaUnit]'
-        avagadro_from_model = float(self.xml.xpath(query)[0].attrib['avogadroConstant'])
+        avagadro_from_model = float(self.sections['Model'].attrib['avogadroConstant'])
         avagadros_from_version19 = 6.022140857e+23
         if avagadro_from_model != avagadros_from_version19:
             raise errors.AvagadrosError('Avagadro from model {} is not equal to {}. Check to see whether COPASI have updated the value of avagadro\'s number'.format(avagadro_from_model, avagadros_from_version19))
@@ -593,33 +935,19 @@ class Model(_base._Base):
         :return:
             `str`
         """
-        query = '//*[@timeUnit]' and '//*[@volumeUnit]' and '//*[@areaUnit]'
-        return self.xml.xpath(query)[0].attrib['key']
+        return self.sections['Model'].attrib['key']
 
     @property
     def states(self):
         """
         The states (metabolites, globals, compartments) in the order they
-        are read by Copasi from the StateTemplate element.
+        are read by Copasi from the StateTemplate element. Get or set
+        states by key, position, slice or list. See :py:class:`States`.
 
         :return:
-            `OrderedDict`
+            :py:class:`States`
         """
-        collection = []
-        for i in self.xml.iter():
-            if i.tag == '{http://www.copasi.org/static/schema}StateTemplate':
-                for j in i:
-                    collection.append(j.attrib['objectReference'])
-
-        query = '//*[@type="initialState"]'
-        for i in self.xml.xpath(query):
-            state_values = i.text
-
-        state_values = state_values.split(' ')
-        state_values = [i for i in state_values if i not in ['',' ', '\n']]
-        state_values = [float(i) for i in state_values]
-
-        return OrderedDict(zip(collection, state_values))
+        return self._states
 
     @states.setter
     def states(self, states):
@@ -630,260 +958,601 @@ class Model(_base._Base):
         :return:
             :py:class:`Model`
         """
-        ## first check what data type states is
-        if not isinstance(states, str):
-            ## if not str then convert list to str in appropriate format
-            state_string = reduce(lambda x, y: '{} {}'.format(x, y), states)
-
         ## get number of model states
-        number_of_model_states = len(self.states)
+        number_of_model_states = len(self._states)
 
         ##check we have correct number of model states
         if len(states) != number_of_model_states:
             raise errors.InputError('Not entered the currect number of states. Expected {} and got {}'.format(number_of_model_states, len(states)))
 
         ## enter states into model
-        query = '//*[@type="initialState"]'
-        for i in self.xml.xpath(query):
-            i.text = state_string
+        self._states[:] = [float(i) for i in states]
         return self
 
-    @property
-    def fit_item_order(self):
+    @cached_property
+    def _states(self):
         """
-        Get names of parameters being fitted in the
-        order they appear
+        For Developers
+
+        The states read once from the StateTemplate and InitialState
+        elements. The add_state, remove_state and _set_state methods keep
+        this up to date and :py:meth:`Model._write_states` writes it back
+        to the xml when the model is saved.
 
         :return:
-            `list`
+            :py:class:`States`
         """
-        lst = []
-        query = '//*[@name="FitItem"]'
-        for i in self.xml.xpath(query):
-            for j in list(i):
-                if j.attrib['name'] == 'ObjectCN':
-                    match = re.findall('Reference=(.*)', j.attrib['value'])[0]
-
-                    if match == 'Value':
-                        match2 = re.findall('Reactions\[(.*)\].*Parameter=(.*),', j.attrib['value'])[0]
-                        match2 = '({}).{}'.format(match2[0], match2[1])
-                        lst.append(match2)
-
-                    elif match == 'InitialValue':
-                        match2 = re.findall('Values\[(.*)\]', j.attrib['value'])[0]
-                        lst.append(match2)
-
-                    elif match == 'InitialConcentration':
-                        match2 = re.findall('Metabolites\[(.*)\]', j.attrib['value'])[0]
-                        lst.append(match2)
-        return lst
+        state_template, initial_state = self._state_elements()
+        collection = [i.attrib['objectReference'] for i in state_template
+                      if isinstance(i.tag, basestring)]
+        state_values = numpy.array(initial_state.text.split(), dtype=float)
+        return States(collection, state_values, model=self)
 
-    def add_state(self, state, value):
+    def _state_elements(self):
         """
-        Append state on to end of state template.
-        Used within add_metabolite and add_global_quantity. Shouldn't
-        need to use manually
-
-        :param state:
-            `str`. A valid key
-
-        :param value:
-            `int`, `float`. Value for state
+        For Developers
 
         :return:
+            `tuple`. The StateTemplate and InitialState
+            :py:class:`etree._Element`. The first InitialState
+            of the Model when there is more than one
         """
-        element = etree.Element('{http://www.copasi.org/static/schema}StateTemplateVariable', attrib={'objectReference': state})
-        for i in self.xml.iter():
-            if i.tag == '{http://www.copasi.org/static/schema}StateTemplate':
-                i.append(element)
-                for j in i.getparent():
-                    if j.tag =='{http://www.copasi.org/static/schema}InitialState':
-                        j.text = "{} {} \n".format(j.text.replace('\n', '').strip(), str(value) ) # + '\n'
-        return self
+        return self.sections['StateTemplate'], self.sections['InitialState']
 
-    def remove_state(self, state):
+    def _write_states(self):
         """
-        Remove state from StateTemplate and
-        InitialState fields. USed for deleting metabolites
-        and global quantities.
+        For Developers
 
-        :param state:
-            `str`. key of state to remove (i.e. Metabolite_1)
+        Write :py:attr:`Model._states` back into the InitialState
+        element. Nothing is written unless the states have changed
+        since the model was read.
 
         :return:
             :py:class:`Model`
         """
-        ##count the number of states
-        count = -1 #0 indexed python
-
-        stop_count = 0
-        for i in self.xml.iter():
-            if i.tag == '{http://www.copasi.org/static/schema}StateTemplate':
-                for j in i:
-                    count = count + 1
-                    if j.attrib['objectReference'] == state:
-                        j.getparent().remove(j)
-                        ##collect the number where we hit our desired state
-                        stop_count = count
-
-            if i.tag == '{http://www.copasi.org/static/schema}InitialState':
-                states = i.text.strip().split(' ')
-                del states[stop_count]  ## get component of interest
-        #reassign the states list to the InitialState
-        states = [float(i) for i in states]
-        self.states = states
+        if not getattr(self, '_states_modified', False):
+            return self
+        state_template, initial_state = self._state_elements()
+        initial_state.text = "{} \n".format(
+            ' '.join([repr(i) for i in self._states.values()])
+        )
+        ## so that copasi can not read stale values from another
+        for i in list(initial_state.itersiblings(initial_state.tag)):
+            i.getparent().remove(i)
+        self._states_modified = False
         return self
 
-    # @property
-    @cached_property
-    def compartments(self):
+    def _set_state(self, state, value):
         """
-        Get list of model compartments
+        For Developers
+
+        Change the value of a single state and update
+        only the components which depend on it.
+
+        :param state:
+            `str`. A valid key
+
+        :param value:
+            `int`, `float`. Value for state
 
         :return:
-            `list`. Each element is :py:class:`Compartment`
+            :py:class:`Model`
         """
-        collection= {}
-        lst = []
-        for i in self.xml.iter():
-            if i.tag == '{http://www.copasi.org/static/schema}ListOfCompartments':
-                df_list = []
-                for j in i:
-                    lst.append(Compartment(self,
-                                           key=j.attrib['key'],
-                                           name=j.attrib['name'],
-                                           simulation_type=j.attrib['simulationType'],
-                                           initial_value=float(self.states[j.attrib['key']])) )
-        if 'compartments' in self.__dict__:
-            del self.__dict__['compartments']
-
-        return lst
+        if state not in self._states:
+            raise errors.InputError('"{}" is not a model state'.format(state))
+        self._states[state] = float(value)
+        return self
 
-    def add_compartment(self, compartment):
+    def _states_changed(self, states):
         """
-        Add compartment to model
+        For Developers
 
-        :param compartment:
-            :py:class:`Compartment`
+        Called by :py:class:`States` when values are assigned
+        to it. A single state updates only the components which
+        depend on it. Otherwise the compartments, metabolites and
+        global quantities are read again when they are next needed.
+
+        :param states:
+            `list`. Keys of the states which changed
 
         :return:
             :py:class:`Model`
         """
-        if isinstance(compartment, str):
-            compartment = Compartment(self, compartment)
+        self._states_modified = True
+        index = self._component_index
+        if len(states) != 1:
+            for component in ['compartment', 'metabolite', 'global_quantity']:
+                index.discard(component)
+                self._invalidate(component)
+            return self
 
-        if not isinstance(compartment, Compartment):
-            raise errors.InputError(
-                'Expecting "{}" but '
-                'got "{}" instead'.format('Compartment', type(compartment))
-            )
+        state = states[0]
+        for component in ['compartment', 'metabolite', 'global_quantity']:
+            if component not in index:
+                continue
 
-        ## ensure we don't add compartment with existing name
-        existing = self.get('compartment', compartment.name, by='name')
-        if existing != []:
-            LOG.info(
-                'Model already contains compartment '
-                'with name: "{}". Skipping'.format(compartment.name)
-            )
-            return self
+            for obj in index.get(component, state, by='key'):
+                new = self._from_states(component, obj)
+                index.replace(component, obj, new)
+
+                ## concentrations depend on compartment volume
+                if component == 'compartment' and 'metabolite' in index:
+                    for metab in index.values('metabolite'):
+                        if metab.compartment.key == state:
+                            new_metab = shallow_copy(metab)
+                            new_metab.compartment = new
+                            index.replace('metabolite', metab,
+                                          self._from_states('metabolite', new_metab))
+
+                ## reactions hold copies of their substrates and products
+                if component in ['compartment', 'metabolite']:
+                    self._invalidate('metabolite')
+        return self
 
-        ## ensure we don't add compartment with existing key
-        existing = self.get('compartment', compartment.key, by='key')
-        if existing != []:
-            raise errors.AlreadyExistsError(
-                'Model already contains compartment '
-                'with key: "{}"'.format(compartment.key)
-            )
+    def _from_states(self, component, obj):
+        """
+        For Developers
 
-        if 'compartments' in self.__dict__:
-            del self.__dict__['compartments']
+        Copy of obj with the values that are
+        derived from :py:attr:`Model._states` updated
 
-        ## if ListOfCompartment tag not exist, create
-        comp_tag = '{http://www.copasi.org/static/schema}ListOfCompartments'
-        mod_tag = '{http://www.copasi.org/static/schema}Model'
-        miriam = r'{http://www.copasi.org/static/schema}MiriamAnnotation'
+        :param component:
+            `str`. compartment, metabolite or global_quantity
 
-        if self.xml.find(mod_tag).find(comp_tag) is None:
-            new_comp = etree.Element('{http://www.copasi.org/static/schema}ListOfCompartments')
-            for i in range(len(self.xml.find(mod_tag))):
-                if self.xml.find(mod_tag)[i].tag == miriam :
-                    miriam_index = i
+        :param obj:
+            The model component
 
-            self.xml.find(mod_tag).insert(miriam_index+1, new_comp)
+        :return:
+            A copy of obj
+        """
+        new = shallow_copy(obj)
+        value = self._states[obj.key]
+        if component == 'compartment':
+            new.initial_value = float(value)
 
-        for i in self.xml.iter():
-            if i.tag == '{http://www.copasi.org/static/schema}ListOfCompartments':
-                i.append(compartment.to_xml())
+        elif component == 'metabolite':
+            new.particle_numbers = str(value)
+            new.concentration = self.convert_particles_to_molar(
+                new.particle_numbers, self.quantity_unit, new.compartment.initial_value)
 
-        ## add compartment to state template
-        self.add_state(compartment.key, compartment.initial_value)
-        return self
+        elif component == 'global_quantity':
+            new.initial_value = str(value)
+        return new
 
-    def remove_compartment(self, value, by='name'):
+    @staticmethod
+    def _dependencies():
         """
-        Remove a compartment with the attribute given
-        as the 'by' and value arguments
+        For Developers
 
-        :param value:
-            `str`. Value of attribute to match i.e. 'Nucleus'
-
-        :param by:
-            `str` which attribute to match i.e. 'name' or 'key'
+        The components which are built from other components
+        and so must be read again when those change or
+        are removed.
 
         :return:
-            :py:class:`Model`
+            `dict`. dict[component] = list of dependent components
         """
-        ## get the compartment
-        comp = self.get('compartment', value, by=by)
+        return {'compartment': ['metabolite'],
+                'metabolite': ['reaction'],
+                'function': ['reaction'],
+                'local_parameter': ['reaction']}
 
+    def _invalidate(self, component):
+        """
+        For Developers
 
-        if comp == []:
-            raise errors.ComponentDoesNotExistError('Component with {}={} does not exist'.format(by, value))
+        Forget the components which depend on `component`
+        so they are read from the xml when next needed.
+        `component` itself is left in the index.
 
-        ## first remove compartment from list of compartments
-        for i in self.xml.iter():
-            if i.tag == '{http://www.copasi.org/static/schema}ListOfCompartments':
-                for j in i:
-                    if j.attrib[by] == value:
-                        j.getparent().remove(j)
+        :param component:
+            `str`. One of :py:meth:`Model._model_components`
 
-        ## then remove from state template and initial state
-        self.remove_state(comp.key)
-        if 'compartments' in self.__dict__:
-            del self.__dict__['compartments']
+        :return:
+            :py:class:`Model`
+        """
+        for dependent in self._dependencies().get(component, []):
+            self._component_index.discard(dependent)
+            self._invalidate(dependent)
         return self
 
-    @property
-    def all_variable_names(self):
+    ## object CN of each type of fit item. The name of the fitted
+    ## component is captured, local parameters as reaction then parameter
+    _fit_item_patterns = [
+        ('local_parameter', re.compile(r'Reactions\[(.*)\].*Parameter=(.*),Reference=Value$')),
+        ('global_quantity', re.compile(r'Values\[(.*)\],Reference=InitialValue$')),
+        ('metabolite', re.compile(r'Metabolites\[(.*)\],Reference=Initial(?:Concentration|ParticleNumber)$')),
+        ('compartment', re.compile(r'Compartments\[(.*)\],Reference=InitialVolume$')),
+    ]
+
+    def _fit_item_elements(self):
         """
-        The names of all compartments, metabolites, global quantities,
-        reactions and local parameters in the model.
+        For Developers
+
+        The FitItem elements of the parameter estimation task. A copy
+        of a model reads them from its shared snapshot of the xml.
 
         :return:
-            `list`. Each element is `str`
+            `list` of :py:class:`etree._Element`
         """
-        ##first delete from cache
-        m = [i.name for i in self.metabolites]
-        g = [i.name for i in self.global_quantities]
-        l = [i.global_name for i in self.local_parameters]
-        c = [i.name for i in self.compartments]
-        return m + g + l + c
+        xml = self._xml if self._xml is not None else self._template
+        return xpaths.FIT_ITEMS(xml)
 
-    @cached_property
-    def local_parameters(self):
+    def _fit_items_from_xml(self, elements):
         """
-        Get local parameters in model. local_parameters are
-        those which are actively used in reactions and do not have
-        a global variable assigned to them. The constant property
-        returns all local parameters regardless of simulation type
-        (fixed or assignment)
+        For Developers
+
+        Parse FitItem elements
+
+        :param elements:
+            `list`. Output from :py:meth:`Model._fit_item_elements`
 
         :return:
-            `list`. Each element is :py:class:`LocalParameter`
+            :py:class:`pandas.DataFrame`. See :py:attr:`Model.fit_items`
+        """
+        def number(value):
+            try:
+                return float(value)
+            except (TypeError, ValueError):
+                return value
+
+        names = []
+        rows = []
+        for element in elements:
+            parameters = dict((i.attrib.get('name'), i.attrib.get('value')) for i in element)
+            cn = parameters.get('ObjectCN')
+            if cn is None:
+                continue
+            for component, pattern in self._fit_item_patterns:
+                match = pattern.search(cn)
+                if match is not None:
+                    break
+            else:
+                continue
+            if component == 'local_parameter':
+                names.append('({}).{}'.format(*match.groups()))
+            else:
+                names.append(match.group(1))
+            rows.append((component,
+                         number(parameters.get('LowerBound')),
+                         number(parameters.get('UpperBound')),
+                         number(parameters.get('StartValue')),
+                         cn))
+        return pandas.DataFrame(rows, index=pandas.Index(names, name='name'),
+                                columns=['type', 'lower_bound', 'upper_bound',
+                                         'start_value', 'cn'])
+
+    def _fit_item_table(self):
+        """
+        For Developers
+
+        The cached :py:attr:`Model.fit_items`. Fit items are parsed
+        once and read again only when items are added to or
+        removed from the task.
+
+        :return:
+            :py:class:`pandas.DataFrame`
+        """
+        elements = self._fit_item_elements()
+        cached = self.__dict__.get('_fit_items')
+        ## elements are compared by identity
+        if cached is None or cached[0] != elements:
+            cached = (elements, self._fit_items_from_xml(elements))
+            self._fit_items = cached
+        return cached[1]
+
+    def _remove_fit_items(self, cns):
+        """
+        For Developers
+
+        Remove fit items from the parameter estimation
+        task in a single pass
+
+        :param cns:
+            iterable of `str`. Object references (the cn column
+            of :py:attr:`Model.fit_items`) of the items to remove
+
+        :return:
+            :py:class:`Model`
+        """
+        cns = set(cns)
+        for i in xpaths.FIT_ITEMS(self.xml):
+            for j in i:
+                if j.attrib.get('name') == 'ObjectCN' and j.attrib.get('value') in cns:
+                    i.getparent().remove(i)
+                    break
+        return self
+
+    @property
+    def fit_items(self):
+        """
+        The parameters being fitted, in the order they
+        appear in the parameter estimation task.
+
+        :return:
+            :py:class:`pandas.DataFrame`. Indexed by name with
+            columns type, lower_bound, upper_bound, start_value
+            and cn (the object reference of the item)
+        """
+        return self._fit_item_table().copy()
+
+    @property
+    def fit_item_order(self):
+        """
+        Get names of parameters being fitted in the
+        order they appear
+
+        :return:
+            `list`
+        """
+        return list(self._fit_item_table().index)
+
+    def add_state(self, state, value):
+        """
+        Append state on to end of state template.
+        Used within add_metabolite and add_global_quantity. Shouldn't
+        need to use manually
+
+        :param state:
+            `str`. A valid key
+
+        :param value:
+            `int`, `float`. Value for state
+
+        :return:
+        """
+        ## an existing state only has its value changed
+        if state not in self._states:
+            element = etree.Element('{http://www.copasi.org/static/schema}StateTemplateVariable', attrib={'objectReference': state})
+            state_template, initial_state = self._state_elements()
+            state_template.append(element)
+        self._states.append(state, float(value))
+        self._states_modified = True
+        return self
+
+    def remove_state(self, state):
+        """
+        Remove state from StateTemplate and
+        InitialState fields. USed for deleting metabolites
+        and global quantities.
+
+        :param state:
+            `str`. key of state to remove (i.e. Metabolite_1)
+
+        :return:
+            :py:class:`Model`
+        """
+        state_template, initial_state = self._state_elements()
+        element = None
+        ## the template is in the same order as the states
+        if state in self._states:
+            try:
+                element = state_template[self._states.positions(state)]
+            except IndexError:
+                pass
+
+        if element is None or element.get('objectReference') != state:
+            element = None
+            for j in state_template:
+                if j.get('objectReference') == state:
+                    element = j
+                    break
+
+        if element is not None:
+            state_template.remove(element)
+        self._states.pop(state, None)
+        self._states_modified = True
+        return self
+
+    def add_states(self, states, values):
+        """
+        Append several states to the end of the state
+        template in one operation. Used by :py:meth:`Model.add_many`
+
+        :param states:
+            `list`. Valid keys
+
+        :param values:
+            `list`. Value for each state
+
+        :return:
+            :py:class:`Model`
+        """
+        state_template, initial_state = self._state_elements()
+        state_template.extend([
+            etree.Element(xpaths.tag('StateTemplateVariable'), attrib={'objectReference': i})
+            for i in OrderedDict.fromkeys(states) if i not in self._states
+        ])
+        self._states.extend(states, [float(i) for i in values])
+        self._states_modified = True
+        return self
+
+    def remove_states(self, states):
+        """
+        Remove several states from the StateTemplate and
+        InitialState fields in a single pass. Used by
+        :py:meth:`Model.remove_many`
+
+        :param states:
+            `list` or `set`. Keys of states to remove
+
+        :return:
+            :py:class:`Model`
+        """
+        states = set(states)
+        state_template, initial_state = self._state_elements()
+        for j in list(state_template):
+            if j.get('objectReference') in states:
+                state_template.remove(j)
+
+        self._states.remove(states)
+        self._states_modified = True
+        return self
+
+    @property
+    def compartments(self):
+        """
+        Get list of model compartments
+
+        :return:
+            `list`. Each element is :py:class:`Compartment`
+        """
+        return self._get_index('compartment').values('compartment')
+
+    def _compartment_from_xml(self, element, states):
+        """
+        For Developers
+
+        Build a :py:class:`Compartment` from its xml element
+
+        :param element:
+            :py:class:`etree._Element`. A `Compartment` element
+
+        :param states:
+            :py:class:`States`. Output from :py:attr:`Model.states`
+
+        :return:
+            :py:class:`Compartment`
+        """
+        return Compartment(self,
+                           key=element.attrib['key'],
+                           name=element.attrib['name'],
+                           simulation_type=element.attrib['simulationType'],
+                           initial_value=float(states[element.attrib['key']]))
+
+    def add_compartment(self, compartment):
+        """
+        Add compartment to model
+
+        :param compartment:
+            :py:class:`Compartment`
+
+        :return:
+            :py:class:`Model`
         """
-        # if 'local_parameters' in self.__dict__:
-        #     del self.__dict__['local_parameters']
+        if isinstance(compartment, str):
+            compartment = Compartment(self, compartment)
+
+        if not isinstance(compartment, Compartment):
+            raise errors.InputError(
+                'Expecting "{}" but '
+                'got "{}" instead'.format('Compartment', type(compartment))
+            )
+
+        ## ensure we don't add compartment with existing name
+        existing = self.get('compartment', compartment.name, by='name')
+        if existing != []:
+            LOG.info(
+                'Model already contains compartment '
+                'with name: "{}". Skipping'.format(compartment.name)
+            )
+            return self
 
+        ## ensure we don't add compartment with existing key
+        existing = self.get('compartment', compartment.key, by='key')
+        if existing != []:
+            raise errors.AlreadyExistsError(
+                'Model already contains compartment '
+                'with key: "{}"'.format(compartment.key)
+            )
+
+        ## if ListOfCompartment tag not exist, create
+        compartment_element = compartment.to_xml()
+        self._model_section('ListOfCompartments', 'MiriamAnnotation').append(compartment_element)
+
+        ## add compartment to state template
+        self.add_state(compartment.key, compartment.initial_value)
+        self._index_element('compartment', compartment_element)
+        return self
+
+    def remove_compartment(self, value, by='name'):
+        """
+        Remove a compartment with the attribute given
+        as the 'by' and value arguments
+
+        :param value:
+            `str`. Value of attribute to match i.e. 'Nucleus'
+
+        :param by:
+            `str` which attribute to match i.e. 'name' or 'key'
+
+        :return:
+            :py:class:`Model`
+        """
+        ## get the compartment
+        comp = self.get('compartment', value, by=by)
+
+
+        if comp == []:
+            raise errors.ComponentDoesNotExistError('Component with {}={} does not exist'.format(by, value))
+
+        ## first remove compartment from list of compartments
+        for j in self._section('ListOfCompartments'):
+            if j.attrib[by] == value:
+                j.getparent().remove(j)
+
+        ## then remove from state template and initial state
+        self.remove_state(comp.key)
+        self._component_index.remove('compartment', comp)
+        self._invalidate('compartment')
+        return self
+
+    @property
+    def all_variable_names(self):
+        """
+        The names of all compartments, metabolites, global quantities,
+        reactions and local parameters in the model.
+
+        :return:
+            `list`. Each element is `str`
+        """
+        return list(self._quantity_table()['name'])
+
+    @staticmethod
+    def _local_parameter_elements(xml):
+        """
+        For Developers
+
+        Find the elements which hold the value of each local
+        parameter in a single pass. The value is held by the
+        `Constant` of the reaction and by the kinetic parameters
+        of every parameter set.
+
+        :param xml:
+            :py:class:`etree._Element`. The xml to search, i.e.
+            :py:attr:`Model.xml`
+
+        :return:
+            `dict`. dict[global_name] = list of :py:class:`etree._Element`
+        """
+        dct = {}
+        for reaction in xml.find(xpaths.tag('Model')).iterfind(
+                '{}/{}'.format(xpaths.tag('ListOfReactions'), xpaths.tag('Reaction'))):
+            for constant in reaction.iterfind(
+                    '{}/{}'.format(xpaths.tag('ListOfConstants'), xpaths.tag('Constant'))):
+                global_name = "({}).{}".format(reaction.attrib['name'], constant.attrib['name'])
+                dct.setdefault(global_name, []).append(constant)
+
+        for group in xpaths.KINETIC_PARAMETERS(xml):
+            for reaction in group:
+                for parameter in reaction:
+                    reaction_name, parameter_name = re.findall(
+                        '.*Reactions\[(.*)\].*Parameter=(.*)', parameter.attrib['cn'])[0]
+                    global_name = "({}).{}".format(reaction_name, parameter_name)
+                    dct.setdefault(global_name, []).append(parameter)
+        return dct
+
+    @property
+    def local_parameters(self):
+        """
+        Get local parameters in model. local_parameters are
+        those which are actively used in reactions and do not have
+        a global variable assigned to them. The constant property
+        returns all local parameters regardless of simulation type
+        (fixed or assignment)
+
+        :return:
+            `list`. Each element is :py:class:`LocalParameter`
+        """
         loc = self.constants
 
         ## We don't want to consider parameters tahat have already been assigned
@@ -903,20 +1572,14 @@ class Model(_base._Base):
         :return:
             :py:class:`Model`
         """
-        ## remove frome cache
-        if 'local_parameters' in self.__dict__:
-            del self.__dict__['local_parameters']
-
         ## do not add if already exists
-        if local_parameter.global_name in [i.global_name for i in self.local_parameters]:
+        existing = self._get_index('local_parameter').get(
+            'local_parameter', local_parameter.global_name, by='global_name')
+        if [i for i in existing if i.simulation_type != 'assignment'] != []:
             return self
 
-        query = '//*[@cn="String=Kinetic Parameters"]'
-        for i in self.xml.xpath(query):
+        for i in xpaths.KINETIC_PARAMETERS(self.xml):
             i.append(local_parameter.to_xml())
-
-        # self.refresh()
-        # print self.refresh().local_parameters
         return self
 
     @staticmethod
@@ -1021,35 +1684,41 @@ class Model(_base._Base):
             molarity = float(particles)
         return particles
 
-    @cached_property
+    @property
     def metabolites(self):
         """
         :return:
             `list`. Each element is :py:class:`Metabolite`
         """
-        metabs = {}
-        for i in self.xml.iter():
-            if i.tag == '{http://www.copasi.org/static/schema}ListOfMetabolites':
-                for j in i:
-                    metabs[j.attrib['key']] = j.attrib
+        return self._get_index('metabolite').values('metabolite')
 
-        for key, value in self.states.items():
-            if key in metabs.keys():
-                metabs[key]['particle_numbers'] = str(value)
+    def _metabolite_from_xml(self, element, states, quantity_unit):
+        """
+        For Developers
 
+        Build a :py:class:`Metabolite` from its xml element
 
-        lst = []
-        for key in metabs:
-            comp = self.get('compartment', metabs[key]['compartment'], 'key')
-            lst.append(Metabolite(self, name=metabs[key]['name'],
-                                  compartment=comp,
-                                  key=metabs[key]['key'],
-                                  particle_numbers=metabs[key]['particle_numbers'],
-                                  concentration=self.convert_particles_to_molar(
-                                      metabs[key]['particle_numbers'], self.quantity_unit, comp.initial_value),
-                                  simulation_type=metabs[key]['simulationType']))
+        :param element:
+            :py:class:`etree._Element`. A `Metabolite` element
 
-        return lst
+        :param states:
+            :py:class:`States`. Output from :py:attr:`Model.states`
+
+        :param quantity_unit:
+            `str`. Output from :py:attr:`Model.quantity_unit`
+
+        :return:
+            :py:class:`Metabolite`
+        """
+        comp = self.get('compartment', element.attrib['compartment'], 'key')
+        particle_numbers = str(states[element.attrib['key']])
+        return Metabolite(self, name=element.attrib['name'],
+                          compartment=comp,
+                          key=element.attrib['key'],
+                          particle_numbers=particle_numbers,
+                          concentration=self.convert_particles_to_molar(
+                              particle_numbers, quantity_unit, comp.initial_value),
+                          simulation_type=element.attrib['simulationType'])
 
     def add_metabolite(self, metab):
         """
@@ -1072,43 +1741,21 @@ class Model(_base._Base):
 
         ## If metab is str convert to Metabolite
         ## with default parameters
-        ## This must occur before deleting
-        ## the metabolites cache
         if isinstance(metab, str):
             metab = Metabolite(self, metab)
 
-        if 'metabolites' in self.__dict__:
-            del self.__dict__['metabolites']
-
         if not isinstance(metab, Metabolite):
             raise errors.InputError('Input must be Metabolite class')
 
-        ## if ListOfCompartment tag not exist, create
-        m = '{http://www.copasi.org/static/schema}ListOfMetabolites'
-        mod_tag = '{http://www.copasi.org/static/schema}Model'
-        comp = r'{http://www.copasi.org/static/schema}ListOfCompartments'
-
-        if self.xml.find(mod_tag).find(m) is None:
-            new_m = etree.Element('{http://www.copasi.org/static/schema}ListOfMetabolites')
-            for i in range(len(self.xml.find(mod_tag))):
-                if self.xml.find(mod_tag)[i].tag == comp:
-                    miriam_index = i
-
-            self.xml.find(mod_tag).insert(miriam_index + 1, new_m)
-
         metabolite_element = metab.to_xml()
-        ## add the metabolute to list of metabolites
-        list_of_metabolites = '{http://www.copasi.org/static/schema}ListOfMetabolites'
-        for i in self.xml.iter():
-            if i.tag == list_of_metabolites:
-                i.append(metabolite_element)
+        ## add the metabolute to list of metabolites, creating it if needed
+        self._model_section('ListOfMetabolites', 'ListOfCompartments').append(metabolite_element)
 
         ## add metabolite to state_template and initial state fields
         self.add_state(metab.key, metab.particle_numbers)
 
-        ## call the metabolites property again
-        ## to reset the cache
-        self.metabolites
+        ## read the new metabolite back into the index
+        self._index_element('metabolite', metabolite_element)
         return self
 
 
@@ -1132,21 +1779,15 @@ class Model(_base._Base):
             ## Remove metabolites with initial concentration of 0
             >>> model.remove_metabolite(0, by='concentration')
         """
-        list_of_metabolites = '{http://www.copasi.org/static/schema}ListOfMetabolites'
-
         metab = self.get('metabolite', value, by=by)
         if metab == []:
             raise TypeError('No metab with "{}" attribute == "{}" exists'.format(by, value))
-        for i in self.xml.iter():
-            if i.tag == list_of_metabolites:
-                for j in i:
-                    if j.attrib[by] == value:
-                        j.getparent().remove(j)
+        for j in self._section('ListOfMetabolites'):
+            if j.attrib[by] == value:
+                j.getparent().remove(j)
         self.remove_state(metab.key)
-
-        ## remove cached
-        if 'metabolites' in self.__dict__:
-            del self.__dict__['metabolites']
+        self._component_index.remove('metabolite', metab)
+        self._invalidate('metabolite')
         return self
 
     def add_global_quantity(self, global_quantity):
@@ -1180,57 +1821,43 @@ class Model(_base._Base):
             )
             return self
 
-        if 'global_quantities' in self.__dict__:
-            del self.__dict__['global_quantities']
-
-        ## if ListOfCompartment tag not exist, create
-        m = '{http://www.copasi.org/static/schema}ListOfModelValues'
-        mod_tag = '{http://www.copasi.org/static/schema}Model'
-        comp = r'{http://www.copasi.org/static/schema}ListOfCompartments'
-        idx = 0
-        if self.xml.find(mod_tag).find(m) is None:
-            new_m = etree.Element(m)
-            for i in range(len(self.xml.find(mod_tag))):
-                if self.xml.find(mod_tag)[i].tag == comp:
-                    idx = i
-
-            self.xml.find(mod_tag).insert(idx + 1, new_m)
-
-
+        ## if ListOfModelValues tag not exist, create
         model_value = global_quantity.to_xml()
-        for i in self.xml.iter():
-            if i.tag == '{http://www.copasi.org/static/schema}ListOfModelValues':
-                i.append(model_value)
+        self._model_section('ListOfModelValues', 'ListOfCompartments').append(model_value)
 
         self.add_state(global_quantity.key, global_quantity.initial_value)
 
-        self.global_quantities
+        self._index_element('global_quantity', model_value)
         return self
 
-    @cached_property
+    @property
     def global_quantities(self):
         """
 
         :return:
             `list` each element is :py:class:`GlobalQuantity`
         """
-        model_values = {}
-        for i in self.xml.iter():
-            if i.tag == '{http://www.copasi.org/static/schema}ListOfModelValues':
-                for j in i:
-                    model_values[j.attrib['key']] = j.attrib
+        return self._get_index('global_quantity').values('global_quantity')
 
-        for key, value in self.states.items():
-            if key in model_values.keys():
-                model_values[key]['initial_value'] = str(value)
+    def _global_quantity_from_xml(self, element, states):
+        """
+        For Developers
 
-        lst = []
-        for key in model_values:
-            lst.append(GlobalQuantity(self, name=model_values[key]['name'],
-                                      key=model_values[key]['key'],
-                                      simulation_type=model_values[key]['simulationType'],
-                                      initial_value=model_values[key]['initial_value']))
-        return lst
+        Build a :py:class:`GlobalQuantity` from its xml element
+
+        :param element:
+            :py:class:`etree._Element`. A `ModelValue` element
+
+        :param states:
+            :py:class:`States`. Output from :py:attr:`Model.states`
+
+        :return:
+            :py:class:`GlobalQuantity`
+        """
+        return GlobalQuantity(self, name=element.attrib['name'],
+                              key=element.attrib['key'],
+                              simulation_type=element.attrib['simulationType'],
+                              initial_value=str(states[element.attrib['key']]))
 
     def remove_global_quantity(self, value, by='name'):
         """
@@ -1250,54 +1877,55 @@ class Model(_base._Base):
                                 value,
                                 by)
 
-        ##remove cached
-        del self.__dict__['global_quantities']
-
-        for i in self.xml.iter():
-            if i.tag == '{http://www.copasi.org/static/schema}ListOfModelValues':
-                for j in i:
-                    if j.attrib[by] == value:
-                        j.getparent().remove(j)
+        for j in self._section('ListOfModelValues'):
+            if j.attrib[by] == value:
+                j.getparent().remove(j)
 
         self.remove_state(global_value.key)
+        self._component_index.remove('global_quantity', global_value)
         return self
 
-    @cached_property
+    @property
     def functions(self):
         """
         get model functions
         :return:
             `list` each element a `py:class:`Function`
         """
-        lst = []
-        for element in self.xml.iter():
-            if element.tag == '{http://www.copasi.org/static/schema}ListOfFunctions':
-                for child in list(element):
-                    name = child.attrib['name']
-                    key = child.attrib['key']
-                    type = child.attrib['type']
-                    reversible = child.attrib['reversible']
-                    list_of_parameter_descriptions = []
-                    for grandchild in child:
-                        if grandchild.tag == '{http://www.copasi.org/static/schema}Expression':
-                            expression = grandchild.text.replace('\n', '').strip()
-
-                        if grandchild.tag == '{http://www.copasi.org/static/schema}ListOfParameterDescriptions':
-                            for greatgrandchild in grandchild:
-                                list_of_parameter_descriptions.append(
-                                    ParameterDescription(self,
-                                                         name=greatgrandchild.attrib['name'],
-                                                         key=greatgrandchild.attrib['key'],
-                                                         order=greatgrandchild.attrib['order'],
-                                                         role=greatgrandchild.attrib['role']) )
-                    lst.append(Function(self,
-                                        name=name,
-                                        key=key,
-                                        type=type,
-                                        expression=expression,
-                                        reversible=reversible,
-                                        list_of_parameter_descriptions=list_of_parameter_descriptions))
-        return lst
+        return self._get_index('function').values('function')
+
+    def _function_from_xml(self, element):
+        """
+        For Developers
+
+        Build a :py:class:`Function` from its xml element
+
+        :param element:
+            :py:class:`etree._Element`. A `Function` element
+
+        :return:
+            :py:class:`Function`
+        """
+        list_of_parameter_descriptions = []
+        for child in element:
+            if child.tag == '{http://www.copasi.org/static/schema}Expression':
+                expression = child.text.replace('\n', '').strip()
+
+            if child.tag == '{http://www.copasi.org/static/schema}ListOfParameterDescriptions':
+                for grandchild in child:
+                    list_of_parameter_descriptions.append(
+                        ParameterDescription(self,
+                                             name=grandchild.attrib['name'],
+                                             key=grandchild.attrib['key'],
+                                             order=grandchild.attrib['order'],
+                                             role=grandchild.attrib['role']) )
+        return Function(self,
+                        name=element.attrib['name'],
+                        key=element.attrib['key'],
+                        type=element.attrib['type'],
+                        expression=expression,
+                        reversible=element.attrib['reversible'],
+                        list_of_parameter_descriptions=list_of_parameter_descriptions)
 
     @property
     def parameter_descriptions(self):
@@ -1307,13 +1935,12 @@ class Model(_base._Base):
             `list`. Each element a :py:class:`ParameterDescription`
         """
         lst = []
-        for i in self.xml.iter():
-            if i.tag == '{http://www.copasi.org/static/schema}ParameterDescription':
-                lst.append(ParameterDescription(self,
-                                                name=i.attrib['name'],
-                                                key=i.attrib['key'],
-                                                order=i.attrib['order'],
-                                                role=i.attrib['role'] ) )
+        for i in xpaths.PARAMETER_DESCRIPTIONS(self.xml):
+            lst.append(ParameterDescription(self,
+                                            name=i.attrib['name'],
+                                            key=i.attrib['key'],
+                                            order=i.attrib['order'],
+                                            role=i.attrib['role'] ) )
         return lst
 
 
@@ -1340,18 +1967,16 @@ class Model(_base._Base):
             function.reversible = 'false'
 
         ## If ListOfFunctions element not exist, create
-        m = '{http://www.copasi.org/static/schema}ListOfFunctions'
-        if self.xml.find(m) is None:
-            self.xml.insert(0, etree.Element(m))
+        if self.sections['ListOfFunctions'] is None:
+            self.xml.insert(0, etree.Element(xpaths.tag('ListOfFunctions')))
 
         ## add the function to list of functions
-        if function.key in [i.key for i in self.functions]:
+        if self.get('function', function.key, by='key') != []:
             return self
 
-        for i in self.xml.iter():
-            if i.tag == '{http://www.copasi.org/static/schema}ListOfFunctions':
-                i.append(function.to_xml())
-        del self.__dict__['functions']
+        function_element = function.to_xml()
+        self.sections['ListOfFunctions'].append(function_element)
+        self._index_element('function', function_element)
         return self
 
     def remove_function(self, value, by='name'):
@@ -1367,11 +1992,16 @@ class Model(_base._Base):
         :return:
             :py:class:`model.Model`
         """
-        for i in self.xml.iter():
-            if i.tag == '{http://www.copasi.org/static/schema}ListOfFunctions':
-                for j in i:
-                    if j.attrib[by] == value:
-                        j.getparent().remove(j)
+        for j in self._section('ListOfFunctions'):
+            if j.attrib[by] == value:
+                j.getparent().remove(j)
+
+        function = self.get('function', value, by=by)
+        if not isinstance(function, list):
+            function = [function]
+        for i in function:
+            self._component_index.remove('function', i)
+        self._invalidate('function')
         return self
 
     @property
@@ -1380,14 +2010,9 @@ class Model(_base._Base):
         :return:
             `int` number of reactions
         """
-        count = 0
-        for i in self.xml.iter():
-            if i.tag == '{http://www.copasi.org/static/schema}ListOfReactions':
-                for j in list(i):
-                    count = count + 1
-        return count
+        return len(self._section('ListOfReactions'))
 
-    @cached_property
+    @property
     def constants(self):
         """
         Get list of constants from xml attribute
@@ -1395,11 +2020,21 @@ class Model(_base._Base):
         :return:
             `list` each element :py:class:`LocalParameter`
         """
-        if 'constants' in self.__dict__:
-            del self.__dict__['keys']
-        query = '//*[@cn="String=Kinetic Parameters"]'
+        return self._get_index('local_parameter').values('local_parameter')
+
+    def _read_constants(self):
+        """
+        For Developers
+
+        Read the local parameters of all reactions
+        from the `ListOfReactions` and the kinetic
+        parameters of the parameter set
+
+        :return:
+            `list` each element :py:class:`LocalParameter`
+        """
         dct = {}
-        for i in self.xml.xpath(query):
+        for i in xpaths.KINETIC_PARAMETERS(self.xml):
             for j in i:
                 for k in j:
                     reaction_name, parameter_name = re.findall('.*Reactions\[(.*)\].*Parameter=(.*)', k.attrib['cn'])[0]
@@ -1413,175 +2048,186 @@ class Model(_base._Base):
                     dct[global_name]['simulation_type'] = simulation_type
 
         res = []
-        for i in self.xml.iter():
-            if i.tag == '{http://www.copasi.org/static/schema}ListOfReactions':
-                for j in i:
-                    reaction_name = j.attrib['name']
-                    for k in j:
-                        for l in k:
-                            if l.tag == '{http://www.copasi.org/static/schema}Constant':
-                                parameter_name = l.attrib['name']
-                                global_name = "({}).{}".format(reaction_name, parameter_name)
-                                parameter_key = l.attrib['key']
-                                loc = LocalParameter(self,
-                                                     name=dct[global_name]['parameter_name'],
-                                                     value=dct[global_name]['value'],
-                                                     key=parameter_key,
-                                                     reaction_name=dct[global_name]['reaction_name'],
-                                                     global_name=global_name,
-                                                     simulation_type=dct[global_name]['simulation_type']
-                                                     )
-                                res.append(loc)
+        for j in self._section('ListOfReactions'):
+            reaction_name = j.attrib['name']
+            for k in j:
+                for l in k:
+                    if l.tag == '{http://www.copasi.org/static/schema}Constant':
+                        parameter_name = l.attrib['name']
+                        global_name = "({}).{}".format(reaction_name, parameter_name)
+                        parameter_key = l.attrib['key']
+                        loc = LocalParameter(self,
+                                             name=dct[global_name]['parameter_name'],
+                                             value=dct[global_name]['value'],
+                                             key=parameter_key,
+                                             reaction_name=dct[global_name]['reaction_name'],
+                                             global_name=global_name,
+                                             simulation_type=dct[global_name]['simulation_type']
+                                             )
+                        res.append(loc)
 
         return res
 
-    @cached_property
+    @property
     def reactions(self):
         """
         assemble a list of reactions
         :return:
             `list` each element a :py:class:`Reaction`
         """
-        ## make sure list of reaction tag exists befor continuing
-        exist = False
-        for i in self.xml.iter():
-            if i.tag == '{http://www.copasi.org/static/schema}ListOfReactions':
-                exist = True
+        return self._get_index('reaction').values('reaction')
+
+    def _read_reactions(self):
+        """
+        For Developers
+
+        Read the reactions from the `ListOfReactions` in
+        a single pass. Metabolites, functions and local
+        parameters referenced by each reaction are resolved
+        through maps built once up front so the cost of
+        reading is linear in the size of the model.
+
+        :return:
+            `list` each element a :py:class:`Reaction`
+        """
+        reactions = self._section('ListOfReactions')
+        ## return empty list when no reactions are in model
+        if reactions == []:
+            return []
+
+        metabolites = {i.key: i for i in self.metabolites}
+        functions = {i.key: i for i in self.functions}
+        constants = {i.global_name: i for i in self.constants}
+
+        lst = []
+        for j in reactions:
+            lst.append(self._reaction_from_xml(j, metabolites, functions, constants))
+        return lst
+
+    def _reaction_from_xml(self, element, metabolites, functions, constants):
+        """
+        For Developers
+
+        Build a :py:class:`Reaction` from its xml element
+
+        :param element:
+            :py:class:`etree._Element`. A `Reaction` element
 
-        if exist == False:
-            return []
+        :param metabolites:
+            `dict`. Metabolite key to :py:class:`Metabolite`
 
-        reaction_count = 0
-        reactions_dict = {}
-        for i in self.xml.iter():
-            if i.tag == '{http://www.copasi.org/static/schema}ListOfReactions':
-                for j in list(i):
-                    reaction_count += 1
-                    reactions_dict[reaction_count] = {}
-                    ##defaults
-                    reactions_dict[reaction_count]['reversible'] = 'false'
-                    ## sometimes these are not being updated
-                    reactions_dict[reaction_count]['substrates'] = []
-                    reactions_dict[reaction_count]['products'] = []
-                    reactions_dict[reaction_count]['modifiers'] = []
-                    reactions_dict[reaction_count]['constants'] = []
-                    reactions_dict[reaction_count]['function'] = []
-                    for k in list(j):
-                        reactions_dict[reaction_count]['reversible'] = j.attrib['reversible']
-                        reactions_dict[reaction_count]['name'] = j.attrib['name']
-                        reactions_dict[reaction_count]['key'] = j.attrib['key']
-                        if k.tag == '{http://www.copasi.org/static/schema}ListOfSubstrates':
-                            list_of_substrates = []
-                            for l in list(k):
-                                substrate = self.get('metabolite', l.attrib['metabolite'], by='key')
-                                if isinstance(substrate, list):
-                                    raise errors.SomethingWentHorriblyWrongError('substrate matched >1 substrate')
-                                ##convert to substrate
-                                substrate = substrate.to_substrate()
-                                list_of_substrates.append(substrate)
-                            reactions_dict[reaction_count]['substrates'] = list_of_substrates
-
-                        elif k.tag == '{http://www.copasi.org/static/schema}ListOfProducts':
-                            list_of_products = []
-                            for l in list(k):
-                                ## get list of metabolites and convert them to Product class
-                                product = self.get('metabolite', l.attrib['metabolite'], by='key')
-                                product = product.to_product()
-                                list_of_products.append(product)
-                                reactions_dict[reaction_count]['products'] = list_of_products
-
-                        elif k.tag == '{http://www.copasi.org/static/schema}ListOfModifiers':
-                            list_of_modifiers = []
-                            for l in list(k):
-                                ## get list of metabolites and convert them to Moifier class
-                                modifier = self.get('metabolite', l.attrib['metabolite'], by='key')
-                                modifier = modifier.to_product()
-                                list_of_modifiers.append(modifier)
-                                reactions_dict[reaction_count]['modifiers'] = list_of_modifiers
-
-                        elif k.tag == '{http://www.copasi.org/static/schema}ListOfConstants':
-                            list_of_constants = []
-
-                            ##assertain the parameters simulation type
-                            for l in list(k):
-                                global_name = "({}).{}".format(j.attrib['name'], l.attrib['name'])
-                                #LOG.warning('Experimental section of reactions function')
-                                constant = self.get('local_parameter', global_name, by='global_name')
-                                list_of_constants.append(constant)
-
-                        elif k.tag == '{http://www.copasi.org/static/schema}KineticLaw':
-                            function = self.get('function', k.attrib['function'], by='key')
-                            reactions_dict[reaction_count]['function'] = function
+        :param functions:
+            `dict`. Function key to :py:class:`Function`
 
-        ## assemble the expression for the reaction
-        #LOG.warning('move below code to separate function for clean code')
-        ## return empty list when no reactions are in model
-        if len(reactions_dict) == 0:
-            return []
+        :param constants:
+            `dict`. Global name to :py:class:`LocalParameter`
 
+        :return:
+            :py:class:`Reaction`
+        """
+        name = element.attrib['name']
+        substrates = []
+        products = []
+        modifiers = []
+        parameters = []
+        function = None
+        for k in element:
+            if k.tag == '{http://www.copasi.org/static/schema}ListOfSubstrates':
+                for l in k:
+                    substrate = metabolites[l.attrib['metabolite']].to_substrate()
+                    substrate.stoichiometry = self._stoichiometry(l)
+                    substrates.append(substrate)
+
+            elif k.tag == '{http://www.copasi.org/static/schema}ListOfProducts':
+                for l in k:
+                    product = metabolites[l.attrib['metabolite']].to_product()
+                    product.stoichiometry = self._stoichiometry(l)
+                    products.append(product)
+
+            elif k.tag == '{http://www.copasi.org/static/schema}ListOfModifiers':
+                for l in k:
+                    modifier = metabolites[l.attrib['metabolite']].to_modifier()
+                    modifier.stoichiometry = 1
+                    modifiers.append(modifier)
+
+            elif k.tag == '{http://www.copasi.org/static/schema}ListOfConstants':
+                for l in k:
+                    global_name = "({}).{}".format(name, l.attrib['name'])
+                    try:
+                        parameters.append(constants[global_name])
+                    except KeyError:
+                        ## the parameter set is updated after the reaction
+                        ## is added so fall back on the constant itself
+                        parameters.append(LocalParameter(self,
+                                                         name=l.attrib['name'],
+                                                         value=l.attrib['value'],
+                                                         key=l.attrib['key'],
+                                                         reaction_name=name,
+                                                         global_name=global_name))
+
+            elif k.tag == '{http://www.copasi.org/static/schema}KineticLaw':
+                function = functions.get(k.attrib['function'])
 
-        for i, dct in reactions_dict.items():
-            ## default constant flux or mass action
-            substrates = [j.name for j in reactions_dict[i]['substrates']]
-            if dct['function'] == []:
-                # if dct['substrates'] == []:
-                #     dct['function'] = "v".format(reduce(lambda x, y: '{}*{}'.format(x, y), products))
-                # else:
-                dct['function'] = "k*{}".format(reduce(lambda x, y: '{}*{}'.format(x, y), substrates))
-            if substrates != []:
-                sub_expression = reduce(lambda x, y: "{} + {}".format(x, y), substrates)
-            else:
-                sub_expression = ''
+        ## assemble the expression for the reaction
+        def join(components):
+            names = []
+            for i in components:
+                if i.stoichiometry == 1:
+                    names.append(i.name)
+                else:
+                    names.append('{}*{}'.format(i.stoichiometry, i.name))
+            return ' + '.join(names)
+
+        if element.attrib['reversible'] == 'true':
+            operator = '='
+        elif element.attrib['reversible'] == 'false':
+            operator = '->'
+        else:
+            raise errors.SomethingWentHorriblyWrongError
+
+        expression = '{} {} {}'.format(join(substrates), operator, join(products))
+        if modifiers != []:
+            expression = '{}; {}'.format(expression, join(modifiers))
+
+        if function is None:
+            ## default to mass action and let the Reaction
+            ## work out its own substrates and parameters
+            return Reaction(self, name=name.strip(),
+                            key=element.attrib['key'],
+                            expression=expression,
+                            rate_law="k*{}".format('*'.join([i.name for i in substrates])),
+                            reversible=element.attrib['reversible'])
+
+        return Reaction(self, name=name.strip(),
+                        key=element.attrib['key'],
+                        expression=expression,
+                        rate_law=function,
+                        reversible=element.attrib['reversible'] == 'true',
+                        substrates=substrates,
+                        products=products,
+                        modifiers=modifiers,
+                        parameters=parameters,
+                        parameters_dict={i.name: i for i in parameters},
+                        translate=False)
 
-            products = [j.name for j in reactions_dict[i]['products']]
-            if products != []:
-                prod_expression = reduce(lambda x, y: "{} + {}".format(x, y), products)
-            else:
-                prod_expression = ''
+    @staticmethod
+    def _stoichiometry(element):
+        """
+        For Developers
 
-            modifiers = [j.name for j in reactions_dict[i]['modifiers']]
-            if modifiers != []:
-                modifier_expression = reduce(lambda x, y: "{} + {}".format(x, y), modifiers)
-            else:
-                modifier_expression = ''
+        Read the stoichiometry of a reaction participant
 
-            if reactions_dict[i]['reversible'] == 'true':
-                operator = '='
-            elif reactions_dict[i]['reversible'] == 'false':
-                operator = '->'
-            else:
-                raise errors.SomethingWentHorriblyWrongError
+        :param element:
+            :py:class:`etree._Element`. A `Substrate` or `Product` element
 
-            if modifier_expression == '':
-                expression = "{} {} {}".format(sub_expression,
-                                               operator,
-                                               prod_expression)
-            else:
-                expression = '{} {} {}; {}'.format(sub_expression, operator,
-                                                   prod_expression, modifier_expression)
-            reactions_dict[i]['expression'] = expression
-
-
-        lst=[]
-
-        for i, dct in reactions_dict.items():
-            ## skip the skipped reactions
-            # if i not in skipped:
-            r = Reaction(self,
-                                name=dct['name'].strip(),
-                                key=dct['key'],
-                                expression=dct['expression'],
-                                rate_law=dct['function'],
-                                reversible=dct['reversible'],
-                                substrates=dct['substrates'],
-                                products=dct['products'],
-                                parameters=dct['constants'],
-                                parameters_dict={j.name: j for j in dct['constants']},
-                                )
-            lst.append(r)
-
-        # self.reset_cache('reactions')
-        return lst
+        :return:
+            `int` when the stoichiometry is a whole number
+            otherwise `float`
+        """
+        stoichiometry = float(element.attrib['stoichiometry'])
+        if stoichiometry.is_integer():
+            return int(stoichiometry)
+        return stoichiometry
 
     def add_reaction(self, reaction, expression=None,
                      rate_law=None):
@@ -1616,21 +2262,17 @@ class Model(_base._Base):
                 'with name: "{}"'.format(reaction.name)
             )
 
-        if reaction.key in [i.key for i in self.reactions]:
+        if self.get('reaction', reaction.key, by='key') != []:
             reaction.key = '{}_{}'.format(
                 reaction.key.split('_')[0],
                 int(reaction.key.split('_')[1])+1
             )
             LOG.info('Model already contains a reaction with the key: {}. Changing key'.format(reaction.key))
 
-        if reaction.name in [i.name for i in self.reactions]:
+        if self.get('reaction', reaction.name, by='name') != []:
             raise errors.ReactionAlreadyExists('Your model already contains a reaction with the name: {}'.format(reaction.name))
 
-        if 'reactions' in self.__dict__:
-            del self.__dict__['reactions']
-
-        existing_functions = [i.name for i in self.functions]
-        if reaction.rate_law.name not in existing_functions:
+        if self.get('function', reaction.rate_law.name, by='name') == []:
             self.add_function(reaction.rate_law)
 
 
@@ -1646,28 +2288,19 @@ class Model(_base._Base):
         #                 'and should be added separetly')
         #     reaction.rate_law = existing_function
 
+        ## local parameters are read from both the reaction and the parameter
+        ## set so make sure they are indexed before the reaction is added
+        self._get_index('local_parameter')
         ## if ListOFReactions tag not exist, create
-        m = '{http://www.copasi.org/static/schema}ListOfReactions'
-        mod_tag = '{http://www.copasi.org/static/schema}Model'
-        metab = r'{http://www.copasi.org/static/schema}ListOfMetabolites'
-        idx = 0
-        if self.xml.find(mod_tag).find(m) is None:
-            new_m = etree.Element(m)
-            for i in range(len(self.xml.find(mod_tag))):
-                if self.xml.find(mod_tag)[i].tag == metab:
-                    idx = i
-
-            self.xml.find(mod_tag).insert(idx + 1, new_m)
-
-        for i in self.xml.iter():
-            if i.tag == m:
-                i.append(reaction.to_xml())
-        ## needed?
-        # self.save()
+        self._model_section('ListOfReactions', 'ListOfMetabolites').append(reaction.to_xml())
+
+        ## the new reaction is read from the xml when next needed
+        self._component_index.discard('reaction')
         for local_parameter in reaction.parameters:
-            if local_parameter.key in [i.key for i in self.local_parameters]:
+            if self.get('local_parameter', local_parameter.key, by='key') != []:
                 local_parameter.key = KeyFactory(self, 'parameter').generate()
             self.add_local_parameter(local_parameter)
+        self._component_index.discard('local_parameter')
         return self.refresh()
 
 
@@ -1692,27 +2325,21 @@ class Model(_base._Base):
         ##Why does the new reaction give empty lists of substrates
         ## and products?
         reaction = self.get('reaction', value, by)
-        for i in self.xml.iter():
-            if i.tag == '{http://www.copasi.org/static/schema}ListOfReactions':
-                for j in i:
-                    if j.attrib[by] == value:
-                        j.getparent().remove(j)
-
-        if 'reactions' in self.__dict__:
-            del self.__dict__['reactions']
+        for j in self._section('ListOfReactions'):
+            if j.attrib[by] == value:
+                j.getparent().remove(j)
+
+        self._component_index.discard('reaction')
+        self._component_index.discard('local_parameter')
         return self
 
     def refresh(self):
         """
-        Save the file then reload the Model. Can't use the
-        save method though because the save method uses
-        the refresh method.
+        Save the file then reload the Model from it.
         :return:
         """
-        with open(self.copasi_file, 'w') as f:
-            f.write(etree.tostring(self.xml, pretty_print=True))
-
-        return Model(self.copasi_file)
+        self._write(self.copasi_file)
+        return Model(self.copasi_file, lazy=self.lazy)
 
     def save(self, copasi_file=None):
         """
@@ -1729,23 +2356,328 @@ class Model(_base._Base):
         if copasi_file == None:
             copasi_file = self.copasi_file
 
-        ##
-        if not os.path.isdir(self.root):
-            os.makedirs(self.root)
-
-        ## Then remove existing copasi file for ovewrite
-        if os.path.isfile(copasi_file):
-            os.remove(copasi_file)
-
-        with open(copasi_file, 'w') as f:
-            f.write(etree.tostring(self.xml, pretty_print=True))
-        # self.xml.getroot().write(copasi_file)
+        self._write(copasi_file)
 
         ## update copasi file for when copasi_file is not None
         self.copasi_file = copasi_file
-        self.refresh()
         return self
 
+    def _write(self, copasi_file):
+        """
+        For Developers
+
+        Serialize the xml once, straight into a temporary file
+        next to `copasi_file`, then rename it over `copasi_file`.
+        The rename is atomic so other processes never read
+        a half written model.
+
+        :param copasi_file:
+            `str`. Full path to write to
+
+        :return:
+            :py:class:`Model`
+        """
+        self._write_states()
+        ## a copy which has not been changed writes the shared snapshot
+        xml = self._xml if self._xml is not None else self._template
+
+        def write(f):
+            if self._skipped:
+                f.write(self._serialize(xml))
+                return
+            with etree.xmlfile(f) as xf:
+                xf.write(xml, pretty_print=True)
+
+        self._replace_file(copasi_file, write)
+        return self
+
+    def _serialize(self, xml):
+        """
+        For Developers
+
+        Serialize xml the same way :py:meth:`Model._write`
+        does, with any sections skipped by a lazy parse
+        put back in.
+
+        :param xml:
+            :py:class:`etree._Element`. i.e. :py:attr:`Model.xml`
+
+        :return:
+            `str`
+        """
+        f = BytesIO()
+        with etree.xmlfile(f) as xf:
+            xf.write(xml, pretty_print=True)
+        return tasks.CopasiMLParser.splice(f.getvalue(), self._skipped)
+
+    @staticmethod
+    def _replace_file(filename, write):
+        """
+        For Developers
+
+        Call `write` with a temporary file opened next to
+        `filename`, then rename it over `filename`. Used by
+        :py:meth:`Model._write` and :py:class:`BulkWriter`.
+
+        :param filename:
+            `str`. Full path to write to
+
+        :param write:
+            `callable`. Takes the open file as its only argument
+
+        :return:
+            `str`. filename
+        """
+        directory = os.path.dirname(os.path.abspath(filename))
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        temp = os.path.join(directory, '.{}.{}.tmp'.format(
+            os.path.basename(filename), uuid.uuid4().hex))
+        try:
+            with open(temp, 'wb') as f:
+                write(f)
+
+            ## cannot rename over an existing file on windows
+            if os.name == 'nt' and os.path.isfile(filename):
+                os.remove(filename)
+            os.rename(temp, filename)
+        except:
+            if os.path.isfile(temp):
+                os.remove(temp)
+            raise
+        return filename
+
+    ## bumped when the layout of snapshot files changes
+    snapshot_version = 1
+
+    @staticmethod
+    def _snapshot_file(copasi_file):
+        """
+        For Developers
+
+        :param copasi_file:
+            `str`. Full path to a copasi file
+
+        :return:
+            `str`. Default snapshot path, next to copasi_file
+        """
+        return os.path.splitext(copasi_file)[0] + '.snapshot'
+
+    @staticmethod
+    def _file_key(copasi_file):
+        """
+        For Developers
+
+        :param copasi_file:
+            `str`. Full path to a copasi file
+
+        :return:
+            `tuple`. (mtime, size, sha1) of copasi_file. A
+            snapshot is only used while its key still matches.
+        """
+        stat = os.stat(copasi_file)
+        with open(copasi_file, 'rb') as f:
+            sha1 = hashlib.sha1(f.read()).hexdigest()
+        return stat.st_mtime, stat.st_size, sha1
+
+    def to_snapshot(self, snapshot=None):
+        """
+        Write the model to a binary snapshot which
+        :py:meth:`Model.from_snapshot` loads without parsing
+        the copasi file or reading the components from the xml.
+        The snapshot holds the compressed xml and the pickled
+        components and states and is keyed by the mtime and
+        hash of :py:attr:`Model.copasi_file`. The model is saved
+        first so the snapshot never holds changes which are not
+        in the copasi file.
+
+        :param snapshot:
+            `str` or `None`. Default is `None`. Where to write
+            the snapshot. When `None` the .cps extension of
+            :py:attr:`Model.copasi_file` is replaced with .snapshot
+
+        :return:
+            `str`. The snapshot file
+        """
+        self.save()
+        return self._dump_snapshot(snapshot)
+
+    def _dump_snapshot(self, snapshot=None):
+        """
+        For Developers
+
+        Write the snapshot for :py:meth:`Model.to_snapshot`
+        keyed on :py:attr:`Model.copasi_file` as it is on disk.
+        Only call this when the model has no unsaved changes.
+
+        :param snapshot:
+            `str` or `None`. Same as :py:meth:`Model.to_snapshot`
+
+        :return:
+            `str`. The snapshot file
+        """
+        if snapshot is None:
+            snapshot = self._snapshot_file(self.copasi_file)
+
+        ## read everything which is not indexed yet
+        for component in self._model_components():
+            self._get_index(component)
+        self._write_states()
+        xml = self._xml if self._xml is not None else self._template
+
+        header = {
+            'version': self.snapshot_version,
+            'key': self._file_key(self.copasi_file),
+            'quantity_type': self.quantity_type,
+            'lazy': self.lazy,
+        }
+        body = {
+            'xml': zlib.compress(etree.tostring(xml), 1),
+            'skipped': self._skipped,
+            'states': self._states,
+            'index': self._component_index,
+        }
+
+        def write(f):
+            pickler = cPickle.Pickler(f, 2)
+            ## components refer back to the model which is not pickled
+            pickler.inst_persistent_id = lambda obj: 'model' if obj is self else None
+            pickler.dump(header)
+            pickler.dump(body)
+
+        return self._replace_file(snapshot, write)
+
+    @classmethod
+    def from_snapshot(cls, copasi_file, snapshot=None,
+                      quantity_type='concentration', lazy=False):
+        """
+        Load a model from the snapshot written by :py:meth:`Model.to_snapshot`.
+        When the snapshot does not exist or copasi_file has changed since it
+        was written the model is read from copasi_file as normal and a new
+        snapshot is written so the next load is fast.
+
+        Usage:
+            >>> model = Model.from_snapshot(r'/full/path/to/model.cps')
+
+        :param copasi_file:
+            `str`. Full path to a copasi file
+
+        :param snapshot:
+            `str` or `None`. Same as :py:meth:`Model.to_snapshot`
+
+        :param quantity_type:
+            `str`. Same as :py:class:`Model`
+
+        :param lazy:
+            `bool`. Same as :py:class:`Model`
+
+        :return:
+            :py:class:`Model`
+        """
+        copasi_file = os.path.abspath(copasi_file)
+        if snapshot is None:
+            snapshot = cls._snapshot_file(copasi_file)
+
+        model = cls._load_snapshot(copasi_file, snapshot, quantity_type, lazy)
+        if model is None:
+            model = cls(copasi_file, quantity_type=quantity_type, lazy=lazy)
+            ## just read so there is nothing to save
+            model._dump_snapshot(snapshot)
+        return model
+
+    @classmethod
+    def _load_snapshot(cls, copasi_file, snapshot, quantity_type, lazy):
+        """
+        For Developers
+
+        Build a :py:class:`Model` from snapshot.
+
+        :return:
+            :py:class:`Model` or None when the snapshot
+            is missing or out of date
+        """
+        if not os.path.isfile(snapshot) or not os.path.isfile(copasi_file):
+            return None
+
+        model = cls.__new__(cls)
+        with open(snapshot, 'rb') as f:
+            unpickler = cPickle.Unpickler(f)
+            unpickler.persistent_load = lambda pid: model
+            try:
+                header = unpickler.load()
+            except Exception:
+                LOG.warning('Could not read snapshot "{}"'.format(snapshot))
+                return None
+
+            if header.get('version') != cls.snapshot_version \
+                    or header.get('quantity_type') != quantity_type \
+                    or header.get('lazy') != lazy \
+                    or header.get('key') != cls._file_key(copasi_file):
+                return None
+
+            ## the cyclic garbage collector makes
+            ## unpickling many small objects several times slower
+            enabled = gc.isenabled()
+            gc.disable()
+            try:
+                body = unpickler.load()
+            finally:
+                if enabled:
+                    gc.enable()
+
+        model.kwargs = {}
+        model.default_properties = {}
+        model._copasi_file = copasi_file
+        model.quantity_type = quantity_type
+        model.new_model = False
+        model.lazy = lazy
+        ## the xml is only parsed if it is used
+        model._xml = None
+        model._packed_xml = body['xml']
+        model._skipped = body['skipped']
+        model._states_modified = False
+        model._states = body['states']
+        model._component_index = body['index']
+        return model
+
+    def diff(self, other):
+        """
+        The changes which turn this model into `other`. Variants
+        of a model can be stored as the base model and a patch each
+        and materialized with :py:meth:`Model.apply`.
+
+        :param other:
+            :py:class:`Model`. Usually a variant of this model
+
+        :return:
+            :py:class:`Patch`
+
+        Usage:
+            >>> patch = base.diff(variant)
+            >>> patch.save('variant.patch')
+        """
+        return Patch.from_models(self, other)
+
+    def apply(self, patch):
+        """
+        Apply the changes in a :py:class:`Patch` to this model.
+        Use a copy of the base model to materialize a variant
+        without parsing another copasi file.
+
+        :param patch:
+            :py:class:`Patch` or `str`. A patch or the file it was saved to
+
+        :return:
+            :py:class:`Model`
+
+        Usage:
+            >>> variant = base.copy('variant.cps').apply('variant.patch')
+        """
+        if isinstance(patch, basestring):
+            patch = Patch.load(patch)
+        return patch.apply(self)
+
     def open(self, copasi_file=None, as_temp=False):
         """
         Open model with the gui. In order to work
@@ -1785,6 +2717,20 @@ class Model(_base._Base):
                 'local_parameter','global_quantity',
                 'function']
 
+    def _component_properties(self):
+        """
+        Map of model components to the
+        :py:class:`Model` property which lists them
+        :return:
+            `dict`
+        """
+        return {'metabolite': 'metabolites',
+                'compartment': 'compartments',
+                'reaction': 'reactions',
+                'local_parameter': 'constants',
+                'global_quantity': 'global_quantities',
+                'function': 'functions'}
+
     def get(self, component, value, by='name'):
         """
         Factory method for getting a model component by a value of a certain type
@@ -1825,43 +2771,35 @@ class Model(_base._Base):
         if component not in self._model_components():
             raise errors.InputError('{} not in list of components: {}'.format(component, self._model_components()))
 
-        if component == 'metabolite':
-            res = [i for i in self.metabolites if getattr(i, by) == value]
-
-        elif component == 'compartment':
-            res = [i for i in self.compartments if getattr(i, by) == value]
-
-        elif component == 'local_parameter':
-            res = [i for i in self.constants if getattr(i, by) == value]
-
-        elif component == 'global_quantity':
-            res = [i for i in self.global_quantities if getattr(i, by) == value]
-
-        elif component == 'function':
-            res = [i for i in self.functions if getattr(i, by) == value]
-
-        elif component == 'reaction':
-            res = [i for i in self.reactions if getattr(i, by) == value]
+        res = self._get_index(component).get(component, value, by=by)
 
         if len(res) == 1:
             res = res[0]
         return res
 
-    def set(self, component, match_value, new_value,
+    def set(self, component, match_value, new_value=None,
             match_field='name', change_field='name'):
         """
         Set a model components attribute to a new value
 
+        Values held in the initial state, the names and simulation
+        types of compartments, metabolites and global quantities
+        and the values of local parameters are changed in place.
+        Other attributes are changed by removing the component
+        and adding it back.
+
         :param component:
             `str` type of component to change (i.e. metbaolite)
 
         :param match_value:
             `str`, `int`, `float` depending on value of `match_field`.
-            The value to match.
+            The value to match. Or a `dict` of match_value: new_value
+            to change several components at once.
 
         :param new_value:
             `str`, `int` or `float` depending on value of `match_field`
-            new value for component attribute
+            new value for component attribute. Not needed when
+            match_value is a `dict`
 
         :param match_field:
             `str`. The attribute of component to match by.
@@ -1877,11 +2815,18 @@ class Model(_base._Base):
 
         Set name of global quantity called 'G' to 'H':
             >>> model.set('global_quantity', 'G', 'H', match_field='name', change_field='name')
+
+        Set the concentrations of 'X' and 'Y':
+            >>> model.set('metabolite', {'X': 50, 'Y': 10}, change_field='concentration')
         """
         if component not in self._model_components():
             raise errors.InputError('{} not in list of components'.format(component))
 
-        
+        if isinstance(match_value, dict):
+            for match, new in match_value.items():
+                self.set(component, match, new, match_field, change_field)
+            return self
+
         ##get the component of interest
         comp = self.get(component, match_value, by=match_field)
 
@@ -1890,7 +2835,7 @@ class Model(_base._Base):
                 'model.get has returned a list --> {}'.format(comp)
             )
 
-        if change_field not in comp.__dict__.keys():
+        if change_field not in _attributes(comp):
             raise errors.InputError('"{}" not valid for component type "{}"'.format(
                 change_field, component
             ))
@@ -1907,6 +2852,8 @@ class Model(_base._Base):
                 ##now change the field of interest to particle number
                 change_field = 'particle_numbers'
 
+        if self._set_in_place(component, comp, change_field, new_value):
+            return self
 
         ##remove component of interest from model
         self.remove(component, match_value)
@@ -1917,6 +2864,95 @@ class Model(_base._Base):
         ##add back to model with new attribute
         return self.add_component(component, comp)
 
+    ## component: (section, attribute held in the initial state)
+    _in_place = {'compartment': ('ListOfCompartments', 'initial_value'),
+                 'metabolite': ('ListOfMetabolites', 'particle_numbers'),
+                 'global_quantity': ('ListOfModelValues', 'initial_value')}
+
+    ## component attribute: xml attribute
+    _element_attributes = {'name': 'name',
+                           'simulation_type': 'simulationType'}
+
+    def _set_in_place(self, component, comp, change_field, new_value):
+        """
+        For Developers
+
+        Change an attribute of comp in the xml element or
+        the initial state slot which holds it, without
+        removing the component from the model
+
+        :param component:
+            `str`. One of :py:meth:`Model._model_components`
+
+        :param comp:
+            The model component to change
+
+        :param change_field:
+            `str`. The attribute to change
+
+        :param new_value:
+            The new value of the attribute
+
+        :return:
+            `bool`. False when the attribute can not
+            be changed in place
+        """
+        if component == 'local_parameter' and change_field == 'value':
+            InsertParameters(self, parameter_dict={comp.global_name: new_value})
+            return True
+
+        if component not in self._in_place:
+            return False
+
+        section, state = self._in_place[component]
+        if change_field == state:
+            self._set_state(comp.key, new_value)
+            return True
+
+        if change_field not in self._element_attributes:
+            return False
+
+        if change_field == 'name' and component != 'metabolite' and new_value != comp.name and \
+                self.get(component, new_value, by='name') != []:
+            raise errors.AlreadyExistsError(
+                'Model already contains {} with name: "{}"'.format(component, new_value))
+
+        for element in self._section(section):
+            if element.attrib['key'] == comp.key:
+                element.attrib[self._element_attributes[change_field]] = new_value
+                break
+
+        new = shallow_copy(comp)
+        setattr(new, change_field, new_value)
+        self._component_index.replace(component, comp, new)
+        self._invalidate(component)
+        return True
+
+    def set_values(self, values, quantity_type=None):
+        """
+        Change the values of several model quantities in place.
+        A wrapper around :py:class:`InsertParameters`.
+
+        :param values:
+            `dict`. dict[name] = new value. Names as in
+            :py:attr:`Model.all_variable_names`, with local parameters
+            by their global name, i.e. `(A2B).k1`
+
+        :param quantity_type:
+            `str` or `None`. concentration or particle_numbers.
+            Defaults to :py:attr:`Model.quantity_type`
+
+        :return:
+            :py:class:`Model`
+
+        Usage:
+            >>> model.set_values({'A': 1.0, '(A2B).k1': 0.3})
+        """
+        if quantity_type is None:
+            quantity_type = self.quantity_type
+        InsertParameters(self, parameter_dict=values, quantity_type=quantity_type)
+        return self
+
     def add_component(self, component_name, component,
             reaction_expression=None, reaction_rate_law=None):
         """
@@ -2031,6 +3067,210 @@ class Model(_base._Base):
         else:
             raise errors.InputError('{} is not an accepted type. Choose from: {}'.format(self._model_components()))
 
+    def add_many(self, component, iterable):
+        """
+        Add several components at once. Keys are allocated for the
+        whole batch in one go and the xml elements and states of the
+        batch are appended in one operation. Adding N components one
+        at a time with :py:meth:`Model.add` costs O(N^2).
+
+        :param component:
+            `str`. compartment, metabolite, global_quantity, function
+            or reaction
+
+        :param iterable:
+            Components of type `component`, `dict` of keyword arguments
+            for the component class or for compartments, metabolites and
+            global quantities, `str` names.
+            Components whose key is already taken are given a new one.
+
+        :return:
+            :py:class:`Model`. As :py:meth:`Model.add_reaction`, adding
+            reactions saves and reloads the model, once.
+
+        Usage:
+            >>> model = model.add_many('metabolite', ['X{}'.format(i) for i in range(1000)])
+            >>> model = model.add_many('reaction', [
+            ...     {'name': 'R1', 'expression': 'X1 -> X2', 'rate_law': 'k1*X1'},
+            ...     {'name': 'R2', 'expression': 'X2 -> X3', 'rate_law': 'k1*X2'}])
+        """
+        classes = {'compartment': Compartment,
+                   'metabolite': Metabolite,
+                   'global_quantity': GlobalQuantity,
+                   'function': Function,
+                   'reaction': Reaction}
+        if component not in classes:
+            raise errors.InputError('Cannot add many "{}". These are valid: {}'.format(
+                component, sorted(classes.keys())))
+
+        items = list(iterable)
+        if items == []:
+            return self
+
+        if component == 'function':
+            for i in items:
+                self.add_function(i if isinstance(i, Function) else Function(self, **i))
+            return self
+
+        if component == 'metabolite' and self.compartments == []:
+            self.add_compartment('NewCompartment')
+
+        ## one block of keys for the batch, which can not
+        ## clash with each other or the model
+        keys = KeyFactory(self, type=component).generate(len(items))
+        if isinstance(keys, str):
+            keys = [keys]
+        taken = set(i.key for i in self._get_index(component).values(component))
+        cls = classes[component]
+        objs = []
+        for i, key in zip(items, keys):
+            if isinstance(i, str):
+                i = {'name': i}
+            if isinstance(i, dict):
+                i = cls(self, **dict(i, key=i.get('key') or key))
+            if not isinstance(i, cls):
+                raise errors.InputError('Expecting "{}" but got "{}" instead'.format(cls.__name__, type(i)))
+            if i.key in taken:
+                LOG.info('Model already contains a {} with the key: {}. Changing key'.format(component, i.key))
+                i.key = key
+            taken.add(i.key)
+            objs.append(i)
+
+        if component == 'reaction':
+            return self._add_reactions(objs)
+
+        ## as add_compartment and add_global_quantity, skip names already in use
+        if component != 'metabolite':
+            names = set(i.name for i in self._get_index(component).values(component))
+            unique = []
+            for i in objs:
+                if i.name in names:
+                    LOG.info('Model already contains {} with name: "{}". Skipping'.format(component, i.name))
+                    continue
+                names.add(i.name)
+                unique.append(i)
+            objs = unique
+
+        if component == 'compartment':
+            section = self._model_section('ListOfCompartments', 'MiriamAnnotation')
+            values = [i.initial_value for i in objs]
+        elif component == 'metabolite':
+            section = self._model_section('ListOfMetabolites', 'ListOfCompartments')
+            values = [i.particle_numbers for i in objs]
+        else:
+            section = self._model_section('ListOfModelValues', 'ListOfCompartments')
+            values = [i.initial_value for i in objs]
+
+        elements = [i.to_xml() for i in objs]
+        section.extend(elements)
+        self.add_states([i.key for i in objs], values)
+        for element in elements:
+            self._index_element(component, element)
+        return self
+
+    def _add_reactions(self, reactions):
+        """
+        For Developers
+
+        Add reactions for :py:meth:`Model.add_many`. The model is
+        saved and reloaded once rather than after every reaction.
+
+        :param reactions:
+            `list` of :py:class:`Reaction`, with unique keys
+
+        :return:
+            :py:class:`Model`
+        """
+        names = set(i.name for i in self.reactions)
+        for i in reactions:
+            if i.name in names:
+                raise errors.ReactionAlreadyExists(
+                    'Your model already contains a reaction with the name: {}'.format(i.name))
+            names.add(i.name)
+
+        ## see add_reaction
+        self._get_index('local_parameter')
+        parameter_keys = set(i.key for i in self.constants)
+        section = self._model_section('ListOfReactions', 'ListOfMetabolites')
+        for reaction in reactions:
+            if self.get('function', reaction.rate_law.name, by='name') == []:
+                self.add_function(reaction.rate_law)
+            section.append(reaction.to_xml())
+
+        ## the local parameters look up their reaction
+        ## so the new reactions are read from the xml, once
+        self._component_index.discard('reaction')
+        for reaction in reactions:
+            for local_parameter in reaction.parameters:
+                if local_parameter.key in parameter_keys:
+                    local_parameter.key = KeyFactory(self, 'parameter').generate()
+                parameter_keys.add(local_parameter.key)
+                self.add_local_parameter(local_parameter)
+
+        self._component_index.discard('reaction')
+        self._component_index.discard('local_parameter')
+        return self.refresh()
+
+    def remove_many(self, component, values, by='name'):
+        """
+        Remove several components at once. The xml elements and
+        states of the components are removed in a single pass and
+        the components which depend on them are read again once.
+
+        :param component:
+            `str`. compartment, metabolite, global_quantity,
+            function or reaction
+
+        :param values:
+            `list`. Values of the attribute to match
+
+        :param by:
+            `str`. Attribute of the components to match
+
+        :return:
+            :py:class:`Model`
+
+        Usage:
+            >>> model.remove_many('metabolite', ['X{}'.format(i) for i in range(1000)])
+        """
+        if component not in ['compartment', 'metabolite', 'global_quantity',
+                             'function', 'reaction']:
+            raise errors.InputError('Cannot remove many "{}"'.format(component))
+
+        index = self._get_index(component)
+        objs = []
+        for value in values:
+            matches = index.get(component, value, by=by)
+            if matches == []:
+                raise errors.ComponentDoesNotExistError(
+                    'Component with {}={} does not exist'.format(by, value))
+            objs.extend(matches)
+
+        if component == 'function':
+            for i in objs:
+                self.remove_function(i.key, by='key')
+            return self
+
+        keys = set(i.key for i in objs)
+        sections = {'compartment': 'ListOfCompartments',
+                    'metabolite': 'ListOfMetabolites',
+                    'global_quantity': 'ListOfModelValues',
+                    'reaction': 'ListOfReactions'}
+        for element in self._section(sections[component]):
+            if element.attrib['key'] in keys:
+                element.getparent().remove(element)
+
+        if component == 'reaction':
+            self._component_index.discard('reaction')
+            self._component_index.discard('local_parameter')
+            return self
+
+        self.remove_states(keys)
+        for i in objs:
+            index.remove(component, i)
+        self._invalidate(component)
+        return self
+
     @property
     def active_parameter_set(self):
         """
@@ -2041,9 +3281,9 @@ class Model(_base._Base):
         :return:
             :py:class:`etree.Element`
         """
-        for i in self.xml.iter():
-            if i.tag=='{http://www.copasi.org/static/schema}ListOfModelParameterSets':
-                return i.attrib['active_set']
+        parameter_sets = self.sections['ListOfModelParameterSets']
+        if parameter_sets is not None:
+            return parameter_sets.attrib['active_set']
 
     @active_parameter_set.setter
     def active_parameter_set(self, parameter_set):
@@ -2058,9 +3298,9 @@ class Model(_base._Base):
         if parameter_set not in self.active_parameter_set:
             raise errors.InputError('{} not in available parameter sets'.format(parameter_set))
 
-        for i in self.xml.iter():
-            if i.tag=='{http://www.copasi.org/static/schema}ListOfModelParameterSets':
-                i.attrib['active_set'] = parameter_set
+        parameter_sets = self.sections['ListOfModelParameterSets']
+        if parameter_sets is not None:
+            parameter_sets.attrib['active_set'] = parameter_set
         return self
 
     @property
@@ -2070,8 +3310,86 @@ class Model(_base._Base):
         sets
         :return:
         """
-        return NotImplementedError
-
+        return NotImplementedError
+
+
+    def _quantity_table(self, quantity_type=None):
+        """
+        For Developers
+
+        The table behind :py:attr:`Model.quantities`. It is built
+        from the :py:class:`ComponentIndex` and kept until the index
+        next changes, which the add, remove and set methods do
+        whenever they change the xml.
+
+        :param quantity_type:
+            `str` or `None`. 'concentration' or 'particle_numbers'
+            for the metabolite values. Defaults to :py:attr:`Model.quantity_type`
+
+        :return:
+            :py:class:`pandas.DataFrame`
+        """
+        index = self._get_index('metabolite')
+        for component in ['compartment', 'global_quantity', 'local_parameter']:
+            self._get_index(component)
+
+        if quantity_type is None:
+            quantity_type = self.quantity_type
+
+        cached = self.__dict__.get('_quantities')
+        key = (index, index.version, quantity_type)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+
+        reference = self.reference
+        rows = []
+        for i in index.values('metabolite'):
+            if quantity_type == 'concentration':
+                value, initial_reference = i.concentration, i.initial_reference
+            else:
+                value, initial_reference = i.particle_numbers, i.initial_particle_reference
+            rows.append((i.name, 'metabolite', i.key, i.compartment.name, value, i.simulation_type,
+                         '{},{},{}'.format(reference, i.compartment.reference, initial_reference)))
+
+        for i in index.values('global_quantity'):
+            rows.append((i.name, 'global_quantity', i.key, None, i.initial_value, i.simulation_type,
+                         '{},{}'.format(reference, i.initial_reference)))
+
+        ## as Model.local_parameters, locals assigned to a global quantity are left out
+        for i in index.values('local_parameter'):
+            if i.simulation_type == 'assignment':
+                continue
+            rows.append((i.global_name, 'local_parameter', i.key, None, i.value, i.simulation_type,
+                         '{},Vector=Reactions[{}],{}'.format(reference, i.reaction_name, i.value_reference)))
+
+        for i in index.values('compartment'):
+            rows.append((i.name, 'compartment', i.key, None, i.initial_value, i.simulation_type,
+                         '{},{}'.format(reference, i.initial_volume_reference())))
+
+        df = pandas.DataFrame(rows, columns=['name', 'type', 'key', 'compartment',
+                                             'value', 'simulation_type', 'cn'])
+        df['value'] = df['value'].astype(float)
+        self._quantities = (key, df)
+        return df
+
+    @property
+    def quantities(self):
+        """
+        A table with one row for each metabolite, global quantity,
+        local parameter and compartment in the model, in that order.
+        Local parameters are named by their `global_name` and metabolite
+        values are in units of :py:attr:`Model.quantity_type`. The table
+        is only rebuilt after the model changes so filtering and joining
+        it are cheap:
+
+            >>> q = model.quantities
+            >>> q[q['type'] == 'metabolite'].set_index('name')['value']
+
+        :return:
+            :py:class:`pandas.DataFrame`. Columns are name, type, key,
+            compartment, value, simulation_type and cn
+        """
+        return self._quantity_table().copy()
 
     @property
     def parameters(self):
@@ -2081,20 +3399,11 @@ class Model(_base._Base):
         :return:
             :py:class:`pandas.DataFrame`
         """
-        if self.quantity_type == 'concentration':
-            metabs = {i.name: i.concentration for i in self.metabolites}
-        elif self.quantity_type == 'particle_numbers':
-            metabs = {i.name: i.particle_numbers for i in self.metabolites}
-
-        locals = {i.global_name: i.value for i in self.local_parameters}
-        globals_q = {i.name: i.initial_value for i in self.global_quantities}
-        d = {}
-        d.update(metabs)
-        d.update(locals)
-        d.update(globals_q)
-        d = pandas.DataFrame(d, index=[0])
-        return d
-
+        df = self._quantity_table()
+        df = df[df['type'] != 'compartment']
+        ## a global quantity takes the place of a metabolite with the same name
+        df = df.drop_duplicates('name', keep='last')
+        return pandas.DataFrame([df['value'].values], columns=df['name'].values).sort_index(axis=1)
 
     def to_sbml(self, sbml_file=None):
         """
@@ -2131,6 +3440,8 @@ class ReadModelMixin(Mixin):
     return the xml. If already a model, do nothing.
     :return: model.Model
     """
+    __slots__ = ()
+
     @staticmethod
     def read_model(m):
         if isinstance(m, str):
@@ -2145,6 +3456,7 @@ class ReadModelMixin(Mixin):
 @mixin(ReadModelMixin)
 @mixin(ComparisonMethodsMixin)
 class Compartment(object):
+    __slots__ = ['model', 'name', 'initial_value', 'key', 'simulation_type']
 
     def __init__(self, model, name=None, initial_value=None,
                  key=None, simulation_type='fixed'):
@@ -2224,6 +3536,9 @@ class Metabolite(object):
     """
 
     """
+    __slots__ = ['model', 'name', 'particle_numbers', 'concentration',
+                 'simulation_type', 'compartment', 'key', 'stoichiometry']
+
     def __init__(self, model, name='new_metabolite', particle_numbers=None,
                  concentration=None, compartment=None, simulation_type=None,
                  key=None):
@@ -2318,7 +3633,7 @@ class Metabolite(object):
                 if isinstance(self.compartment, Compartment) != True:
                     raise errors.InputError('compartment argument should be of type PyCoTools.tasks.Compartment')
 
-        if ('particle_numbers' not in self.__dict__.keys()) and ('concentration' not in self.__dict__.keys() ):
+        if not hasattr(self, 'particle_numbers') and not hasattr(self, 'concentration'):
             raise errors.InputError('Must specify either concentration or particle numbers')
 
         if self.simulation_type == None:
@@ -2472,6 +3787,8 @@ class Substrate(Metabolite):
     """
     Inherits from Metabolite. Takes the same argument as Metabolite.
     """
+    __slots__ = ()
+
     def __init__(self, model, name='new_metabolite', particle_numbers=None,
                  concentration=None, compartment=None, simulation_type=None,
                  key=None):
@@ -2503,6 +3820,8 @@ class Product(Metabolite):
     """
     Inherits from Metabolite. Takes the same argument as Metabolite.
     """
+    __slots__ = ()
+
     def __init__(self, model,name='new_metabolite', particle_numbers=None,
                  concentration=None, compartment=None, simulation_type=None,
                  key=None):
@@ -2534,6 +3853,8 @@ class Modifier(Metabolite):
     """
     Inherits from Metabolite. Takes the same argument as Metabolite.
     """
+    __slots__ = ()
+
     def __init__(self, model, name='new_metabolite', particle_numbers=None,
                  concentration=None, compartment=None, simulation_type=None,
                  key=None):
@@ -2569,6 +3890,8 @@ class GlobalQuantity(object):
     ##TODO:
         Build support for assignments
     """
+    __slots__ = ['model', 'name', 'initial_value', 'key', 'simulation_type']
+
     def __init__(self, model, name='global_quantity', initial_value=None,
                  key=None, simulation_type=None):
         """
@@ -2702,11 +4025,16 @@ class Reaction(object):
     and modifiers from the constructor of this class. They are not
     needed.
     """
+    __slots__ = ['model', 'name', 'expression', 'rate_law', 'reversible',
+                 'simulation_type', 'substrates', 'products', 'modifiers',
+                 'parameters', 'parameters_dict', 'parameter_values',
+                 'fast', 'key']
 
     def __init__(self, model, name='reaction_1', expression=None,
                  rate_law=None, reversible=False, simulation_type='reactions',
                  parameters=[], parameters_dict={}, substrates=[],
-                 products=[], modifiers=[], key=None, parameter_values={}):
+                 products=[], modifiers=[], key=None, parameter_values={},
+                 translate=True):
         """
 
         :param model:
@@ -2735,6 +4063,12 @@ class Reaction(object):
             `dict`. key to value mapping of parameter name to required value.
 
         :param key:
+
+        :param translate:
+            `bool`. default=True. When False the substrates, products, modifiers,
+            parameters and rate_law arguments are used as given instead of being
+            derived from expression and rate_law. Used when reading reactions
+            which already exist in the model.
         """
         self.model = self.read_model(model)
         self.name = name
@@ -2752,7 +4086,8 @@ class Reaction(object):
         self.key = key
 
         self._do_checks()
-        self.create()
+        if translate:
+            self.create()
 
     def __str__(self):
         return 'Reaction(name="{}", expression="{}", rate_law="{}", parameters={}, reversible={}, simulation_type="{}")'.format(
@@ -2992,7 +4327,7 @@ class Reaction(object):
             etree.SubElement(list_of_constants, '{http://www.copasi.org/static/schema}Constant', attrib={'key': i.key,
                                                                     'name': i.name,
                                                                     'value': str(i.value)})
-        if 'mass_action' in self.rate_law.name.lower().replace(' ', '_'):
+        if isinstance(self.rate_law, MassAction):
             kinetic_law = self.rate_law.to_xml()
         else:
             try:
@@ -3016,12 +4351,19 @@ class Reaction(object):
                 if i.role == 'constant':
                     ##TODO implement global quantities here
 
-                    source_parameter = self.parameters_dict[i.name].key
+                    source_parameters = [self.parameters_dict[i.name].key]
 
                 elif (i.role == 'substrate') or (i.role == 'product') or (i.role == 'modifier'):
-                    source_parameter = self.model.get('metabolite', i.name, by='name').key
+                    metab = self.model.get('metabolite', i.name, by='name')
+                    if metab == []:
+                        ## vector parameters (i.e. substrate in mass action)
+                        ## refer to every metabolite with that role
+                        source_parameters = [j.key for j in getattr(self, i.role + 's')]
+                    else:
+                        source_parameters = [metab.key]
 
-                etree.SubElement(call_parameter, '{http://www.copasi.org/static/schema}SourceParameter', attrib={'reference': source_parameter})
+                for source_parameter in source_parameters:
+                    etree.SubElement(call_parameter, '{http://www.copasi.org/static/schema}SourceParameter', attrib={'reference': source_parameter})
 
         return reaction
 
@@ -3032,6 +4374,8 @@ class Function(object):
     """
     Class to hold copasi function definitions for rate laws
     """
+    __slots__ = ['model', 'name', 'expression', 'type', 'key', 'reversible',
+                 'list_of_parameter_descriptions', 'roles']
 
     def __init__(self, model, name='function_1', expression=None,
                  type=None, key=None, reversible=None,
@@ -3190,6 +4534,8 @@ class ParameterDescription(object):
     ParameterDescription objects are part of a function which in turn
     are used as rate laws.
     """
+    __slots__ = ['model', 'name', 'role', 'order', 'key']
+
     def __init__(self, model, name='parameter_description',
                  role='substrate', order=0, key=None):
         """
@@ -3243,6 +4589,9 @@ class LocalParameter(object):
     """
     A Parameter within the scope of a reaction
     """
+    __slots__ = ['model', 'name', 'value', 'parameter_type', 'simulation_type',
+                 'reaction_name', 'global_name', 'key']
+
     def __init__(self, model, name='local_parameter', value=None,
                  parameter_type=None, reaction_name=None,
                  global_name=None, key=None, simulation_type='fixed'):
@@ -3285,7 +4634,7 @@ class LocalParameter(object):
             raise errors.InputError('Name is "{}"'.format(self.name))
 
         if self.key is None:
-            self.key = KeyFactory(self.model, type='parameter')
+            self.key = KeyFactory(self.model, type='parameter').generate()
             if self.key is None:
                 raise errors.InputError('Key is "{}"'.format(self.key))
 
@@ -3378,6 +4727,571 @@ class LocalParameter(object):
             raise errors.SomethingWentHorriblyWrongError('Reaction not in model')
         return reaction
 
+
+class KeyAllocator(object):
+    """
+    For Developers
+
+    The keys used by a :py:class:`Model`, grouped by their
+    prefix (i.e. `Metabolite` for `Metabolite_4`). Each prefix
+    keeps a set of the keys in use and the largest integer
+    suffix among them, so new keys are counted up from
+    the largest suffix rather than searched for.
+
+    .. highlight::
+
+        >>> keys = KeyAllocator()
+        >>> keys.use('Metabolite_4')
+        >>> keys.allocate('Metabolite', 2)
+        ['Metabolite_5', 'Metabolite_6']
+    """
+    def __init__(self):
+        ## dict[prefix] = set of keys
+        self.used = {}
+
+        ## dict[prefix] = largest integer suffix used
+        self.max = {}
+
+    def __str__(self):
+        return 'KeyAllocator({})'.format(
+            ', '.join(['{}={}'.format(k, len(v)) for k, v in sorted(self.used.items())])
+        )
+
+    def __repr__(self):
+        return self.__str__()
+
+    def __contains__(self, key):
+        return key in self.used.get(key.rpartition('_')[0], ())
+
+    def use(self, key):
+        """
+        Mark key as used
+
+        :param key:
+            `str`. i.e. `Metabolite_4`
+
+        :return:
+            :py:class:`KeyAllocator`
+        """
+        if not isinstance(key, basestring):
+            return self
+        prefix, _, suffix = key.rpartition('_')
+        self.used.setdefault(prefix, set()).add(key)
+        if suffix.isdigit() and int(suffix) > self.max.get(prefix, -1):
+            self.max[prefix] = int(suffix)
+        return self
+
+    def allocate(self, prefix, n=1):
+        """
+        Allocate n unused keys
+
+        :param prefix:
+            `str`. i.e. `Metabolite`
+
+        :param n:
+            `int`. Number of keys
+
+        :return:
+            `list` of n keys, marked as used
+        """
+        start = self.max.get(prefix, -1) + 1
+        keys = ['{}_{}'.format(prefix, i) for i in range(start, start + n)]
+        self.used.setdefault(prefix, set()).update(keys)
+        if n > 0:
+            self.max[prefix] = start + n - 1
+        return keys
+
+
+class ComponentIndex(object):
+    """
+    For Developers
+
+    Lookup tables for the components of a :py:class:`Model`.
+    Components of each type (i.e. 'metabolite') are stored in
+    the order they are read and indexed by the value of their
+    `key`, `name` and `global_name` attributes so that
+    :py:meth:`Model.get` does not need to search a list.
+
+    The :py:class:`Model` reads a component type into the index
+    the first time it is needed and keeps the index in sync in its
+    add and remove methods.
+
+    .. highlight::
+
+        >>> index = ComponentIndex()
+        >>> index.build('metabolite', list_of_metabolites)
+        >>> index.get('metabolite', 'A', by='name')
+        [Metabolite(name="A", ...)]
+    """
+    fields = ['key', 'name', 'global_name']
+
+    def __init__(self):
+        ## dict[component] = OrderedDict[slot] = obj
+        self.components = {}
+
+        ## dict[component][id(obj)] = slot
+        self.slots = {}
+
+        ## dict[component][field][value] = [obj, ...]
+        self.lookup = {}
+
+        ## next free slot
+        self.count = 0
+
+        ## changed every time the index is, so tables
+        ## derived from it know when to rebuild
+        self.version = 0
+
+        ## every key indexed or generated for the model
+        self.keys = KeyAllocator()
+
+    def __str__(self):
+        return 'ComponentIndex({})'.format(
+            ', '.join(['{}={}'.format(k, len(v)) for k, v in sorted(self.components.items())])
+        )
+
+    def __repr__(self):
+        return self.__str__()
+
+    def __contains__(self, component):
+        return component in self.components
+
+    def __deepcopy__(self, memo):
+        """
+        Entries are keyed by object identity so
+        the index is rebuilt from the copied components
+        """
+        new = ComponentIndex()
+        for component, dct in self.components.items():
+            new.build(component, [deepcopy(i, memo) for i in dct.values()])
+        return new
+
+    def __getstate__(self):
+        """
+        Entries are keyed by object identity so
+        slots are rebuilt when the index is unpickled
+        """
+        return {
+            'components': dict((k, list(v.items())) for k, v in self.components.items()),
+            'lookup': self.lookup,
+            'count': self.count,
+        }
+
+    def __setstate__(self, state):
+        self.components = {}
+        self.slots = {}
+        for component, items in state['components'].items():
+            self.components[component] = OrderedDict(items)
+            self.slots[component] = dict((id(obj), slot) for slot, obj in items)
+        self.lookup = state['lookup']
+        self.count = state['count']
+        self.version = 0
+        self.keys = KeyAllocator()
+        for dct in self.components.values():
+            for obj in dct.values():
+                self._use_keys(obj)
+
+    def build(self, component, lst):
+        """
+        (Re)build the index for component
+
+        :param component:
+            `str`. i.e. 'metabolite'
+
+        :param lst:
+            `list` of components
+
+        :return:
+            :py:class:`ComponentIndex`
+        """
+        self.version += 1
+        self.components[component] = OrderedDict()
+        self.slots[component] = {}
+        self.lookup[component] = dict((i, {}) for i in self.fields)
+        for i in lst:
+            self.add(component, i)
+        return self
+
+    def discard(self, component):
+        """
+        Forget component so that it is read again
+        the next time it is needed
+
+        :param component:
+            `str`. i.e. 'metabolite'
+
+        :return:
+            :py:class:`ComponentIndex`
+        """
+        self.version += 1
+        self.components.pop(component, None)
+        self.slots.pop(component, None)
+        self.lookup.pop(component, None)
+        return self
+
+    def add(self, component, obj):
+        """
+        Add obj to the index
+
+        :param component:
+            `str`. i.e. 'metabolite'
+
+        :param obj:
+            The model component to add
+
+        :return:
+            :py:class:`ComponentIndex`
+        """
+        self.count += 1
+        self.version += 1
+        return self._insert(component, obj, self.count)
+
+    def _insert(self, component, obj, slot):
+        """
+        Put obj into slot and its lookup tables
+        """
+        self.components[component][slot] = obj
+        self.slots[component][id(obj)] = slot
+        for field in self.fields:
+            value = getattr(obj, field, None)
+            if value is not None:
+                self.lookup[component][field].setdefault(value, []).append(obj)
+        self._use_keys(obj)
+        return self
+
+    def _use_keys(self, obj):
+        """
+        Mark the key of obj and, for functions, the
+        keys of their parameter descriptions as used
+        """
+        self.keys.use(getattr(obj, 'key', None))
+        for i in getattr(obj, 'list_of_parameter_descriptions', None) or []:
+            self.keys.use(getattr(i, 'key', None))
+
+    def _pop(self, component, obj):
+        """
+        Take obj out of its slot and lookup tables
+
+        :return:
+            `int`. The slot obj was held in or None
+        """
+        slot = self.slots[component].pop(id(obj), None)
+        if slot is None:
+            return None
+
+        for field in self.fields:
+            value = getattr(obj, field, None)
+            matches = self.lookup[component][field].get(value, [])
+            matches[:] = [i for i in matches if i is not obj]
+            if matches == []:
+                self.lookup[component][field].pop(value, None)
+        return slot
+
+    def remove(self, component, obj):
+        """
+        Remove obj from the index. Does nothing
+        if component has not been indexed.
+
+        :param component:
+            `str`. i.e. 'metabolite'
+
+        :param obj:
+            The model component to remove
+
+        :return:
+            :py:class:`ComponentIndex`
+        """
+        if component not in self.components:
+            return self
+
+        slot = self._pop(component, obj)
+        if slot is not None:
+            self.version += 1
+            del self.components[component][slot]
+        return self
+
+    def replace(self, component, old, new):
+        """
+        Put new in the place of old, keeping its position.
+        Does nothing if old is not in the index.
+
+        :param component:
+            `str`. i.e. 'metabolite'
+
+        :param old:
+            The model component to replace
+
+        :param new:
+            The replacement
+
+        :return:
+            :py:class:`ComponentIndex`
+        """
+        if component not in self.components:
+            return self
+
+        slot = self._pop(component, old)
+        if slot is not None:
+            self.version += 1
+            self._insert(component, new, slot)
+        return self
+
+    def values(self, component):
+        """
+        :param component:
+            `str`. i.e. 'metabolite'
+
+        :return:
+            `list` of all indexed components of type component
+        """
+        return list(self.components[component].values())
+
+    def get(self, component, value, by='name'):
+        """
+        Get components whose `by` attribute equals value.
+        Indexed attributes are looked up directly, other
+        attributes are matched by searching the components.
+
+        :param component:
+            `str`. i.e. 'metabolite'
+
+        :param value:
+            Value of attribute to match
+
+        :param by:
+            `str`. Attribute to match
+
+        :return:
+            `list` of matching components
+        """
+        if by in self.fields:
+            return list(self.lookup[component][by].get(value, []))
+        return [i for i in self.components[component].values() if getattr(i, by) == value]
+
+
+class States(object):
+    """
+    The initial state of a :py:class:`Model`. Values are held in a
+    :py:class:`numpy.ndarray` in the order of the StateTemplate with
+    a map from each key (i.e. Metabolite_1) to its position. The
+    InitialState text is only written from the array when the model
+    is saved.
+
+    Index with a key, a position, a slice of positions, a list of
+    either or a boolean mask. A single state gives a `float` and
+    anything else a copy of the values as an array. Assigning through
+    :py:attr:`Model.states` updates the components of the model.
+
+    .. highlight::
+
+        >>> model.states['Metabolite_1']
+        1.0
+        >>> model.states[['Metabolite_1', 'Compartment_1']] = [2, 3]
+        >>> model.states[0:3] = 0
+        >>> model.states.array
+        array([ 0.,  0.,  0.,  3., ...])
+    """
+    def __init__(self, keys, values, model=None):
+        """
+        :param keys:
+            `list`. The objectReference of each state
+
+        :param values:
+            `list` or :py:class:`numpy.ndarray`. One value per key
+
+        :param model:
+            :py:class:`Model` or `None`. Told about changes
+            made with __setitem__
+        """
+        self._keys = list(keys)
+        self._positions = dict((k, i) for i, k in enumerate(self._keys))
+        ## spare capacity at the end so appending is cheap
+        self._array = numpy.array(values, dtype=float)
+        self._size = len(self._keys)
+        self.model = model
+        if self._array.shape != (self._size,):
+            raise errors.InputError('Expected {} values and got {}'.format(
+                self._size, self._array.shape[0]))
+
+    def __str__(self):
+        return 'States({})'.format(
+            ', '.join(['{}={}'.format(k, v) for k, v in self.items()])
+        )
+
+    def __repr__(self):
+        return self.__str__()
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __contains__(self, key):
+        return key in self._positions
+
+    def __deepcopy__(self, memo):
+        """
+        The copy belongs to the copy of the model when
+        the model is being copied and to no model otherwise
+        """
+        return States(self._keys, self.array, model=memo.get(id(self.model)))
+
+    @property
+    def array(self):
+        """
+        The values of the states. Changes made to this array
+        are written to the model when it is saved, but the model's
+        components are not updated.
+
+        :return:
+            :py:class:`numpy.ndarray`
+        """
+        return self._array[:self._size]
+
+    def positions(self, item):
+        """
+        Positions of states in :py:attr:`States.array`
+
+        :param item:
+            A key, position, slice, list of keys or positions or
+            boolean mask
+
+        :return:
+            `int`, `slice` or :py:class:`numpy.ndarray`
+        """
+        if isinstance(item, basestring):
+            try:
+                return self._positions[item]
+            except KeyError:
+                raise errors.InputError('"{}" is not a model state'.format(item))
+
+        if isinstance(item, (int, numpy.integer, slice, numpy.ndarray)):
+            return item
+
+        return numpy.array([self.positions(i) if isinstance(i, basestring) else i
+                            for i in item], dtype=int)
+
+    def __getitem__(self, item):
+        value = self.array[self.positions(item)]
+        if isinstance(value, numpy.ndarray):
+            return value.copy()
+        return float(value)
+
+    def __setitem__(self, item, value):
+        positions = self.positions(item)
+        self.array[positions] = value
+        if self.model is not None:
+            self.model._states_changed(
+                [self._keys[i] for i in numpy.atleast_1d(numpy.arange(self._size)[positions])]
+            )
+
+    def keys(self):
+        return list(self._keys)
+
+    def values(self):
+        return self.array.tolist()
+
+    def items(self):
+        return zip(self._keys, self.values())
+
+    def get(self, key, default=None):
+        if key not in self._positions:
+            return default
+        return self[key]
+
+    def append(self, key, value):
+        """
+        Add a state to the end
+
+        :param key:
+            `str`. objectReference of the state
+
+        :param value:
+            `int`, `float`.
+
+        :return:
+            :py:class:`States`
+        """
+        if key in self._positions:
+            self._array[self._positions[key]] = value
+            return self
+
+        if self._size == self._array.shape[0]:
+            self._array = numpy.resize(self._array, 2 * self._size + 1)
+        self._array[self._size] = value
+        self._positions[key] = self._size
+        self._keys.append(key)
+        self._size += 1
+        return self
+
+    def pop(self, key, default=None):
+        """
+        Remove a state
+
+        :param key:
+            `str`. objectReference of the state
+
+        :return:
+            `float`. The value of the state
+        """
+        if key not in self._positions:
+            return default
+
+        position = self._positions.pop(key)
+        value = float(self._array[position])
+        ## shift the states after it down one place
+        self._array[position:self._size - 1] = self._array[position + 1:self._size]
+        del self._keys[position]
+        self._size -= 1
+        self._positions.update(izip(islice(self._keys, position, None), xrange(position, self._size)))
+        return value
+
+    def extend(self, keys, values):
+        """
+        Add several states to the end, growing the
+        array at most once
+
+        :param keys:
+            `list`. objectReference of each state
+
+        :param values:
+            `list`. Value of each state
+
+        :return:
+            :py:class:`States`
+        """
+        keys = list(keys)
+        if self._size + len(keys) > self._array.shape[0]:
+            self._array = numpy.resize(self._array, 2 * (self._size + len(keys)) + 1)
+        for key, value in zip(keys, values):
+            self.append(key, value)
+        return self
+
+    def remove(self, keys):
+        """
+        Remove several states at once. Keys
+        which are not states are ignored.
+
+        :param keys:
+            `list` or `set`. objectReference of each state
+
+        :return:
+            :py:class:`States`
+        """
+        positions = [self._positions[i] for i in set(keys) if i in self._positions]
+        if positions == []:
+            return self
+
+        keep = numpy.ones(self._size, dtype=bool)
+        keep[positions] = False
+        self._array = self.array[keep]
+        self._keys = [k for k, i in zip(self._keys, keep) if i]
+        self._size = len(self._keys)
+        self._positions = dict((k, i) for i, k in enumerate(self._keys))
+        return self
+
+
 @mixin(ReadModelMixin)
 class KeyFactory(object):
     """
@@ -3423,188 +5337,102 @@ class KeyFactory(object):
         if self.type not in type_list:
             raise errors.InputError('{} not a valid type. {}'.format(self.type, type_list))
 
+    ## type: (indexed component whose keys are taken, key prefix)
+    _prefixes = {
+        'metabolite': ('metabolite', 'Metabolite'),
+        'compartment': ('compartment', 'Compartment'),
+        ##be consistent with the rest of copasi
+        'global_quantity': ('global_quantity', 'ModelValue'),
+        'reaction': ('reaction', 'Reaction'),
+        'parameter_set': (None, 'ParameterSet'),
+        'parameter': ('local_parameter', 'Parameter'),
+        'constant': ('local_parameter', 'Parameter'),
+        'function': ('function', 'Function'),
+        'function_parameter': ('function', 'FunctionParameter'),
+    }
+
     def generate(self, n=1):
         """
+        Generate keys which are not used by the model
+        or by any key generated for it before
+
+        :param n:
+            `int`. Number of keys
 
         :return:
+            `str` when n is 1 otherwise `list` of n keys
         """
-        if self.type == 'metabolite':
-            return self.create_key(self.model.metabolites).next()
-
-        elif self.type == 'compartment':
-            return self.create_key(self.model.compartments).next()
-
-        elif self.type == 'global_quantity':
-            return self.create_key(self.model.global_quantities).next()
-
-        elif self.type == 'reaction':
-            key = self.create_reaction_key(n)
-            return key
-
-        elif self.type == 'parameter_set':
-            return self.create_key(self.model.parameter_sets).next()
-
-        elif self.type == 'parameter':
-            return self.create_key(self.model.local_parameters).next()
-
-        elif self.type == 'function':
-            return self.create_function_key(n)
+        self._do_checks()
+        if self.type == 'report':
+            raise NotImplementedError
 
-        elif self.type == 'constant':
-            return self.create_constant_key(n)
+        keys = self.create_key(n)
+        if n == 1:
+            return keys[0]
+        return keys
 
-        elif self.type == 'report':
-            raise NotImplementedError
-            # return self.create_key(self.model.metabolites).next()
+    def create_key(self, n=1):
+        """
+        Allocate n keys from the :py:class:`KeyAllocator`
+        of the model
 
-        elif self.type == 'function_parameter':
-            return self.create_function_parameter_key(n)
+        :param n:
+            `int`. Number of keys
 
+        :return:
+            `list` of n keys
+        """
+        component, prefix = self._prefixes[self.type]
+        if component is None:
+            allocator = self.model._component_index.keys
+            for i in self.model.parameter_sets:
+                allocator.use(i.key)
+        else:
+            ## reading the component puts its keys in the allocator
+            allocator = self.model._get_index(component).keys
+        return allocator.allocate(prefix, n)
 
-    def create_key(self, model_component):
+    def create_reaction_key(self, n=1):
         """
+        :param n:
+            `int`. Number of keys
 
         :return:
+            `str` when n is 1 otherwise `list` of n keys
         """
-        ##TODO fix bug where create key only works for generating single key at a time.
-        ##be consistent with the rest of copasi
-        if self.type == 'global_quantity':
-            self.type = 'model_value'
-        ## split by underscore
-        word_list = self.type.split('_')
-
-        ## get uppercase for camel caps
-        word_list = [i[0].upper()+i[1:] for i in word_list]
-
-        ## convert word list to camel caps
-        word = reduce(lambda x, y: x + y, word_list)
-
-        bool = True
-        count = 10000
-        ## list for remembering already generated keys
-        key_list = []
-        while bool:
-            key = '{}_{}'.format(word, count)
-            new_list = [i.key for i in model_component] + key_list
-            if key not in new_list:
-                key_list.append(key)
-                yield key
-            count += 1
+        return KeyFactory(self.model, type='reaction').generate(n)
 
-    def create_reaction_key(self, n=1):
+    def create_function_parameter_key(self, n=1):
         """
-        create_key only works for generating a single key at a time.
-        When creating ParameterDescriptions, we often need several keys
-        generated at a time. This method generates these unique keys.
-        :return:
-        """
-        ## get keys
-        existing = [i.key for i in self.model.reactions]
-
-        for i in existing:
-            assert '_' in i
-        existing = [i.split('_')[1] for i in existing]
-        existing = [int(i) for i in existing]
-
-        bool = True
-        count = 0
-        keys = []
-        while count!=n:
-            random_number = randint(1000, 100000000)
-            if random_number not in existing:
-                existing.append(random_number)
-                keys.append(random_number)
-                count += 1
-        keys = ['{}_{}'.format('Reaction',i) for i in keys]
-        if len(keys) == 1:
-            return keys[0]
-        else:
-            return keys
+        :param n:
+            `int`. Number of keys
 
-    def create_function_parameter_key(self, n=1):
+        :return:
+            `str` when n is 1 otherwise `list` of n keys
         """
-        create_key only works for generating a single key at a time.
-        When creating ParameterDescriptions, we often need several keys
-        generated at a time. This method generates these unique keys.
-        :return:
-        """
-        ## get keys
-        existing = [i.key for i in self.model.parameter_descriptions]
-        for i in existing:
-            assert '_' in i
-        existing = [i.split('_')[1] for i in existing]
-        existing = [int(i) for i in existing]
-
-        bool = True
-        count = 0
-        keys = []
-        while count!=n:
-            random_number = randint(1000, 100000000)
-            if random_number not in existing:
-                existing.append(random_number)
-                keys.append(random_number)
-                count += 1
-        keys = ['{}_{}'.format('FunctionParameter',i) for i in keys]
-        if len(keys) == 1:
-            return keys[0]
-        else:
-            return keys
+        return KeyFactory(self.model, type='function_parameter').generate(n)
 
     def create_constant_key(self, n=1):
         """
-        create_key only works for generating a single key at a time.
-        When creating ParameterDescriptions, we often need several keys
-        generated at a time. This method generates these unique keys.
+        :param n:
+            `int`. Number of keys
+
         :return:
+            `str` when n is 1 otherwise `list` of n keys
         """
-        ## get keys
-        existing = [i.key for i in self.model.constants]
-
-        existing = [i.split('_')[1] for i in existing]
-        existing = [int(i) for i in existing]
-
-        bool = True
-        count = 0
-        keys = []
-        while count!=n:
-            random_number = randint(1000, 100000000)
-            if random_number not in existing:
-                existing.append(random_number)
-                keys.append(random_number)
-                count += 1
-        keys = ['{}_{}'.format('Parameter',i) for i in keys]
-        if (len(keys) == 1) and (isinstance(keys, list)):
-            return keys[0]
-        else:
-            return keys
+        return KeyFactory(self.model, type='constant').generate(n)
 
     def create_function_key(self, n=1):
         """
-        create_key only works for generating a single key at a time.
-        When creating ParameterDescriptions, we often need several keys
-        generated at a time. This method generates these unique keys.
+        :param n:
+            `int`. Number of keys
+
         :return:
+            `str` when n is 1 otherwise `list` of n keys
         """
-        ## get keys
-        existing = [i.key for i in self.model.functions]
+        return KeyFactory(self.model, type='function').generate(n)
 
-        existing = [i.split('_')[1] for i in existing]
-        existing = [int(i) for i in existing]
 
-        bool = True
-        count = 0
-        keys = []
-        while count!=n:
-            random_number = randint(1000, 100000000)
-            if random_number not in existing:
-                existing.append(random_number)
-                keys.append(random_number)
-                count += 1
-        keys = ['{}_{}'.format('Function', i) for i in keys]
-        if (len(keys) == 1) and (isinstance(keys, list)):
-            return keys[0]
-        else:
-            return keys
 @mixin(ComparisonMethodsMixin)
 class Expression(object):
     """
@@ -3930,6 +5758,8 @@ class MassAction(Function):
     Recreates the COPASI MassAction rate law but didn't get used
     in main code.
     """
+    __slots__ = ()
+
     def __init__(self, model, **kwargs):
         super(MassAction, self).__init__(model, **kwargs)
         self.model = model
@@ -4299,6 +6129,24 @@ class InsertParameters(object):
         elif isinstance(self.parameters, pandas.core.frame.DataFrame):
             return self.parameters.to_dict()
 
+    @cached_property
+    def data(self):
+        """
+        Every parameter set as a :py:class:`pandas.DataFrame`.
+        Columns = parameters, rows = parameter sets. Output
+        from `parameter_path` is in increasing RSS order.
+
+        :return:
+            :py:class:`pandas.DataFrame`
+        """
+        if self.parameter_dict != None:
+            return pandas.DataFrame(self.parameter_dict, index=[0])
+
+        if self.parameter_path != None:
+            return viz.Parse(self.parameter_path, copasi_file=self.model.copasi_file).data
+
+        return self.df
+
     @cached_property
     def parameters(self):
         """
@@ -4314,40 +6162,67 @@ class InsertParameters(object):
             assert isinstance(self.parameter_dict, dict), 'The parameter_dict argument takes a Python dictionary'
             for i in self.parameter_dict:
                 assert i in self.model.all_variable_names,'{} is not a parameter. These are your parameters:{}'.format(i,self.GMQ.get_all_model_variables().keys())
-            return pandas.DataFrame(self.parameter_dict, index=[0])
+            return self.data
 
-        if self.parameter_path != None:
-            P = viz.Parse(self.parameter_path, copasi_file=self.model.copasi_file)
-            if isinstance(self.index, int):
-                return pandas.DataFrame(P.data.iloc[self.index]).transpose()
-            else:
-                return P.data.iloc[self.index]
+        return pandas.DataFrame(self.data.iloc[self.index]).transpose()
 
-        if self.df is not None:
-            df = pandas.DataFrame(self.df.iloc[self.index]).transpose()
-        return df
+    @property
+    def _row(self):
+        """
+        For Developers
 
-    def insert_locals(self):
+        The parameter set to insert
+
+        :return:
+            :py:class:`pandas.Series`. index = parameter names
         """
+        return self.parameters.iloc[0]
+
+    def _quantities(self, component):
+        """
+        For Developers
+
+        The rows of :py:attr:`Model.quantities` for the
+        components of type `component` which are in the
+        parameter set to insert.
+
+        :param component:
+            `str`. compartment, metabolite or global_quantity
 
         :return:
+            :py:class:`pandas.DataFrame`
+        """
+        quantities = self.model._quantity_table()
+        return quantities[(quantities['type'] == component) &
+                          quantities['name'].isin(self._row.index)]
+
+    def insert_locals(self):
         """
-        # print self.parameters
+        Insert new values into the local parameters. The elements
+        holding them are found in a single pass over the xml.
 
-        locals = [j for i in self.model.reactions for j in i.parameters if j.global_name in self.parameters.keys()]
+        :return:
+            :py:class:`Model`
+        """
+        row = self._row
+        elements = self.model._local_parameter_elements(self.model.xml)
+        locals = [i for i in row.index if i in elements]
         if locals == []:
             return self.model
-        else:
-            for loc in locals:
-                for element_tags in self.model.xml.iter():
-                    if element_tags.tag == '{http://www.copasi.org/static/schema}ListOfReactions':
-                        for reaction in element_tags:
-                            if reaction.attrib['name'] == loc.reaction_name:
-                                for reaction_xml in reaction:
-                                    if reaction_xml.tag == '{http://www.copasi.org/static/schema}ListOfConstants':
-                                        for constant_xml in reaction_xml:
-                                            if constant_xml.attrib['name'] == loc.name:
-                                                constant_xml.attrib['value'] = str(float(self.parameters[loc.global_name]))
+
+        index = self.model._get_index('local_parameter')
+        for global_name in locals:
+            value = repr(float(row[global_name]))
+            for element in elements[global_name]:
+                element.attrib['value'] = value
+
+            for loc in index.get('local_parameter', global_name, by='global_name'):
+                new = shallow_copy(loc)
+                new.value = value
+                index.replace('local_parameter', loc, new)
+
+        ## reactions hold copies of their local parameters
+        self.model._invalidate('local_parameter')
         return self.model
 
     def insert_compartments(self):
@@ -4355,49 +6230,54 @@ class InsertParameters(object):
         insert new parameters into compartment
         :return:
         """
-        compartments = [i for i in self.model.compartments if i.name in self.parameters]
-        if compartments == []:
+        compartments = self._quantities('compartment')
+        if compartments.empty:
             return self.model
-        else:
 
-            LOG.critical('Changing a compartment volume has consequences for the rest of the metabolites assigned to that compartment')
-            for i in compartments:
-                self.model = self.model.set('compartment', i.name, str(self.parameters[i.name][self.index]),
-                                     match_field='name', change_field='initial_value')
-            return self.model
+        LOG.critical('Changing a compartment volume has consequences for the rest of the metabolites assigned to that compartment')
+        row = self._row
+        for key, name in zip(compartments['key'], compartments['name']):
+            self.model._set_state(key, float(row[name]))
+        return self.model
 
     def insert_metabolites(self):
         """
-        insert new parameters into compartment
+        insert new parameters into metabolites. Concentrations
+        are converted with the volume of their compartment, so
+        insert compartments first.
         :return:
         """
-        metabolites = [i for i in self.model.metabolites if i.name in self.parameters]
-        if metabolites == []:
-            return self.model
-        else:
-            for i in metabolites:
-                self.model = self.model.set('metabolite',
-                                            i.name,
-                                            str(self.parameters[i.name][self.index]),
-                                            match_field='name', change_field=self.quantity_type)
+        metabolites = self._quantities('metabolite')
+        if metabolites.empty:
             return self.model
 
+        row = self._row
+        quantity_unit = self.model.quantity_unit
+        states = self.model._states
+        quantities = self.model._quantity_table()
+        compartments = quantities[quantities['type'] == 'compartment'].set_index('name')['key']
+        for key, name, compartment in zip(metabolites['key'], metabolites['name'],
+                                          metabolites['compartment']):
+            value = float(row[name])
+            if self.quantity_type == 'concentration':
+                value = self.model.convert_molar_to_particles(
+                    value, quantity_unit, float(states[compartments[compartment]]))
+            self.model._set_state(key, value)
+        return self.model
+
     def insert_global_quantities(self):
         """
-        insert new parameters into compartment
+        insert new parameters into global quantities
         :return:
         """
-        global_quantities = [i for i in self.model.global_quantities if i.name in self.parameters]
-        if global_quantities == []:
-            return self.model
-        else:
-            for i in global_quantities:
-                self.model = self.model.set('global_quantity',
-                                            i.name,
-                                            str(self.parameters[i.name][self.index]),
-                                            match_field='name', change_field='initial_value')
+        global_quantities = self._quantities('global_quantity')
+        if global_quantities.empty:
             return self.model
 
+        row = self._row
+        for key, name in zip(global_quantities['key'], global_quantities['name']):
+            self.model._set_state(key, float(row[name]))
+        return self.model
 
     def insert(self):
         """
@@ -4411,19 +6291,642 @@ class InsertParameters(object):
         self.model = self.insert_metabolites()
         return self.model
 
+    def to_models(self, filenames=None):
+        """
+        Insert every parameter set in `df` or in the `parameter_path`
+        data into its own copy of the model, rather than only the
+        parameter set given by `index`.
+
+        :param filenames:
+            `list` or `None`. The copasi_file of each copy. Defaults
+            to the copasi_file of the model with the position of the
+            parameter set appended
+
+        :return:
+            `list`. Each element is :py:class:`Model`
+        """
+        if filenames is None:
+            filenames = ['{}_{}.cps'.format(self.model.copasi_file[:-4], i)
+                         for i in range(self.data.shape[0])]
+
+        if len(filenames) != self.data.shape[0]:
+            raise errors.InputError('Need one filename per parameter set. Got {} filenames for {} parameter sets'.format(
+                len(filenames), self.data.shape[0]))
+
+        models = []
+        for i, filename in enumerate(filenames):
+            I = InsertParameters(self.model.copy(filename), df=self.data,
+                                 index=i, quantity_type=self.quantity_type)
+            models.append(I.model)
+        return models
+
+    def to_files(self, filenames):
+        """
+        Write a copy of the model for every row of `df` or of the
+        `parameter_path` data, rather than only the row given by
+        `index`. Uses :py:class:`BulkWriter` so the model is only
+        serialized once.
+
+        :param filenames:
+            `list`. One filename per row
+
+        :return:
+            `list`. The filenames written
+        """
+        return BulkWriter(self.model, self.data, filenames,
+                          quantity_type=self.quantity_type).write()
+
+
+@mixin(ReadModelMixin)
+class BulkWriter(object):
+    """
+    Write many variants of a model which differ only in their parameter
+    values or report filenames. The model is serialized once into a
+    template with a placeholder wherever the variants differ. Each variant
+    is then written by filling in the placeholders, rather than building
+    and saving a :py:class:`Model` for every variant.
+
+    The columns of `df` are the names of compartments, metabolites,
+    global quantities or local parameters, i.e. '(R1).k1'. A column
+    may also be the name of a task, i.e. 'Scan', in which case its values
+    are the targets of that task's report. Other columns, such as RSS,
+    are ignored.
+
+    .. highlight::
+
+        >>> df = pandas.DataFrame({'A': [1, 2], '(R1).k1': [0.1, 0.2]})
+        >>> filenames = ['/path/to/model0.cps', '/path/to/model1.cps']
+        >>> BulkWriter(model, df, filenames).write()
+    """
+    def __init__(self, model, df, filenames=None,
+                 quantity_type='concentration'):
+        """
+        :param model:
+            :py:class:`Model`. The model to base the variants on
+
+        :param df:
+            :py:class:`pandas.DataFrame`. One row per variant
+
+        :param filenames:
+            `list` or `None`. One filename per row of `df`.
+            Required by :py:meth:`BulkWriter.write`
+
+        :param quantity_type:
+            `str`. default='concentration'. Can also be `particle_numbers`.
+            The units of the metabolite columns
+        """
+        self.model = self.read_model(model)
+        self.df = df
+        self.filenames = filenames
+        self.quantity_type = quantity_type
+        self._do_checks()
+
+    def __str__(self):
+        return 'BulkWriter(model={}, variants={})'.format(
+            self.model.copasi_file, self.df.shape[0])
+
+    def __repr__(self):
+        return self.__str__()
+
+    def _do_checks(self):
+        """
+        Verify user input
+        :return:
+        """
+        if self.quantity_type not in ['concentration', 'particle_numbers']:
+            raise errors.InputError('quantity_type argument should be concentration or particle_numbers')
+
+        if not isinstance(self.df, pandas.DataFrame):
+            raise errors.InputError('Argument to \'df\' keyword needs to be a pandas.DataFrame')
+
+        if self.filenames is not None:
+            if len(self.filenames) != self.df.shape[0]:
+                raise errors.InputError('Need one filename per row of df. Got {} filenames for {} rows'.format(
+                    len(self.filenames), self.df.shape[0]))
+
+    @cached_property
+    def _states(self):
+        """
+        For Developers
+
+        The model states which have a column in `df`.
+
+        :return:
+            `dict`. dict[column] = (component, model component)
+        """
+        dct = {}
+        for component in ['compartment', 'global_quantity', 'metabolite']:
+            for i in self.model._get_index(component).values(component):
+                if i.name in self.df.columns:
+                    dct[i.name] = (component, i)
+        return dct
+
+    @cached_property
+    def template(self):
+        """
+        The model serialized once with a placeholder
+        wherever a column of `df` changes it.
+
+        :return:
+            `list`. Chunks of the serialized model. Every
+            second element is the column which fills the gap
+            between the chunks either side of it
+        """
+        xml = deepcopy(self.model._share_xml())
+        sections = xpaths.Sections(xml)
+        columns = []
+        tag = 'pycotools{}'.format(uuid.uuid4().hex)
+
+        def placeholder(column):
+            columns.append(column)
+            return '{}_{}_'.format(tag, len(columns) - 1)
+
+        locals = self.model._local_parameter_elements(xml)
+
+        ## reports added by tasks.Scan are not in the copasi namespace
+        reports = {}
+        for task in sections['ListOfTasks']:
+            report = task.find(xpaths.tag('Report'))
+            if report is None:
+                report = task.find('Report')
+            reports[task.attrib['name']] = report
+
+        for column in self.df.columns:
+            if column in locals:
+                for element in locals[column]:
+                    element.attrib['value'] = placeholder(column)
+
+            elif column in reports:
+                if reports[column] is None:
+                    raise errors.InputError('The "{}" task does not have a report'.format(column))
+                reports[column].attrib['target'] = placeholder(column)
+
+        ## the states are a single space separated text node
+        states = dict((obj.key, column) for column, (component, obj) in self._states.items())
+        if states:
+            sections['InitialState'].text = "{} \n".format(' '.join(
+                [placeholder(states[key]) if key in states else repr(value)
+                 for key, value in self.model._states.items()]
+            ))
+
+        chunks = re.split('{}_(\d+)_'.format(tag), self.model._serialize(xml))
+        for i in range(1, len(chunks), 2):
+            chunks[i] = columns[int(chunks[i])]
+        return chunks
+
+    @cached_property
+    def _values(self):
+        """
+        For Developers
+
+        The text which fills each placeholder of
+        :py:attr:`BulkWriter.template`, worked out
+        a column at a time.
+
+        :return:
+            `list`. One `dict[column] = str` per variant
+        """
+        text = OrderedDict()
+        for column in set(self.template[1::2]):
+            values = list(self.df[column])
+            component, obj = self._states.get(column, (None, None))
+            if component == 'metabolite' and self.quantity_type == 'concentration':
+                ## concentrations are converted with the volume of the variant
+                compartment = obj.compartment
+                if compartment.name in self.df.columns:
+                    volumes = [float(i) for i in self.df[compartment.name]]
+                else:
+                    volumes = [float(compartment.initial_value)] * len(values)
+                quantity_unit = self.model.quantity_unit
+                values = [self.model.convert_molar_to_particles(float(i), quantity_unit, j)
+                          for i, j in zip(values, volumes)]
+
+            text[column] = [escape(i).encode('ascii', 'xmlcharrefreplace')
+                            if isinstance(i, basestring) else repr(float(i))
+                            for i in values]
+        if not text:
+            return [{} for i in range(self.df.shape[0])]
+        return [dict(zip(text.keys(), i)) for i in zip(*text.values())]
+
+    def to_bytes(self, i):
+        """
+        Serialized variant
+
+        :param i:
+            `int`. Position of the variant in `df`
+
+        :return:
+            `str`. The copasi file of the variant
+        """
+        values = self._values[i]
+        chunks = list(self.template)
+        for j in range(1, len(chunks), 2):
+            chunks[j] = values[chunks[j]]
+        return ''.join(chunks)
+
+    def to_model(self, i):
+        """
+        The variant as a :py:class:`Model`, without
+        writing it to file.
+
+        :param i:
+            `int`. Position of the variant in `df`
+
+        :return:
+            :py:class:`Model`
+        """
+        model = deepcopy(self.model)
+        model.xml = etree.fromstring(self.to_bytes(i))
+        ## states of the base model were copied along with it
+        model.__dict__.pop('_states', None)
+        model._states_modified = False
+        if self.filenames is not None:
+            model.copasi_file = self.filenames[i]
+        return model
+
+    def write(self):
+        """
+        Write every variant to its filename
+
+        :return:
+            `list`. The filenames written
+        """
+        if self.filenames is None:
+            raise errors.InputError('filenames are needed to write the variants')
+
+        for i, filename in enumerate(self.filenames):
+            data = self.to_bytes(i)
+            self.model._replace_file(filename, lambda f: f.write(data))
+        return list(self.filenames)
+
+
+class Patch(object):
+    """
+    The differences between two versions of a :py:class:`Model`,
+    made by :py:meth:`Model.diff` and applied with :py:meth:`Model.apply`.
+
+    A patch has three parts:
+
+        - values: dict[global_name] = value. Local parameters which
+          are in both models but have different values
+        - states: dict[key] = value. The states, i.e. metabolite
+          particle numbers or global quantity values, which are
+          new or have a different value
+        - xml: list of operations. Each adds, removes or replaces an
+          element of a section of the model, i.e. a reaction in the
+          `ListOfReactions` or a task in the `ListOfTasks`, or a whole
+          section when its elements can not be told apart.
+
+    Patches are saved as json.
+
+    .. highlight::
+
+        >>> patch = base.diff(variant)
+        >>> patch.values
+        {'(A2B).k1': 0.3}
+        >>> patch.states
+        {'Metabolite_1': 6.022140857e+20}
+        >>> patch.save('variant.patch')
+        >>> variant = base.copy('variant.cps').apply('variant.patch')
+    """
+    ## written from the states so it is left out of the xml operations
+    _skip = ['InitialState']
+
+    def __init__(self, values=None, states=None, xml=None):
+        """
+        :param values:
+            `dict`. dict[global_name] = value
+
+        :param states:
+            `dict`. dict[key] = value
+
+        :param xml:
+            `list` of operations on the xml
+        """
+        self.values = values or {}
+        self.states = states or {}
+        self.xml = xml or []
+
+    def __str__(self):
+        return 'Patch(values={}, states={}, xml={})'.format(
+            len(self.values), len(self.states), len(self.xml))
+
+    def __repr__(self):
+        return self.__str__()
+
+    def __len__(self):
+        return len(self.values) + len(self.states) + len(self.xml)
+
+    def to_dict(self):
+        """
+        :return:
+            `dict`
+        """
+        return {'values': self.values,
+                'states': self.states,
+                'xml': [list(i) for i in self.xml]}
+
+    def save(self, filename):
+        """
+        :param filename:
+            `str`. Where to write the patch
+
+        :return:
+            `str`. filename
+        """
+        data = json.dumps(self.to_dict())
+        return Model._replace_file(filename, lambda f: f.write(data))
+
+    @classmethod
+    def load(cls, filename):
+        """
+        :param filename:
+            `str`. A file written by :py:meth:`Patch.save`
+
+        :return:
+            :py:class:`Patch`
+        """
+        with open(filename) as f:
+            dct = json.load(f)
+        return cls(values=dct['values'], states=dct['states'], xml=dct['xml'])
+
+    @classmethod
+    def from_models(cls, model, other):
+        """
+        The changes which turn model into other. The values of the
+        local parameters are compared first and the xml of other is
+        then compared with a copy of model which has the new values.
+
+        :param model:
+            :py:class:`Model`
+
+        :param other:
+            :py:class:`Model`
+
+        :return:
+            :py:class:`Patch`
+        """
+        old = dict((i.global_name, float(i.value)) for i in model.constants)
+        values = {}
+        for i in other.constants:
+            if i.global_name in old and old[i.global_name] != float(i.value):
+                values[i.global_name] = float(i.value)
+
+        old = dict(zip(model._states.keys(), model._states.values()))
+        states = {}
+        for key, value in zip(other._states.keys(), other._states.values()):
+            if old.get(key) != value:
+                states[key] = float(value)
+
+        base = cls._read_xml(model)
+        if values != {}:
+            base = deepcopy(base)
+            cls._set_values(base, values)
+
+        xml = cls._diff_xml(base, cls._read_xml(other))
+        return cls(values=values, states=states, xml=xml)
+
+    @staticmethod
+    def _read_xml(model):
+        """
+        For Developers
+
+        :return:
+            :py:class:`etree._Element`. The xml of model
+            without taking a copy of a shared snapshot
+        """
+        return model._xml if model._xml is not None else model._template
+
+    @staticmethod
+    def _set_values(xml, values):
+        """
+        For Developers
+
+        Write the values of local parameters into xml
+
+        :param xml:
+            :py:class:`etree._Element`
+
+        :param values:
+            `dict`. dict[global_name] = value
+
+        :return:
+            None
+        """
+        elements = Model._local_parameter_elements(xml)
+        for global_name, value in values.items():
+            if global_name not in elements:
+                raise errors.InputError('Patch does not apply to model. No local parameter "{}"'.format(global_name))
+            for element in elements[global_name]:
+                element.attrib['value'] = repr(float(value))
+
+    @staticmethod
+    def _element_id(element):
+        """
+        For Developers
+
+        :return:
+            `str` or `None`. The attribute which tells
+            element apart from others in its section
+        """
+        for i in ['key', 'objectReference', 'name']:
+            if i in element.attrib:
+                return element.attrib[i]
+        return None
+
+    @staticmethod
+    def _children(element):
+        """
+        For Developers
+
+        :return:
+            :py:class:`OrderedDict`. dict[tag without namespace] = child.
+            Comments are left out
+        """
+        return OrderedDict((str(etree.QName(i).localname), i) for i in element
+                           if isinstance(i.tag, basestring))
+
+    @classmethod
+    def _parents(cls, xml):
+        """
+        For Developers
+
+        :return:
+            `dict`. dict[name] = the root element and
+            the `Model` element of xml
+        """
+        return {'COPASI': xml, 'Model': xml.find(xpaths.tag('Model'))}
+
+    @classmethod
+    def _diff_xml(cls, xml, other):
+        """
+        For Developers
+
+        The operations which turn the sections of
+        xml into the sections of other
 
+        :return:
+            `list` of operations
+        """
+        ops = []
+        parents = cls._parents(xml)
+        other_parents = cls._parents(other)
+        if dict(parents['Model'].attrib) != dict(other_parents['Model'].attrib):
+            ops.append(['attributes', 'COPASI', 'Model', dict(other_parents['Model'].attrib)])
+
+        for parent in ['COPASI', 'Model']:
+            sections = cls._children(parents[parent])
+            other_sections = cls._children(other_parents[parent])
+            for name in cls._skip + ['Model']:
+                sections.pop(name, None)
+                other_sections.pop(name, None)
+
+            for name in sections:
+                if name not in other_sections:
+                    ops.append(['remove_section', parent, name])
+
+            after = None
+            for name, element in other_sections.items():
+                if name not in sections:
+                    ops.append(['add_section', parent, name, after, etree.tostring(element)])
+                else:
+                    ops += cls._diff_section(parent, name, sections[name], element)
+                after = name
+        return ops
+
+    @classmethod
+    def _diff_section(cls, parent, name, section, other):
+        """
+        For Developers
+
+        The operations which turn the elements of section into those
+        of other. Elements are matched by :py:meth:`Patch._element_id`.
+        The whole section is replaced when they can not be matched.
 
+        :return:
+            `list` of operations
+        """
+        tostring = lambda e: etree.tostring(e, with_tail=False)
+        if tostring(section) == tostring(other):
+            return []
 
+        ids = [cls._element_id(i) for i in section]
+        other_ids = [cls._element_id(i) for i in other]
+        common = set(ids) & set(other_ids)
+        if None in ids or None in other_ids \
+                or len(set(ids)) != len(ids) or len(set(other_ids)) != len(other_ids) \
+                or dict(section.attrib) != dict(other.attrib) \
+                or (section.text or '').strip() != (other.text or '').strip() \
+                or [i for i in ids if i in common] != [i for i in other_ids if i in common]:
+            return [['replace_section', parent, name, tostring(other)]]
+
+        elements = dict(zip(ids, section))
+        ops = [['remove', parent, name, i] for i in ids if i not in common]
+        inserts = []
+        for position, (i, element) in enumerate(zip(other_ids, other)):
+            if i not in common:
+                inserts.append(['insert', parent, name, position, tostring(element)])
+            elif tostring(elements[i]) != tostring(element):
+                ops.append(['replace', parent, name, i, tostring(element)])
+        return ops + inserts
+
+    def apply(self, model):
+        """
+        Apply the patch to model. Use :py:meth:`Model.apply`
 
+        :param model:
+            :py:class:`Model`
 
+        :return:
+            :py:class:`Model`
+        """
+        ## states changed since the model was read are kept
+        model._write_states()
+        old = dict(zip(model._states.keys(), model._states.values()))
+        xml = model.xml
+        parents = self._parents(xml)
+        for op in self.xml:
+            self._apply_op(parents, op)
+
+        ## write the states in the order of the new StateTemplate
+        if self.states != {} or 'StateTemplate' in [i[2] for i in self.xml]:
+            values = []
+            for i in parents['Model'].find(xpaths.tag('StateTemplate')):
+                key = i.attrib['objectReference']
+                if key in self.states:
+                    values.append(float(self.states[key]))
+                elif key in old:
+                    values.append(old[key])
+                else:
+                    raise errors.InputError('Patch does not apply to model. No value for the state "{}"'.format(key))
+            parents['Model'].find(xpaths.tag('InitialState')).text = "{} \n".format(
+                ' '.join([repr(i) for i in values]))
+
+        if self.values != {}:
+            self._set_values(xml, self.values)
+
+        ## everything read from the xml is read again
+        for i in ['_component_index', '_states', '_quantities', '_fit_items']:
+            model.__dict__.pop(i, None)
+        model._states_modified = False
+        return model
 
+    def _apply_op(self, parents, op):
+        """
+        For Developers
 
+        Apply a single operation from :py:attr:`Patch.xml`
 
+        :param parents:
+            `dict`. Output from :py:meth:`Patch._parents`
 
+        :param op:
+            `list`. The operation
 
+        :return:
+            :py:class:`Patch`
+        """
+        action, parent, name = op[:3]
+        parent = parents[parent]
+        sections = self._children(parent)
+        if action == 'add_section':
+            after = op[3]
+            position = 0
+            if after in sections:
+                position = parent.index(sections[after]) + 1
+            parent.insert(position, etree.fromstring(op[4]))
+            return self
 
+        if name not in sections:
+            raise errors.InputError('Patch does not apply to model. No section called "{}"'.format(name))
+        section = sections[name]
 
+        if action == 'remove_section':
+            parent.remove(section)
 
+        elif action == 'replace_section':
+            new = etree.fromstring(op[3])
+            new.tail = section.tail
+            parent.replace(section, new)
 
+        elif action == 'attributes':
+            section.attrib.clear()
+            section.attrib.update(op[3])
 
+        elif action == 'insert':
+            section.insert(op[3], etree.fromstring(op[4]))
 
+        else:
+            elements = dict((self._element_id(i), i) for i in section)
+            if op[3] not in elements:
+                raise errors.InputError('Patch does not apply to model. No element "{}" in "{}"'.format(op[3], name))
+            element = elements[op[3]]
+            if action == 'remove':
+                section.remove(element)
+            elif action == 'replace':
+                new = etree.fromstring(op[4])
+                new.tail = element.tail
+                section.replace(element, new)
+            else:
+                raise errors.InputError('"{}" is not a patch operation'.format(action))
+        return self
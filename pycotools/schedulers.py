@@ -0,0 +1,739 @@
+# -*-coding: utf-8 -*-
+"""
+
+ This file is part of PyCoTools.
+
+ PyCoTools is free software: you can redistribute it and/or modify
+ it under the terms of the GNU Lesser General Public License as published by
+ the Free Software Foundation, either version 3 of the License, or
+ (at your option) any later version.
+
+ PyCoTools is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ GNU Lesser General Public License for more details.
+
+ You should have received a copy of the GNU Lesser General Public License
+ along with PyCoTools.  If not, see <http://www.gnu.org/licenses/>.
+
+
+ $Author: Ciaran Welsh
+
+Backends which run copasi files with CopasiSE. Each
+:py:class:`Scheduler` submits copasi files as jobs and
+can report the status of, wait for and cancel the jobs
+it submitted. :py:class:`tasks.Run`,
+:py:class:`tasks.MultiParameterEstimation` and
+:py:class:`tasks.ProfileLikelihood` take a scheduler
+argument to run their models with any of them.
+
+Usage:
+    >>> from pycotools import schedulers
+    >>> scheduler = schedulers.SlurmScheduler(options=['--time', '48:00:00'])
+    >>> job_ids = scheduler.submit_array(['/path/to/model1.cps', '/path/to/model2.cps'])
+    >>> scheduler.wait(job_ids, interval=60)
+"""
+
+import os
+import time
+import threading
+import Queue
+import subprocess
+from pipes import quote
+from collections import OrderedDict
+from multiprocessing import cpu_count
+from lxml import etree
+import errors
+
+
+class Scheduler(object):
+    """
+    Interface for running copasi files with CopasiSE. Subclasses
+    implement :py:meth:`Scheduler.submit`, :py:meth:`Scheduler.status`
+    and :py:meth:`Scheduler.cancel`. Job ids are strings and a job is
+    always in one of the states below.
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    CANCELLED = 'cancelled'
+    FINISHED = [DONE, FAILED, CANCELLED]
+
+    def submit(self, copasi_file, job_name=None, script=None):
+        """
+        Run CopasiSE on copasi_file
+
+        :param copasi_file:
+            `str`. Full path to a copasi file with its task scheduled
+
+        :param job_name:
+            `str`. Defaults to the name of the copasi file
+
+        :param script:
+            `str`. Where to write the job script, for schedulers which
+            use one. Defaults to the copasi file with a .sh extension
+
+        :return:
+            `str`. Job id
+        """
+        raise errors.NotImplementedError
+
+    def submit_array(self, copasi_files, job_name=None, script=None):
+        """
+        Run CopasiSE on each of copasi_files. Submits each one
+        separately unless the scheduler has array jobs
+
+        :param copasi_files:
+            `list` of `str`
+
+        :param job_name:
+            `str`. Name of every job. Defaults to the name of
+            each copasi file, or of the first copasi file for
+            an array job
+
+        :param script:
+            `str`. Where to write the array job script, for schedulers
+            which use one. Not used when each copasi file is submitted
+            separately since each job writes its own default script
+
+        :return:
+            `list` of `str`. Job id of each copasi file
+        """
+        kwargs = {}
+        if job_name is not None:
+            kwargs['job_name'] = job_name
+        return [self.submit(i, **kwargs) for i in copasi_files]
+
+    def status(self, job_id):
+        """
+        :param job_id:
+            `str`
+
+        :return:
+            `str`. One of pending, running, done, failed or cancelled
+        """
+        raise errors.NotImplementedError
+
+    def cancel(self, job_id):
+        """
+        Cancel a job whether it is waiting or running
+
+        :param job_id:
+            `str`
+
+        :return:
+            None
+        """
+        raise errors.NotImplementedError
+
+    def wait(self, job_ids, interval=10, timeout=None):
+        """
+        Wait for jobs to finish
+
+        :param job_ids:
+            `str` or `list` of `str`
+
+        :param interval:
+            `int`, `float`. Seconds between checks on the jobs
+
+        :param timeout:
+            `int`, `float`. Seconds after which to raise
+            :py:class:`errors.SchedulerError`. Defaults to waiting forever
+
+        :return:
+            `dict`. Final status of each job
+        """
+        if isinstance(job_ids, basestring):
+            job_ids = [job_ids]
+        start = time.time()
+        statuses = OrderedDict((i, None) for i in job_ids)
+        while True:
+            for job_id, status in statuses.items():
+                if status not in self.FINISHED:
+                    statuses[job_id] = self.status(job_id)
+            if all([i in self.FINISHED for i in statuses.values()]):
+                return dict(statuses)
+            if timeout is not None and time.time() - start > timeout:
+                raise errors.SchedulerError('Jobs still running after {} seconds: {}'.format(
+                    timeout, [k for k, v in statuses.items() if v not in self.FINISHED]))
+            time.sleep(interval)
+
+
+class LocalScheduler(Scheduler):
+    """
+    Run jobs on this machine, at most max_active at a time.
+    Each of a pool of threads starts CopasiSE on the next job
+    and waits for it to exit. :py:class:`tasks.RunParallel`
+    runs its models with a LocalScheduler.
+
+    .. highlight::
+
+        >>> scheduler = LocalScheduler(max_active=4)
+        >>> job_ids = scheduler.submit_array(copasi_files)
+        >>> scheduler.wait(job_ids)
+        >>> scheduler.jobs[job_ids[0]]['stderr']
+    """
+    def __init__(self, max_active=None, done=None):
+        """
+        :param max_active:
+            `int`. Number of CopasiSE processes to run at once.
+            Defaults to the number of cpus
+
+        :param done:
+            :py:class:`Queue.Queue` or `None`. When given the id
+            of each job is put on it as soon as the job finishes
+        """
+        self.max_active = max_active
+        if self.max_active is None:
+            self.max_active = cpu_count()
+        if self.max_active < 1:
+            raise errors.InputError('max_active should be at least 1. Got {}'.format(self.max_active))
+        self.done = done
+
+        ## copasi_file, status, returncode, wall_time, stderr and process of each job
+        self.jobs = OrderedDict()
+        self._queue = Queue.Queue()
+        self._lock = threading.Lock()
+        ## number of worker threads
+        self._workers = 0
+
+    def __str__(self):
+        return 'LocalScheduler(max_active={})'.format(self.max_active)
+
+    def submit(self, copasi_file, job_name=None, script=None):
+        with self._lock:
+            job_id = str(len(self.jobs) + 1)
+            self.jobs[job_id] = {'copasi_file': copasi_file,
+                                 'status': self.PENDING,
+                                 'returncode': None,
+                                 'wall_time': None,
+                                 'stderr': None,
+                                 'process': None,
+                                 'finished': threading.Event()}
+            self._queue.put(job_id)
+            ## workers are started as they are needed and
+            ## exit once there is nothing left to run
+            if self._workers < self.max_active:
+                self._workers += 1
+                worker = threading.Thread(target=self._worker)
+                worker.daemon = True
+                worker.start()
+        return job_id
+
+    def status(self, job_id):
+        return self._job(job_id)['status']
+
+    def cancel(self, job_id):
+        job = self._job(job_id)
+        with self._lock:
+            if job['status'] in self.FINISHED:
+                return
+            waiting = job['status'] == self.PENDING
+            job['status'] = self.CANCELLED
+            process = job['process']
+        if waiting:
+            ## the worker skips it when it comes off the queue
+            self._finish(job_id)
+        elif process is not None:
+            try:
+                process.terminate()
+            except OSError:
+                ## it has already exited
+                pass
+
+    def wait(self, job_ids, interval=10, timeout=None):
+        """
+        Wait for jobs to finish. Blocks until each job
+        finishes rather than checking every interval seconds
+
+        :param job_ids:
+            `str` or `list` of `str`
+
+        :param interval:
+            Not used
+
+        :param timeout:
+            `int`, `float`. Seconds after which to raise
+            :py:class:`errors.SchedulerError`. Defaults to waiting forever
+
+        :return:
+            `dict`. Final status of each job
+        """
+        if isinstance(job_ids, basestring):
+            job_ids = [job_ids]
+        start = time.time()
+        for job_id in job_ids:
+            finished = self._job(job_id)['finished']
+            if timeout is None:
+                finished.wait()
+            elif not finished.wait(max(0, timeout - (time.time() - start))):
+                raise errors.SchedulerError('Job "{}" still running after {} seconds'.format(
+                    job_id, timeout))
+        return {i: self.status(i) for i in job_ids}
+
+    def _cancel_waiting(self, job_ids):
+        """
+        For Developers
+
+        Cancel those of job_ids which have not started
+        and leave running jobs to finish
+
+        :param job_ids:
+            `list` of `str`
+
+        :return:
+            None
+        """
+        with self._lock:
+            waiting = [i for i in job_ids if self._job(i)['status'] == self.PENDING]
+            for i in waiting:
+                self.jobs[i]['status'] = self.CANCELLED
+        for i in waiting:
+            self._finish(i)
+
+    def _job(self, job_id):
+        """
+        For Developers
+
+        :param job_id:
+            `str`
+
+        :return:
+            `dict`. The job
+        """
+        try:
+            return self.jobs[job_id]
+        except KeyError:
+            raise errors.SchedulerError('No job with id "{}"'.format(job_id))
+
+    def _finish(self, job_id):
+        """
+        For Developers
+
+        Tell anything waiting on job_id that it has finished.
+        Called once for each job
+
+        :param job_id:
+            `str`
+
+        :return:
+            None
+        """
+        self.jobs[job_id]['finished'].set()
+        if self.done is not None:
+            self.done.put(job_id)
+
+    def _worker(self):
+        """
+        For Developers
+
+        Run jobs from the queue one after another
+        until the queue is empty
+
+        :return:
+            None
+        """
+        while True:
+            ## started under the lock so cancel either sees the
+            ## process or stops it from being started
+            with self._lock:
+                try:
+                    job_id = self._queue.get_nowait()
+                except Queue.Empty:
+                    self._workers -= 1
+                    return
+                job = self.jobs[job_id]
+                if job['status'] == self.CANCELLED:
+                    continue
+                job['status'] = self.RUNNING
+                start = time.time()
+                try:
+                    job['process'] = subprocess.Popen(['CopasiSE', job['copasi_file']],
+                                                      stdout=subprocess.PIPE,
+                                                      stderr=subprocess.PIPE)
+                except OSError as e:
+                    job['stderr'] = str(e)
+
+            if job['process'] is not None:
+                output, job['stderr'] = job['process'].communicate()
+                job['returncode'] = job['process'].returncode
+
+            with self._lock:
+                job['process'] = None
+                job['wall_time'] = time.time() - start
+                if job['status'] != self.CANCELLED:
+                    job['status'] = self.DONE if job['returncode'] == 0 else self.FAILED
+            self._finish(job_id)
+
+
+class _BatchScheduler(Scheduler):
+    """
+    For Developers
+
+    Base for schedulers which submit job scripts to a cluster.
+    Job scripts are kept so jobs can be resubmitted by hand.
+    """
+    ## directive which starts each option line of a job script
+    directive = None
+
+    def __init__(self, copasi_location, options=None):
+        """
+        :param copasi_location:
+            `str`. Gets passed to `module add` in the
+            job script to load copasi on the cluster
+
+        :param options:
+            `list` of `str`. Extra arguments to the submit command
+        """
+        self.copasi_location = copasi_location
+        self.options = options
+        if self.options is None:
+            self.options = []
+
+    def __str__(self):
+        return '{}(copasi_location="{}", options={})'.format(
+            type(self).__name__, self.copasi_location, self.options)
+
+    def _write_script(self, script, options, commands):
+        """
+        For Developers
+
+        :param script:
+            `str`. Path to write the job script to
+
+        :param options:
+            `list` of `str`. Option lines without the directive
+
+        :param commands:
+            `list` of `str`. Lines to run after copasi is loaded
+
+        :return:
+            `str`. script
+        """
+        lines = ['#!/bin/bash']
+        lines += ['{} {}'.format(self.directive, i) for i in options]
+        lines += ['module add {}'.format(self.copasi_location)]
+        lines += commands
+        with open(script, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        return script
+
+    @staticmethod
+    def _call(args):
+        """
+        For Developers
+
+        Run a command of the scheduler
+
+        :param args:
+            `list` of `str`
+
+        :return:
+            `str`. stdout of the command
+        """
+        try:
+            p = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        except OSError as e:
+            raise errors.SchedulerError('Could not run "{}": {}'.format(args[0], e))
+        output, err = p.communicate()
+        if p.returncode != 0:
+            raise errors.SchedulerError('"{}" exited with code {}: {}'.format(
+                ' '.join(args), p.returncode, err))
+        return output
+
+    @staticmethod
+    def _defaults(copasi_file, job_name, script, suffix=''):
+        """
+        For Developers
+
+        :return:
+            `tuple`. The job name and script, defaulting to the
+            name of copasi_file and a .sh file next to it
+        """
+        if job_name is None:
+            job_name = os.path.splitext(os.path.basename(copasi_file))[0] + suffix
+        if script is None:
+            script = os.path.join(os.path.dirname(copasi_file), job_name + '.sh')
+        return job_name, script
+
+    @staticmethod
+    def _files(copasi_files):
+        """
+        For Developers
+
+        :return:
+            `str`. A bash array of copasi_files
+        """
+        return 'files=({})'.format(' '.join([quote(i) for i in copasi_files]))
+
+
+class SGEScheduler(_BatchScheduler):
+    """
+    Submit jobs to a sun grid engine cluster with qsub. Finished
+    jobs are looked up with qacct.
+
+    .. highlight::
+
+        >>> scheduler = SGEScheduler(options=['-l', 'h_rt=48:00:00'])
+        >>> job_id = scheduler.submit('/path/to/model.cps')
+    """
+    directive = '#$'
+
+    def __init__(self, copasi_location='apps/COPASI/4.21.166-Linux-64bit', options=None):
+        super(SGEScheduler, self).__init__(copasi_location, options)
+
+    def submit(self, copasi_file, job_name=None, script=None):
+        job_name, script = self._defaults(copasi_file, job_name, script)
+        self._write_script(script, ['-V -cwd'], ['CopasiSE {}'.format(quote(copasi_file))])
+        output = self._call(['qsub', '-terse', '-N', job_name] + self.options + [script])
+        return output.strip()
+
+    def submit_array(self, copasi_files, job_name=None, script=None):
+        """
+        Submit copasi_files as one array job
+
+        :return:
+            `list` of `str`. Job id of each copasi file, i.e. 123.1
+        """
+        job_name, script = self._defaults(copasi_files[0], job_name, script, '_array')
+        self._write_script(script, ['-V -cwd', '-t 1-{}'.format(len(copasi_files))],
+                           [self._files(copasi_files),
+                            'CopasiSE "${files[$((SGE_TASK_ID - 1))]}"'])
+        output = self._call(['qsub', '-terse', '-N', job_name] + self.options + [script])
+        ## array jobs are reported as 123.1-10:1
+        job_number = output.strip().split('.')[0]
+        return ['{}.{}'.format(job_number, i + 1) for i in range(len(copasi_files))]
+
+    def status(self, job_id):
+        job_number, task = self._split(job_id)
+        xml = etree.fromstring(self._call(['qstat', '-xml']))
+        for job in xml.iter('job_list'):
+            if job.findtext('JB_job_number') != job_number:
+                continue
+            if task is not None and task not in self._tasks(job.findtext('tasks')):
+                continue
+            state = job.findtext('state')
+            if 'E' in state:
+                return self.FAILED
+            if 'd' in state:
+                return self.CANCELLED
+            if job.attrib.get('state') == 'running':
+                return self.RUNNING
+            return self.PENDING
+        return self._accounted_status(job_number, task)
+
+    def cancel(self, job_id):
+        job_number, task = self._split(job_id)
+        args = ['qdel', job_number]
+        if task is not None:
+            args += ['-t', task]
+        self._call(args)
+
+    def _accounted_status(self, job_number, task):
+        """
+        For Developers
+
+        Status of a job which has left the queue. Jobs
+        without an accounting record yet are taken as done
+
+        :return:
+            `str`
+        """
+        args = ['qacct', '-j', job_number]
+        if task is not None:
+            args += ['-t', task]
+        try:
+            output = self._call(args)
+        except errors.SchedulerError:
+            return self.DONE
+        record = {}
+        for line in output.splitlines():
+            fields = line.split(None, 1)
+            if len(fields) == 2:
+                record[fields[0]] = fields[1].strip()
+        if record.get('failed', '0').split()[0] != '0' or record.get('exit_status', '0') != '0':
+            return self.FAILED
+        return self.DONE
+
+    @staticmethod
+    def _split(job_id):
+        """
+        For Developers
+
+        :return:
+            `tuple`. Job number and array task id, which is None
+            for jobs which are not array jobs
+        """
+        if '.' in job_id:
+            return tuple(job_id.split('.', 1))
+        return job_id, None
+
+    @staticmethod
+    def _tasks(text):
+        """
+        For Developers
+
+        :param text:
+            `str`. Array tasks as qstat gives them, i.e. 3 or 1-10:1 or 1,4
+
+        :return:
+            `list` of `str`
+        """
+        tasks = []
+        if text is None:
+            return tasks
+        for i in text.split(','):
+            if '-' in i:
+                start, rest = i.split('-')
+                end, step = (rest.split(':') + ['1'])[:2]
+                tasks += [str(j) for j in range(int(start), int(end) + 1, int(step))]
+            else:
+                tasks.append(i)
+        return tasks
+
+
+class SlurmScheduler(_BatchScheduler):
+    """
+    Submit jobs to a slurm cluster with sbatch. Job
+    states are looked up with sacct, or with squeue on
+    clusters which do not keep accounting records.
+
+    .. highlight::
+
+        >>> scheduler = SlurmScheduler(options=['--time', '48:00:00'])
+        >>> job_id = scheduler.submit('/path/to/model.cps')
+    """
+    directive = '#SBATCH'
+
+    ## sacct and squeue states which are not failures
+    states = {'PENDING': Scheduler.PENDING,
+              'RUNNING': Scheduler.RUNNING,
+              'COMPLETING': Scheduler.RUNNING,
+              'CONFIGURING': Scheduler.RUNNING,
+              'SUSPENDED': Scheduler.RUNNING,
+              'REQUEUED': Scheduler.PENDING,
+              'RESIZING': Scheduler.RUNNING,
+              'COMPLETED': Scheduler.DONE,
+              'CANCELLED': Scheduler.CANCELLED}
+
+    def __init__(self, copasi_location='COPASI/4.22.170', options=None):
+        super(SlurmScheduler, self).__init__(copasi_location, options)
+
+    def submit(self, copasi_file, job_name=None, script=None):
+        job_name, script = self._defaults(copasi_file, job_name, script)
+        self._write_script(script, ['--job-name={}'.format(job_name)],
+                           ['CopasiSE {}'.format(quote(copasi_file))])
+        return self._job_id(self._call(['sbatch', '--parsable'] + self.options + [script]))
+
+    def submit_array(self, copasi_files, job_name=None, script=None):
+        """
+        Submit copasi_files as one array job
+
+        :return:
+            `list` of `str`. Job id of each copasi file, i.e. 123_0
+        """
+        job_name, script = self._defaults(copasi_files[0], job_name, script, '_array')
+        self._write_script(script, ['--job-name={}'.format(job_name),
+                                    '--array=0-{}'.format(len(copasi_files) - 1)],
+                           [self._files(copasi_files),
+                            'CopasiSE "${files[$SLURM_ARRAY_TASK_ID]}"'])
+        job_id = self._job_id(self._call(['sbatch', '--parsable'] + self.options + [script]))
+        return ['{}_{}'.format(job_id, i) for i in range(len(copasi_files))]
+
+    def status(self, job_id):
+        try:
+            output = self._call(['sacct', '-j', job_id, '-n', '-X', '-P', '-o', 'State'])
+        except errors.SchedulerError:
+            ## accounting is not enabled
+            output = ''
+        ## jobs are not in the accounting database straight after submission
+        if output.strip() == '':
+            return self._queued_status(job_id)
+        ## i.e. "CANCELLED by 1000"
+        return self.states.get(output.split()[0], self.FAILED)
+
+    def _queued_status(self, job_id):
+        """
+        For Developers
+
+        Status of a job without an accounting record. Jobs
+        which are not in the queue either are taken as done
+
+        :return:
+            `str`
+        """
+        try:
+            output = self._call(['squeue', '-h', '-j', job_id, '-o', '%T'])
+        except errors.SchedulerError:
+            ## squeue fails for job ids which have left the queue
+            return self.DONE
+        if output.strip() == '':
+            return self.DONE
+        return self.states.get(output.split()[0], self.FAILED)
+
+    def cancel(self, job_id):
+        self._call(['scancel', job_id])
+
+    @staticmethod
+    def _job_id(output):
+        """
+        For Developers
+
+        :param output:
+            `str`. From sbatch --parsable, i.e. 123 or 123;cluster
+
+        :return:
+            `str`
+        """
+        return output.strip().split(';')[0]
+
+
+class FakeScheduler(Scheduler):
+    """
+    Scheduler for tests. Nothing is run. Each job finishes with
+    status outcome once its status has been checked polls times.
+
+    .. highlight::
+
+        >>> scheduler = FakeScheduler(polls=2)
+        >>> job_id = scheduler.submit('/path/to/model.cps')
+        >>> scheduler.status(job_id)
+        'running'
+        >>> scheduler.status(job_id)
+        'done'
+    """
+    def __init__(self, polls=1, outcome=Scheduler.DONE):
+        """
+        :param polls:
+            `int`. Number of status checks before a job finishes
+
+        :param outcome:
+            `str`. Status of finished jobs
+        """
+        self.polls = polls
+        self.outcome = outcome
+        ## copasi_file, job_name, status and number of status checks of each job
+        self.jobs = OrderedDict()
+
+    def __str__(self):
+        return 'FakeScheduler(polls={}, outcome="{}")'.format(self.polls, self.outcome)
+
+    def submit(self, copasi_file, job_name=None, script=None):
+        job_id = 'fake-{}'.format(len(self.jobs) + 1)
+        self.jobs[job_id] = {'copasi_file': copasi_file,
+                             'job_name': job_name,
+                             'status': self.PENDING,
+                             'polls': 0}
+        return job_id
+
+    def status(self, job_id):
+        job = self.jobs[job_id]
+        if job['status'] not in self.FINISHED:
+            job['polls'] += 1
+            job['status'] = self.outcome if job['polls'] >= self.polls else self.RUNNING
+        return job['status']
+
+    def cancel(self, job_id):
+        if self.jobs[job_id]['status'] not in self.FINISHED:
+            self.jobs[job_id]['status'] = self.CANCELLED
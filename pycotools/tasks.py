@@ -24,10 +24,11 @@
 
 
 '''
+import sys
 import time
+import bisect
 import threading
 import Queue
-import psutil
 import shutil
 import numpy 
 import pandas
@@ -39,7 +40,7 @@ import os
 import subprocess
 import re
 import pickle
-import viz,errors, misc, _base, model
+import viz,errors, misc, _base, model, xpaths, schedulers
 import matplotlib
 import matplotlib.pyplot as plt
 from textwrap import wrap
@@ -51,6 +52,8 @@ import seaborn as sns
 from copy import deepcopy
 from subprocess import check_call
 from collections import OrderedDict
+from io import BytesIO
+from xml.parsers import expat
 from mixin import Mixin, mixin
 import multiprocessing
 
@@ -242,26 +245,49 @@ class CopasiMLParser(object):
     """
     Parse a copasi file into xml.etree.
 
+    With lazy=True the sections that pycotools never reads
+    (:py:attr:`CopasiMLParser.skip`) are not parsed. Each is kept
+    as the raw bytes it occupies in the file and replaced in the
+    tree by an empty element of the same tag, so that they cost
+    almost nothing in memory. :py:meth:`CopasiMLParser.splice` puts
+    them back verbatim when the xml is written.
+
     .. highlight::
 
         >>> model_path = r'/full/path/to/model.cps'
         >>> xml = CopasiMLParser(model_path).xml
+        >>> xml = CopasiMLParser(model_path, lazy=True).xml
     """
-    def __init__(self, copasi_file):
+    skip = ['MiriamAnnotation', 'Comment',
+            'ListOfUnitDefinitions', 'ListOfLayouts']
+
+    ## attribute given to the elements left in place of skipped sections
+    marker = 'pycotools-skipped'
+
+    def __init__(self, copasi_file, lazy=False):
         """
 
         :param copasi_file:
             `str` full path to a copasi file
+
+        :param lazy:
+            `bool`. default=False. Do not parse the
+            sections in :py:attr:`CopasiMLParser.skip`
         """
-        self.copasi_file = copasi_file
+        self.copasi_file = os.path.abspath(copasi_file)
+        self.lazy = lazy
         if os.path.isfile(self.copasi_file)!=True:
             raise errors.FileDoesNotExistError('{} is not a copasi file'.format(self.copasi_file))
-        self.copasiMLTree=self._parse_copasiML()
+
+        ## raw bytes of each skipped section
+        self.skipped = []
+        if self.lazy:
+            self.copasiMLTree = self._parse_lazy()
+        else:
+            self.copasiMLTree=self._parse_copasiML()
         self.copasiML=self.copasiMLTree.getroot()
         self.xml = self.copasiMLTree.getroot()
 
-        os.chdir(os.path.dirname(self.copasi_file))
-
     def _parse_copasiML(self):
         """
         Parse xml doc with lxml
@@ -270,6 +296,88 @@ class CopasiMLParser(object):
         tree= etree.parse(self.copasi_file)
         return tree
 
+    def _skipped_ranges(self, data):
+        """
+        Stream through the file with :py:mod:`xml.parsers.expat`
+        to find where each skipped section starts and ends.
+        Sections inside a skipped section are not looked at.
+
+        :param data:
+            `str`. Content of the copasi file
+
+        :return:
+            `list`. Each element is (start, end, tag) of a section
+        """
+        parser = expat.ParserCreate()
+        ranges = []
+        ## [depth, start, tag] of the section being skipped
+        state = {'depth': 0, 'skipping': None}
+
+        def start(name, attrs):
+            if state['skipping'] is None and name.split(':')[-1] in self.skip:
+                state['skipping'] = (state['depth'], parser.CurrentByteIndex, name.encode('utf-8'))
+            state['depth'] += 1
+
+        def end(name):
+            state['depth'] -= 1
+            if state['skipping'] is None or state['skipping'][0] != state['depth']:
+                return
+
+            depth, begin, tag = state['skipping']
+            index = parser.CurrentByteIndex
+            ## expat points at the end tag, or just
+            ## past the element when it is empty
+            if data.startswith('</' + tag, index) and data[index + len(tag) + 2] in '> \t\r\n':
+                index = data.index('>', index) + 1
+            ranges.append((begin, index, tag))
+            state['skipping'] = None
+
+        parser.StartElementHandler = start
+        parser.EndElementHandler = end
+        parser.Parse(data, True)
+        return ranges
+
+    def _parse_lazy(self):
+        """
+        Parse the copasi file with each section in
+        :py:attr:`CopasiMLParser.skip` replaced by an empty element
+
+        :return:
+            :py:class:`etree._ElementTree`
+        """
+        with open(self.copasi_file, 'rb') as f:
+            data = f.read()
+
+        chunks = []
+        position = 0
+        for begin, end, tag in self._skipped_ranges(data):
+            chunks.append(data[position:begin])
+            chunks.append('<{} {}="{}"/>'.format(tag, self.marker, len(self.skipped)))
+            self.skipped.append(data[begin:end])
+            position = end
+        chunks.append(data[position:])
+        return etree.parse(BytesIO(''.join(chunks)))
+
+    @classmethod
+    def splice(cls, data, skipped):
+        """
+        Put skipped sections back into serialized xml
+
+        :param data:
+            `str`. Serialized xml
+
+        :param skipped:
+            `list`. Raw bytes of each skipped section, i.e.
+            :py:attr:`CopasiMLParser.skipped`
+
+        :return:
+            `str`
+        """
+        if not skipped:
+            return data
+        return re.sub('<[^<>\s]+ {}="(\d+)"/>'.format(cls.marker),
+                      lambda match: skipped[int(match.group(1))], data)
+
     def write_copasi_file(self,copasi_filename, xml):
         """
         write to file with lxml write function
@@ -308,6 +416,10 @@ class Run(object):
     To run the scan task but have python write a .sh script for submission to sun grid engine:
         >>> Run(model, task='scan', mode='sge')
 
+    To run the task with any :py:class:`schedulers.Scheduler` and wait for it:
+        >>> R = Run(model, task='scan', scheduler=schedulers.SlurmScheduler())
+        >>> R.scheduler.wait(R.job_id)
+
     Properties
 
     ==========          ===================
@@ -317,6 +429,8 @@ class Run(object):
     mode                How to run the task
     sge_job_filename    Optional name of sh file
                         generated for running sge
+    scheduler           Optional :py:class:`schedulers.Scheduler`
+                        to run the task with. Overrides mode
     ==========          ===================
 
     =============
@@ -359,6 +473,7 @@ class Run(object):
                                    'mode': True,
                                    'sge_job_filename': None,
                                    'copasi_location': 'apps/COPASI/4.21.166-Linux-64bit', #for sge mode
+                                   'scheduler': None,
                                    }
 
         self.default_properties.update(self.kwargs)
@@ -369,7 +484,7 @@ class Run(object):
 
 
         if self.sge_job_filename == None:
-            self.sge_job_filename = os.path.join(os.getcwd(), 'sge_job_file.sh')
+            self.sge_job_filename = os.path.join(self.model.root, 'sge_job_file.sh')
 
         if self.mode is 'slurm':
             self.copasi_location = r'COPASI/4.22.170'
@@ -377,7 +492,13 @@ class Run(object):
         self.model = self.set_task()
         self.model.save()
 
-        if self.mode == True:
+        ## id of the job submitted to a scheduler
+        self.job_id = None
+
+        if self.scheduler is not None:
+            self.job_id = self.scheduler.submit(self.model.copasi_file)
+
+        elif self.mode == True:
             try:
                 self.run()
             except errors.CopasiError:
@@ -411,6 +532,10 @@ class Run(object):
         if self.mode not in modes:
             raise errors.InputError('{} not in {}'.format(self.mode, modes))
 
+        if self.scheduler is not None and not isinstance(self.scheduler, schedulers.Scheduler):
+            raise errors.InputError('scheduler should be a schedulers.Scheduler. '
+                                    'Got "{}"'.format(type(self.scheduler)))
+
     def __str__(self):
         return 'Run({})'.format(self.to_string())
 
@@ -432,7 +557,7 @@ class Run(object):
         """
         task = self.task.replace(' ', '_').lower()
 
-        for i in self.model.xml.find('{http://www.copasi.org/static/schema}ListOfTasks'):
+        for i in self.model.sections['ListOfTasks']:
             i.attrib['scheduled'] = "false"  # set all to false
             task_name = i.attrib['name'].lower().replace('-', '_').replace(' ', '_')
             if task == task_name:
@@ -471,42 +596,44 @@ class Run(object):
     def submit_copasi_job_SGE(self):
         """
         Submit copasi file as job to SGE based job scheduler.
+        The job script is written to sge_job_filename.
         :param copasi_location:
             Location to copasi on the sge cluster. Gets passed to `module add` to load copasi
 
         :return:
-            None
+            `str`. The job id, also in :py:attr:`Run.job_id`
         """
-        self.sge_job_filename = self.sge_job_filename.replace('/', '_')
-        with open(self.sge_job_filename, 'w') as f:
-            f.write('#!/bin/bash\n#$ -V -cwd\nmodule add {}\nCopasiSE "{}"'.format(
-                self.copasi_location, self.model.copasi_file
-            )
-        )
-
-        ## -N option for job namexx
-        os.system('qsub "{}" -N "{}" '.format(self.sge_job_filename, self.sge_job_filename))
+        self.scheduler = schedulers.SGEScheduler(copasi_location=self.copasi_location)
+        self.job_id = self._submit_job_script()
+        return self.job_id
 
     def submit_copasi_job_slurm(self):
         """
-        Submit copasi file as job to SGE based job scheduler.
+        Submit copasi file as job to slurm based job scheduler.
+        The job script is written to sge_job_filename.
         :param copasi_location:
-            Location to copasi on the sge cluster. Gets passed to `module add` to load copasi
+            Location to copasi on the slurm cluster. Gets passed to `module add` to load copasi
 
         :return:
-            None
+            `str`. The job id, also in :py:attr:`Run.job_id`
         """
-        self.sge_job_filename = self.sge_job_filename.replace('/', '_')
-        with open(self.sge_job_filename, 'w') as f:
-            f.write('#!/bin/bash\n#$ \nmodule add {}\nCopasiSE "{}"'.format(
-                self.copasi_location, self.model.copasi_file
-            )
-            )
+        self.scheduler = schedulers.SlurmScheduler(copasi_location=self.copasi_location)
+        self.job_id = self._submit_job_script()
+        return self.job_id
 
-        ## -N option for job namexx
-        os.system('sbatch "{}"  --job-name "{}"'.format(self.sge_job_filename, self.sge_job_filename))
-        ## remove .sh file after used.
-        os.remove(self.sge_job_filename)
+    def _submit_job_script(self):
+        """
+        For Developers
+
+        Submit the model to self.scheduler with
+        the job script written to sge_job_filename
+
+        :return:
+            `str`. The job id
+        """
+        job_name = os.path.splitext(os.path.basename(self.sge_job_filename))[0]
+        return self.scheduler.submit(self.model.copasi_file, job_name=job_name,
+                                     script=os.path.abspath(self.sge_job_filename))
 
 @mixin(model.GetModelComponentFromStringMixin)
 @mixin(UpdatePropertiesMixin)
@@ -515,8 +642,25 @@ class Run(object):
 @mixin(Bool2Numeric)
 class RunParallel(object):
     """
+    Run several models with CopasiSE at once, at most
+    max_active at a time. The exit code, wall time and
+    stderr of each run are in :py:attr:`RunParallel.results`
+
+    .. highlight::
+
+        >>> RP = RunParallel(models, task='scan', max_active=4)
+        >>> RP.results
+
+    With run=False nothing is run until :py:meth:`RunParallel.as_completed`
+    is iterated, which yields each model as soon as its run finishes
+    so its results can be parsed while the others are still running.
 
+        >>> RP = RunParallel(models, task='scan', max_active=4, run=False)
+        >>> for model, returncode, wall_time, stderr in RP.as_completed():
+        ...     data = viz.Parse(model)
 
+    :py:meth:`RunParallel.stop` can be called from another thread to
+    end the runs early.
     """
     def __init__(self, models, **kwargs):
         self.models = models
@@ -524,6 +668,7 @@ class RunParallel(object):
         self.default_properties = {
             'max_active': None,
             'task': 'parameter_estimation',
+            'run': True,
         }
         self.default_properties.update(self.kwargs)
         self.default_properties = self.convert_bool_to_numeric(self.default_properties)
@@ -535,9 +680,16 @@ class RunParallel(object):
         self.models = self.set_task()
         [i.save() for i in self.models]
 
+        ## the scheduler of the current run and the job id of each model
+        self._scheduler = None
+        self._job_ids = []
+        self._lock = threading.Lock()
+        self.stopped = False
+
         ##TODO put Try except block here once you remember which error
         ##is being raised
-        self.run_parallel()
+        if self.run:
+            self.run_parallel()
 
 
     def _do_checks(self):
@@ -566,6 +718,9 @@ class RunParallel(object):
 
         if self.max_active is None:
             self.max_active = len(self.models)
+
+        if self.max_active < 1:
+            raise errors.InputError('max_active should be at least 1. Got {}'.format(self.max_active))
     # def __str__(self):
     #     return 'RunParallel({})'.format()
 
@@ -577,7 +732,7 @@ class RunParallel(object):
         task = self.task.replace(' ', '_').lower()
         model_list = []
         for model in self.models:
-            for i in model.xml.find('{http://www.copasi.org/static/schema}ListOfTasks'):
+            for i in model.sections['ListOfTasks']:
                 i.attrib['scheduled'] = "false"  # set all to false
                 task_name = i.attrib['name'].lower().replace('-', '_').replace(' ', '_')
                 if task == task_name:
@@ -589,40 +744,121 @@ class RunParallel(object):
     def run_parallel(self):
         """
         Run models in parallel. Only have self.max_active
-        models running at once
+        models running at once. Each of a pool of max_active
+        threads starts CopasiSE on the next model and waits
+        for it to exit, so nothing polls the processes and
+        every process is reaped as soon as it finishes.
+
+        :return:
+            :py:class:`pandas.DataFrame`. The exit code, wall time
+            in seconds and stderr of each model, indexed by its
+            copasi_file. Also kept in :py:attr:`RunParallel.results`.
+            Models which were not run because of :py:meth:`RunParallel.stop`
+            have no exit code or wall time
+        """
+        results = [(m.copasi_file, None, None, None) for m in self.models]
+        for i, result in self._run_jobs():
+            results[i] = result
+
+        self.results = pandas.DataFrame(
+            results, columns=['copasi_file', 'returncode', 'wall_time', 'stderr']
+        ).set_index('copasi_file')
+        for copasi_file, job in self.results.iterrows():
+            if job['returncode'] != 0 and not self.stopped:
+                LOG.warning('CopasiSE exited with code {} for "{}": {}'.format(
+                    job['returncode'], copasi_file, job['stderr']))
+        return self.results
+
+    def as_completed(self):
+        """
+        Run the models, at most max_active at a time, and
+        yield each one as soon as CopasiSE exits. Runs which
+        have not started when the iteration is abandoned are
+        never started.
+
+        :return:
+            generator of `tuple`. (model, exit code, wall time, stderr)
+            in the order the runs finish
+        """
+        for i, (copasi_file, returncode, wall_time, err) in self._run_jobs():
+            yield self.models[i], returncode, wall_time, err
+
+    def _run_jobs(self):
+        """
+        For Developers
+
+        Submit the models to a :py:class:`schedulers.LocalScheduler`
+        with max_active workers, which each start CopasiSE on the next
+        model and wait for it to exit. Finished jobs are passed back
+        on a queue so the caller blocks rather than polls.
+
+        :return:
+            generator of `tuple`. (index of the model, (copasi_file,
+            exit code, wall time, stderr)) in the order the runs finish.
+            The exit code is None when CopasiSE could not be started.
+            Models which were never started are not yielded
+        """
+        done = Queue.Queue()
+        with self._lock:
+            ## a stop only ends the runs which were going when it was called
+            self.stopped = False
+            self._scheduler = schedulers.LocalScheduler(self.max_active, done=done)
+            self._job_ids = [self._scheduler.submit(m.copasi_file) for m in self.models]
+        scheduler, job_ids = self._scheduler, self._job_ids
+        index = dict((job_id, i) for i, job_id in enumerate(job_ids))
+        try:
+            for n in range(len(job_ids)):
+                job_id = done.get()
+                job = scheduler.jobs[job_id]
+                if job['wall_time'] is None:
+                    continue
+                yield index[job_id], (job['copasi_file'], job['returncode'],
+                                      job['wall_time'], job['stderr'])
+        finally:
+            ## stop anything else from being started
+            scheduler._cancel_waiting(job_ids)
+
+    def stop(self):
+        """
+        End the runs early. Models which have not started are
+        never run and running CopasiSE processes are terminated.
+        Safe to call from any thread.
+
         :return:
             None
         """
-        pids = []
-        num_models_to_process = len(self.models)
+        with self._lock:
+            self.stopped = True
+            scheduler, job_ids = self._scheduler, self._job_ids
+        for job_id in job_ids:
+            scheduler.cancel(job_id)
 
-        while num_models_to_process > 0:
 
-            # for copy_number, model in self.models.items():
-            model = self.models[num_models_to_process - 1]
-            if len(pids) < self.max_active:
-                num_models_to_process -= 1
-                subp = subprocess.Popen(['CopasiSE', model.copasi_file])
-                pids.append(subp.pid)
+def run_many(models, task='parameter_estimation', concurrency=None):
+    """
+    Run task on each of models with CopasiSE, at most concurrency
+    at a time, and yield each model as soon as its run finishes.
 
-            try:
-                for pid in range(len(pids)):
-                    try:
-                        p = psutil.Process(pids[pid])
-                    except psutil.NoSuchProcess:
-                        LOG.info('No such process: {}. Skipping'.format(pid))
-                        continue
-                    if psutil.pid_exists(pids[pid]) is False:
-                        del pids[pid]
-
-                    if p.status() is 'zombie':
-                        LOG.info('is zombie')
-
-                        del pids[pid]
-
-            except IndexError:
-                LOG.warning('index error skipped')
-                continue
+    .. highlight::
+
+        >>> for model, returncode, wall_time, stderr in run_many(models, task='time_course', concurrency=4):
+        ...     data = viz.Parse(model)
+
+    :param models:
+        `list` of :py:class:`model.Model`
+
+    :param task:
+        `str`. Task to run. See :py:class:`RunParallel`
+
+    :param concurrency:
+        `int`. Number of CopasiSE processes to run at once.
+        Defaults to all of them
+
+    :return:
+        generator of `tuple`. (model, exit code, wall time, stderr)
+        in the order the runs finish
+    """
+    return RunParallel(models, task=task, max_active=concurrency, run=False).as_completed()
 
 
 @mixin(model.GetModelComponentFromStringMixin)
@@ -766,7 +1002,7 @@ class Reports(object):
         '''
         #get existing report keys
         keys=[]
-        for i in self.model.xml.find('{http://www.copasi.org/static/schema}ListOfReports'):
+        for i in self.model.sections['ListOfReports']:
             keys.append(i.attrib['key'])
             if i.attrib['name']=='Time-Course':
                 self.model = self.remove_report('time_course')
@@ -775,7 +1011,7 @@ class Reports(object):
         while new_key  in keys:
             new_key='Report_{}'.format(numpy.random.randint(30,100))
 
-        ListOfReports = self.model.xml.find('{http://www.copasi.org/static/schema}ListOfReports')
+        ListOfReports = self.model.sections['ListOfReports']
         report = etree.SubElement(ListOfReports,
                                   'Report',
                                   attrib={'precision': '6',
@@ -845,7 +1081,7 @@ class Reports(object):
 
         ##TODO implement self.variable as column in scan
         keys=[]
-        for i in self.model.xml.find('{http://www.copasi.org/static/schema}ListOfReports'):
+        for i in self.model.sections['ListOfReports']:
             keys.append(i.attrib['key'])
             if i.attrib['name']=='Time-Course':
                 self.model = self.remove_report('time_course')
@@ -854,7 +1090,7 @@ class Reports(object):
         while new_key  in keys:
             new_key='Report_{}'.format(numpy.random.randint(30,100))
 
-        ListOfReports = self.model.xml.find('{http://www.copasi.org/static/schema}ListOfReports')
+        ListOfReports = self.model.sections['ListOfReports']
         report = etree.SubElement(ListOfReports,
                                   'Report',
                                   attrib={'precision': '6',
@@ -914,7 +1150,7 @@ class Reports(object):
         '''
         #get existing report keys
         keys=[]
-        for i in self.model.xml.find('{http://www.copasi.org/static/schema}ListOfReports'):
+        for i in self.model.sections['ListOfReports']:
             keys.append(i.attrib['key'])
             if i.attrib['name']=='profile_likelihood':
                 self.model = self.remove_report('profile_likelihood')
@@ -928,7 +1164,7 @@ class Reports(object):
                              'key': new_key,
                              'taskType': 'Scan'}
 
-        ListOfReports=self.model.xml.find('{http://www.copasi.org/static/schema}ListOfReports')
+        ListOfReports=self.model.sections['ListOfReports']
         report=etree.SubElement(ListOfReports,'Report')
         report.attrib.update(report_attributes)
 
@@ -963,7 +1199,7 @@ class Reports(object):
         '''
         #get existing report keys
         keys=[]
-        for i in self.model.xml.find('{http://www.copasi.org/static/schema}ListOfReports'):
+        for i in self.model.sections['ListOfReports']:
             keys.append(i.attrib['key'])
             if i.attrib['name']=='parameter_estimation':
                 self.model = self.remove_report('parameter_estimation')
@@ -978,7 +1214,7 @@ class Reports(object):
                            'taskType': 'parameterFitting'}
 
         # print self.model, type(self.model)
-        ListOfReports=self.model.xml.find('{http://www.copasi.org/static/schema}ListOfReports')
+        ListOfReports=self.model.sections['ListOfReports']
         report=etree.SubElement(ListOfReports,'Report')
         report.attrib.update(report_attributes)
         comment=etree.SubElement(report,'Comment')
@@ -1000,7 +1236,7 @@ class Reports(object):
         '''
         #get existing report keys
         keys=[]
-        for i in self.model.xml.find('{http://www.copasi.org/static/schema}ListOfReports'):
+        for i in self.model.sections['ListOfReports']:
             keys.append(i.attrib['key'])
             if i.attrib['name']=='multi_parameter_estimation':
                 self.model = self.remove_report('multi_parameter_estimation')
@@ -1014,7 +1250,7 @@ class Reports(object):
                            'key': new_key,
                            'taskType': 'parameterFitting'}
 
-        ListOfReports=self.model.xml.find('{http://www.copasi.org/static/schema}ListOfReports')
+        ListOfReports=self.model.sections['ListOfReports']
         report=etree.SubElement(ListOfReports,'Report')
         report.attrib.update(report_attributes)
         comment=etree.SubElement(report,'Comment')
@@ -1056,7 +1292,7 @@ class Reports(object):
         :return: pycotools.model.Model
         """
         assert report_name in self.report_types,'{} not a valid report type. These are valid report types: {}'.format(report_name,self.report_types)
-        for i in self.model.xml.find('{http://www.copasi.org/static/schema}ListOfReports'):
+        for i in self.model.sections['ListOfReports']:
             if report_name=='time_course':
                 report_name='time-course'
             if i.attrib['name'].lower() == report_name.lower():
@@ -1071,7 +1307,7 @@ class Reports(object):
         before defining a new one to ensure you only have one active report any once.
         :return:
         """
-        for i in self.model.xml.find('{http://www.copasi.org/static/schema}ListOfTasks'):
+        for i in self.model.sections['ListOfTasks']:
             for j in list(i):
                 if 'target' in j.attrib.keys():
                     j.attrib['target']=''
@@ -1640,9 +1876,9 @@ class TimeCourse(object):
                    'reference': key,
                    'confirmOverwrite': self.confirm_overwrite}
 
-        query = "//*[@name='Time-Course']" and "//*[@type='timeCourse']"
+        query = xpaths.TIME_COURSE
         present = False
-        for i in self.model.xml.xpath(query):
+        for i in query(self.model.xml):
             for j in list(i):
                 if 'append' and 'target' in j.attrib.keys():
                     present = True
@@ -1659,7 +1895,7 @@ class TimeCourse(object):
         time course reort to get the key
         """
         all_reports = []
-        for i in self.model.xml.find('{http://www.copasi.org/static/schema}ListOfReports'):
+        for i in self.model.sections['ListOfReports']:
             all_reports.append(i.attrib['name'])
             if i.attrib['name'] == 'Time-Course':
                 key = i.attrib['key']
@@ -1899,7 +2135,7 @@ class Scan(object):
         if self.report_type.lower() == 'time_course':
             self.report_type = 'time-course'
         key = None
-        for i in self.model.xml.find('{http://www.copasi.org/static/schema}ListOfReports'):
+        for i in self.model.sections['ListOfReports']:
             if i.attrib['name'].lower() == self.report_type.lower():
                 key = i.attrib['key']
         if key == None:
@@ -2021,9 +2257,9 @@ class Scan(object):
             etree.SubElement(scanItem_element, 'Parameter', attrib=maximum_attrib)
             etree.SubElement(scanItem_element, 'Parameter', attrib=log_attrib)
             etree.SubElement(scanItem_element, 'Parameter', attrib=dist_type_attrib)
-        query = '//*[@name="ScanItems"]'
+        query = xpaths.SCAN_ITEMS
         # print etree.tostring(scanItem_element, pretty_print=True)
-        for i in self.model.xml.xpath(query):
+        for i in query(self.model.xml):
             i.append(scanItem_element)
         return self.model
     #
@@ -2047,18 +2283,18 @@ class Scan(object):
         scheduled_attrib = {'scheduled': self.scheduled, 'updateModel': self.update_model}
 
         R = etree.Element('Report', attrib=report_attrib)
-        query = '//*[@name="Scan"]'
+        query = xpaths.SCAN
         '''
         If scan task already has a report element defined, modify it,
         otherwise create a new report element directly under the ScanTask
         element
         '''
-        scan_task = self.model.xml.xpath(query)[0]
+        scan_task = query(self.model.xml)[0]
         if scan_task[0].tag == '{http://www.copasi.org/static/schema}Problem':
             scan_task.insert(0, R)
         elif scan_task[0].tag == '{http://www.copasi.org/static/schema}Report':
             scan_task[0].attrib.update(report_attrib)
-        for i in self.model.xml.xpath(query):
+        for i in query(self.model.xml):
             i.attrib.update(scheduled_attrib)
             for j in list(i):
                 for k in list(j):
@@ -2076,8 +2312,8 @@ class Scan(object):
 
         :return:
         """
-        query = '//*[@name="ScanItems"]'
-        for i in self.model.xml.xpath(query):
+        query = xpaths.SCAN_ITEMS
+        for i in query(self.model.xml):
             for j in i:
                 j.getparent().remove(j)
         self.model.save()
@@ -2161,8 +2397,10 @@ class ExperimentMapper(object):
             raise errors.InputError('{} not in {}'.format(self.type, data_types))
 
         for i in range(len(self.experiment_files)):
+            ## relative to the model, not the working directory
             if os.path.isabs(self.experiment_files[i])!=True:
-                self.experiment_files[i] = os.path.abspath(self.experiment_files[i])
+                self.experiment_files[i] = os.path.abspath(
+                    os.path.join(self.model.root, self.experiment_files[i]))
 
         weight_method_string = ['mean_squared', 'stardard_deviation', 'value_scaling',
                                 'mean']  # line 2144
@@ -2228,11 +2466,11 @@ class ExperimentMapper(object):
     def experiments(self):
         existing_experiment_list=[]
         if self.type == 'experiment':
-            query = '//*[@name="Experiment Set"]'
+            query = xpaths.EXPERIMENT_SET
         elif self.type == 'validation':
-            query = '//*[@name="Validation Set"]'
+            query = xpaths.VALIDATION_SET
 
-        for i in self.model.xml.xpath(query):
+        for i in query(self.model.xml):
             for j in list(i):
                 existing_experiment_list.append(j)
         return existing_experiment_list
@@ -2499,10 +2737,10 @@ class ExperimentMapper(object):
         name attribute of experiment. usually Experiment_1 or something
         """
         if self.type == 'experiment':
-            query = '//*[@name="Experiment Set"]'
+            query = xpaths.EXPERIMENT_SET
         elif self.type == 'validation':
-            query = '//*[@name="Validation Set"]'
-        for i in self.model.xml.xpath(query):
+            query = xpaths.VALIDATION_SET
+        for i in query(self.model.xml):
             for j in list(i):
                 if j.attrib['name'] == experiment_name:
                     j.getparent().remove(j)
@@ -2522,12 +2760,12 @@ class ExperimentMapper(object):
         :return:
         """
         if self.type == 'experiment':
-            query = '//*[@name="Experiment Set"]'
+            query = xpaths.EXPERIMENT_SET
         elif self.type == 'validation':
-            query = '//*[@name="Validation Set"]'
+            query = xpaths.VALIDATION_SET
             raise errors.NotImplementedError('Validation data sets are currently not supported')
 
-        for j in self.model.xml.xpath(query):
+        for j in query(self.model.xml):
             j.insert(0, experiment_element)
         return self.model
 
@@ -3021,7 +3259,7 @@ class ParameterEstimation(object):
         but this works...
         :return:
         """
-        for i in self.model.xml.find('{http://www.copasi.org/static/schema}ListOfReports'):
+        for i in self.model.sections['ListOfReports']:
             if i.attrib['name'].lower() == 'parameter_estimation':
                 key = i.attrib['key']
         assert key != None
@@ -3039,32 +3277,9 @@ class ParameterEstimation(object):
     def _fit_items(self):
         """
         Get existing fit items
-        :return: dict
+        :return: :py:class:`pandas.DataFrame`. See :py:attr:`model.Model.fit_items`
         """
-        d={}
-        query='//*[@name="FitItem"]'
-        for i in self.model.xml.xpath(query):
-            for j in list(i):
-                if j.attrib['name']=='ObjectCN':
-                    match=re.findall('Reference=(.*)',j.attrib['value'])[0]
-
-                    if match=='Value':
-                        match2=re.findall('Reactions\[(.*)\].*Parameter=(.*),', j.attrib['value'])
-                        if match2!=[]:
-                            match2='({}).{}'.format(match2[0][0],match2[0][1])
-
-                    elif match=='InitialValue':
-                        match2=re.findall('Values\[(.*)\]', j.attrib['value'])
-                        if match2!=[]:
-                            match2=match2[0]
-                    elif match=='InitialConcentration':
-
-                        match2=re.findall('Metabolites\[(.*)\]',j.attrib['value'])
-                        if match2!=[]:
-                            match2=match2[0]
-                    if match2!=[]:
-                        d[match2]=j.attrib
-        return d
+        return self.model.fit_items
 
     def remove_fit_item(self,item):
         """
@@ -3072,57 +3287,18 @@ class ParameterEstimation(object):
         :param item:
         :return: pycotools.model.Model
         """
-        all_items= self._fit_items.keys()
-        query='//*[@name="FitItem"]'
+        fit_items = self._fit_items
+        all_items = list(fit_items.index)
         assert item in all_items,'{} is not a fit item. These are the fit items: {}'.format(item,all_items)
-        item=self._fit_items[item]
-        for i in self.model.xml.xpath(query):
-            for j in list(i):
-                if j.attrib['name']=='ObjectCN':
-                    #locate references
-                    #remove local parameters from PE task
-                    match=re.findall('Reference=(.*)',j.attrib['value'])[0]
-                    if match=='Value':
-                        pattern='Reactions\[(.*)\].*Parameter=(.*),Reference=(.*)'
-                        match2_copasiML=re.findall(pattern, j.attrib['value'])
-                        if match2_copasiML!=[]:
-                            match2_item=re.findall(pattern, item['value'])
-                            if match2_item!=[]:
-                                if match2_item==match2_copasiML:
-                                    i.getparent().remove(i)
-
-                    #rempve global parameters from PE task
-                    elif match=='InitialValue':
-                        pattern='Values\[(.*)\].*Reference=(.*)'
-                        match2_copasiML=re.findall(pattern, j.attrib['value'])
-                        if match2_copasiML!=[]:
-                            match2_item=re.findall(pattern,item['value'])
-                            if match2_item==match2_copasiML:
-                                i.getparent().remove(i)
-
-                    #remove IC parameters from PE task
-                    elif match=='InitialConcentration' or match=='InitialParticleNumber':
-                        pattern='Metabolites\[(.*)\],Reference=(.*)'
-                        match2_copasiML=re.findall(pattern,j.attrib['value'])
-                        if match2_copasiML!=[]:
-                            if match2_copasiML[0][1]=='InitialConcentration' or match2_copasiML[0][1]=='InitialParticleNumber':
-                                match2_item=re.findall(pattern,item['value'])
-                                if match2_item!=[]:
-                                    if match2_item==match2_copasiML:
-                                        i.getparent().remove(i)
-                    else:
-                        raise TypeError('Parameter {} is not a local parameter, initial concentration parameter or a global parameter.initial_value'.format(match2_item))
-        return self.model
-
+        return self.model._remove_fit_items(fit_items.loc[[item], 'cn'])
 
     def remove_all_fit_items(self):
         """
-        Iterate over all fit items and remove them
-        from the parameter estimation task
+        Remove all fit items from the parameter
+        estimation task
         :return: pycotools.model.Model
         """
-        for i in self._fit_items:
-            self.model = self.remove_fit_item(i)
+        self.model = self.model._remove_fit_items(self._fit_items['cn'])
         return self.model
 
 
@@ -3160,75 +3336,17 @@ class ParameterEstimation(object):
         :return: pandas.DataFrame
         """
 
-        keep_metabs = []
-        keep_globs = []
-        keep_locs = []
-        for model_metab in self.model.metabolites:
-            for PE_metab in self.metabolites:
-                if PE_metab.name == model_metab.name:
-                    keep_metabs.append(PE_metab)
-
-        for model_glob in self.model.global_quantities:
-            for PE_glob in self.global_quantities:
-                if PE_glob.name == model_glob.name:
-                    keep_globs.append(PE_glob)
-
-
-        for model_loc in self.model.local_parameters:
-            for PE_loc in self.local_parameters:
-                if PE_loc.global_name == model_loc.global_name:
-                    keep_locs.append(PE_loc)
-
-
-        keep_metabs = [i.to_df() for i in keep_metabs]
-        keep_globs = [i.to_df() for i in keep_globs]
-        keep_locs = [i.to_df() for i in keep_locs]
-
-        metabs = pandas.DataFrame()
-        if keep_metabs != []:
-            metab = pandas.concat(keep_metabs, axis=1).transpose()
-            metab.drop('compartment', inplace=True, axis=1)
-            metab.drop('key', inplace=True, axis=1)
-            metab.drop('simulation_type', inplace=True, axis=1)
-            metab = metab.rename(columns={'value': 'start_value'})
-
-            if self.quantity_type == 'concentration':
-                metab.drop('particle_numbers', axis=1, inplace=True)
-                metab = metab.rename(columns={'concentration': 'start_value'})
-
-            elif self.quantity_type == 'particle_numbers':
-                metab.drop('concentration', axis=1, inplace=True)
-                metab = metab.rename(columns={'particle_numbers': 'start_value'})
-                metab = metab[['name', 'start_value']]
-            metabs = metabs.append(metab)
-
-        if not metabs.empty:
-            metabs = metabs.sort_values(by='name')
-
-
-        los = pandas.DataFrame()
-        if keep_locs != []:
-            lo = pandas.concat(keep_locs, axis=1).transpose()
-            lo = lo.rename(columns={'value': 'start_value'})
-            lo = lo[['global_name', 'start_value']]
-            lo = lo.rename(columns={'global_name': 'name'})
-            los = los.append(lo)
-
-        if not los.empty:
-            los = los.sort_values(by='name')
+        ## the fit items are read from the table of model quantities
+        quantities = self.model._quantity_table(self.quantity_type)
 
-
-        gls = pandas.DataFrame()
-        if keep_globs != []:
-            gl = pandas.concat(keep_globs, axis=1).transpose()
-            gl = gl.rename(columns={'initial_value': 'start_value'})
-            gl = gl[['name', 'start_value']]
-            gls = gls.append(gl)
-
-        if not gls.empty:
-            gls = gls.sort_values(by='name')
-
-        df = pandas.concat([metabs, gls, los], axis=0)
+        selected = [('metabolite', [i.name for i in self.metabolites]),
+                    ('global_quantity', [i.name for i in self.global_quantities]),
+                    ('local_parameter', [i.global_name for i in self.local_parameters])]
+        df = pandas.concat(
+            [quantities[(quantities['type'] == component) & quantities['name'].isin(names)].sort_values(by='name')
+             for component, names in selected]
+        )
+        df = df[['name', 'value']].rename(columns={'value': 'start_value'})
 
         df['lower_bound'] = [self.lower_bound]*df.shape[0]
         df['upper_bound'] = [self.upper_bound]*df.shape[0]
@@ -3475,7 +3593,7 @@ class ParameterEstimation(object):
             etree.SubElement(method_element,'Parameter',attrib=pf)
 
 
-        tasks=self.model.xml.find('{http://www.copasi.org/static/schema}ListOfTasks')
+        tasks=self.model.sections['ListOfTasks']
 
         method= tasks[5][-1]
         parent=method.getparent()
@@ -3506,8 +3624,8 @@ class ParameterEstimation(object):
         calculate_stats={'type': 'bool', 'name': 'Calculate Statistics', 'value': self.calculate_statistics}
         create_parameter_sets={'type': 'bool', 'name': 'Create Parameter Sets', 'value': self.create_parameter_sets}
 
-        query='//*[@name="Parameter Estimation"]' and '//*[@type="parameterFitting"]'
-        for i in self.model.xml.xpath(query):
+        query = xpaths.PARAMETER_FITTING
+        for i in query(self.model.xml):
             i.attrib.update(scheluled_attrib)
             for j in list(i):
                 if self.report_name != None:
@@ -3568,13 +3686,17 @@ class MultiParameterEstimation(ParameterEstimation):
                                     than intermittant function evaluations
     max_active                      default: None. Number of models to run 
                                     simultaneously. If None then run all.
+    scheduler                       default: None. A :py:class:`schedulers.Scheduler`
+                                    which run submits the models to. Their job
+                                    ids are in :py:attr:`job_ids`
     ===========================     ==================================================
 
     """
     ##TODO Merge ParameterEstimation and Multi into one class.
     def __init__(self, model, experiment_files, copy_number=1, pe_number=3,
                  run_mode='multiprocess', results_directory=None,
-                 output_in_subtask=False, max_active=None, skip_config=False, **kwargs):
+                 output_in_subtask=False, max_active=None, skip_config=False,
+                 scheduler=None, **kwargs):
         super(MultiParameterEstimation, self).__init__(model, experiment_files, **kwargs)
         ## add to ParameterEstimation defaults
         self.copy_number = copy_number
@@ -3584,6 +3706,7 @@ class MultiParameterEstimation(ParameterEstimation):
         self.results_directory = results_directory
         self.skip_config = skip_config
         self.output_in_subtask = output_in_subtask
+        self.scheduler = scheduler
 
         if self.results_directory is None:
             self.results_directory = os.path.join(os.path.dirname(self.model.copasi_file), 'MultipleParameterEstimationResults')
@@ -3647,77 +3770,64 @@ class MultiParameterEstimation(ParameterEstimation):
 
     ##TODO work out whether parameter_estimation report shuold be multi_parameter_estimation
 
-    def copy_model(self):
+    def _copy_scan(self, mod):
         """
-        Copy the model n times
-        Uses deep copy to ensure separate models
+        Copy a model which already has its scan set up `copy_number`
+        times. The copies differ only in the report filename of their
+        scan so they are written with :py:class:`model.BulkWriter`,
+        which serializes the model once for all of them.
+
+        :param mod:
+            :py:class:`model.Model`. The first copy
+
         :return: dict[index] = model copy
         """
+        report_files = self.enumerate_PE_output()
+        indices = range(1, self.copy_number)
+        dire, fle = os.path.split(mod.copasi_file)
+        filenames = [os.path.join(dire, fle[:-4]+'_{}.cps'.format(i)) for i in indices]
+        df = pandas.DataFrame({'Scan': [report_files[i] for i in indices]})
+
         dct = {}
-        dct[0] = deepcopy(self.model)
-        for i in range(1, self.copy_number):
-            dire, fle = os.path.split(self.model.copasi_file)
-            new_cps = os.path.join(dire, fle[:-4]+'_{}.cps'.format(i))
-            model = deepcopy(self.model)
-            model.copasi_file = new_cps
-            model.save()
-            dct[i] = model
+        dct[0] = mod
+        if indices == []:
+            return dct
+
+        BW = model.BulkWriter(mod, df, filenames)
+        BW.write()
+        for position, i in enumerate(indices):
+            dct[i] = BW.to_model(position)
         return dct
 
-    def _setup1scan(self, q, model, report):
-        """
-        Setup a single scan.
-        :param q: queue from multiprocessing
-        :param model: pycotools.model.Model
-        :param report: str.
-        :return:
+    def _setup_scan(self):
         """
-        start = time.time()
-        models = q.put(Scan(model,
-                   scan_type='repeat',
-                   number_of_steps=self.pe_number,
-                   subtask='parameter_estimation',
-                   report_type='multi_parameter_estimation',
-                   report_name=report,
-                   run=False,
-                   append=self.append,
-                   confirm_overwrite=self.confirm_overwrite,
-                   output_in_subtask=self.output_in_subtask,
-                   save=True))
+        Set up a repeat scan of `pe_number` parameter estimations
+        on a copy of the model. The scan is not run since the
+        copies are run together by :py:meth:`MultiParameterEstimation.run`
 
-
-
-    def _setup_scan(self, models):
-        """
-        Set up `copy_number` repeat items with `pe_number`
-        repeats of parameter estimation. Set run_mode to false
-        as we want to use the multiprocess mode of the run_mode class
-        to process all files at once in CopasiSE
         :return:
-        """
-        number_of_cpu = cpu_count()
-        q = Queue.Queue(maxsize=number_of_cpu)
-        report_files = self.enumerate_PE_output()
-        res = {}
-        for copy_number, model in models.items():
-            t = threading.Thread(target=self._setup1scan,
-                                 args=(q, model, report_files[copy_number]))
-            t.daemon = True
-            t.start()
-            time.sleep(0.1)
-
-            res[copy_number] = q.get().model
-        ## Since this is being executed in parallel sometimes
-        ## we get process clashes. Not sure exactly whats going on
-        ## but introducing a small delay seems to fix
-        time.sleep(0.1)
-        return res
-
+            :py:class:`model.Model`. The first copy
+        """
+        return Scan(deepcopy(self.model),
+                    scan_type='repeat',
+                    number_of_steps=self.pe_number,
+                    subtask='parameter_estimation',
+                    report_type='multi_parameter_estimation',
+                    report_name=self.enumerate_PE_output()[0],
+                    run=False,
+                    append=self.append,
+                    confirm_overwrite=self.confirm_overwrite,
+                    output_in_subtask=self.output_in_subtask,
+                    save=True).model
 
     def run(self):
         """
+        Run the models. With a scheduler they are submitted
+        as an array job which can be waited for with
+        `MPE.scheduler.wait(MPE.job_ids)`
 
         :return:
+            `list` of job ids when there is a scheduler
         :param models: dict of models. Output from setup()
         """
         ##load cps from pickle in case run not being use straignt after set_up
@@ -3726,6 +3836,12 @@ class MultiParameterEstimation(ParameterEstimation):
         except AttributeError:
             raise errors.IncorrectUsageError('You must use the setup method before the run method')
 
+        if self.scheduler is not None:
+            ## schedule the scan in each model without running them
+            models = RunParallel(self.models.values(), task='scan', run=False).models
+            self.job_ids = self.scheduler.submit_array([i.copasi_file for i in models])
+            return self.job_ids
+
         if self.run_mode == 'SGE':
             try:
                 check_call('qhost')
@@ -3776,15 +3892,17 @@ class MultiParameterEstimation(ParameterEstimation):
         assert self.model != None
         assert isinstance(self.model, model.Model)
 
-        ##copy the number `copy_number` times
-        models = self.copy_model()
+        ## create the scan once, on the first copy
+        first = self._setup_scan()
+
+        ##then copy it `copy_number` times
+        models = self._copy_scan(first)
 
         ## ensure we have dict of models
         assert isinstance(models, dict)
         assert len(models) == self.copy_number
 
-        ##create a scan per model (again models is dict of model.Model's
-        self.models = self._setup_scan(models)
+        self.models = models
         assert isinstance(models[0], model.Model)
         return models
 
@@ -3807,6 +3925,167 @@ class MultiParameterEstimation(ParameterEstimation):
 
 
 
+class EarlyStopping(object):
+    """
+    Run a :py:class:`MultiParameterEstimation` which has been set up
+    and stop it once its estimations have converged. The reports are
+    read with :py:class:`viz.ReportTailer` while CopasiSE runs. Once
+    the estimations converge the models waiting to run are skipped and
+    running CopasiSE processes are terminated. Estimations converge when
+
+        - the best top_k RSS values are within tolerance of the best,
+          i.e. the k'th best RSS is at most (1 + tolerance) times the best
+        - or the best RSS has not improved for patience estimations
+
+    .. highlight::
+
+        >>> MPE = MultiParameterEstimation(model, experiment_files, copy_number=40,
+        ...                                pe_number=10, run_mode=False)
+        >>> MPE.write_config_file()
+        >>> MPE.setup()
+        >>> ES = EarlyStopping(MPE, top_k=5, tolerance=1e-3, patience=100)
+        >>> ES.run()
+        >>> ES.leaderboard
+
+    Each row of a report counts as one estimation, so output_in_subtask
+    should be False.
+    """
+    def __init__(self, MPE, top_k=None, tolerance=None, patience=None, interval=1):
+        """
+        :param MPE:
+            :py:class:`MultiParameterEstimation`. After its setup method has run
+
+        :param top_k:
+            `int`. Number of best RSS values that must agree. Used with tolerance
+
+        :param tolerance:
+            `float`. Relative difference allowed between the best
+            and the top_k'th best RSS
+
+        :param patience:
+            `int`. Number of estimations without an improvement
+            to the best RSS after which to stop
+
+        :param interval:
+            `int`, `float`. Seconds between reads of the reports
+        """
+        self.MPE = MPE
+        self.top_k = top_k
+        self.tolerance = tolerance
+        self.patience = patience
+        self.interval = interval
+        self._do_checks()
+
+        ## RSS of every finished estimation, best first
+        self.rss = []
+        self.since_improvement = 0
+
+    def __str__(self):
+        return 'EarlyStopping(top_k={}, tolerance={}, patience={})'.format(
+            self.top_k, self.tolerance, self.patience)
+
+    def _do_checks(self):
+        """
+        Verify integrity of user input
+        :return:
+        """
+        if not hasattr(self.MPE, 'models'):
+            raise errors.IncorrectUsageError('You must use the setup method of '
+                                             'MultiParameterEstimation before EarlyStopping')
+
+        if self.top_k is None and self.patience is None:
+            raise errors.InputError('Specify top_k and tolerance, patience or both')
+
+        if (self.top_k is None) != (self.tolerance is None):
+            raise errors.InputError('top_k and tolerance are used together')
+
+        if self.top_k is not None and self.top_k < 2:
+            raise errors.InputError('top_k should be at least 2. Got {}'.format(self.top_k))
+
+        if self.patience is not None and self.patience < 1:
+            raise errors.InputError('patience should be at least 1. Got {}'.format(self.patience))
+
+    @property
+    def converged(self):
+        """
+        :return:
+            `bool`. Whether the estimations seen so far have converged
+        """
+        if self.patience is not None and self.since_improvement >= self.patience:
+            return True
+        if self.top_k is not None and len(self.rss) >= self.top_k:
+            best = self.rss[0]
+            return self.rss[self.top_k - 1] - best <= self.tolerance * abs(best)
+        return False
+
+    def update(self, rss):
+        """
+        Record the RSS of a finished estimation
+
+        :param rss:
+            `float`
+
+        :return:
+            `bool`. Whether the estimations have converged
+        """
+        if self.rss == [] or rss < self.rss[0]:
+            self.since_improvement = 0
+        else:
+            self.since_improvement += 1
+        bisect.insort(self.rss, rss)
+        return self.converged
+
+    def run(self):
+        """
+        Run the models of the multi parameter estimation
+        until they finish or converge
+
+        :return:
+            :py:class:`pandas.DataFrame`. :py:attr:`RunParallel.results`.
+            The best estimation of each report is in
+            :py:attr:`EarlyStopping.leaderboard`
+        """
+        self.runner = RunParallel(self.MPE.models.values(), task='scan',
+                                  max_active=self.MPE.max_active, run=False)
+        self.tailer = viz.ReportTailer(self.MPE)
+        ## rows left from earlier runs do not count
+        self.tailer.read()
+        self.tailer.best = {}
+
+        ## an error in the thread is raised again once it has finished
+        error = []
+
+        def run_parallel():
+            try:
+                self.runner.run_parallel()
+            except Exception:
+                error.append(sys.exc_info())
+
+        thread = threading.Thread(target=run_parallel)
+        thread.daemon = True
+        thread.start()
+        for row in self.tailer.follow(interval=self.interval,
+                                      until=lambda: not thread.is_alive()):
+            if self.update(row['RSS']):
+                LOG.info('Estimations converged after {} with best RSS {}. '
+                         'Stopping'.format(len(self.rss), self.rss[0]))
+                self.runner.stop()
+                break
+        thread.join()
+        if error:
+            exc_type, exc_value, tb = error[0]
+            raise exc_type, exc_value, tb
+        return self.runner.results
+
+    @property
+    def leaderboard(self):
+        """
+        :return:
+            :py:class:`pandas.DataFrame`. :py:attr:`viz.ReportTailer.leaderboard`
+        """
+        return self.tailer.leaderboard
+
+
 class ChaserParameterEstimations(object):
     """
     Perform secondary hook and jeeves parameter estimations
@@ -4142,6 +4421,8 @@ class MultiModelFit(object):
                 :ref:`mutli_parameter_estimation_kwargs` are accepted here.
         """
         self.project_dir = project_dir
+        if self.project_dir is not None:
+            self.project_dir = os.path.abspath(self.project_dir)
 #        self.config_filename=config_filename
         self.kwargs = kwargs
 
@@ -4190,8 +4471,6 @@ class MultiModelFit(object):
         dct={}
 
         for cps_dir in self.sub_cps_dirs:
-            os.chdir(cps_dir)
-
             # if os.path.isabs(self.config_filename):
             #     self.config_filename = os.path.split(self.config_filename)[1]
 
@@ -4269,10 +4548,9 @@ class MultiModelFit(object):
         self.wd = self.project_dir
         if os.path.isdir(self.wd)!=True:
             os.mkdir(self.wd)
-        os.chdir(self.project_dir)
         cps_dirs={}
         for cps in self.cps_files:
-            cps_abs=os.path.abspath(cps)
+            cps_abs=os.path.join(self.project_dir, cps)
             cps_filename=os.path.split(cps_abs)[1]
             sub_cps_dir=os.path.join(self.wd,cps_filename[:-4])
             if os.path.isdir(sub_cps_dir)!=True:
@@ -4297,19 +4575,17 @@ class MultiModelFit(object):
         '''
         if self.project_dir==None:
             raise errors.InputError('Cannot read multifit confuration as no Project kwarg is provided')
-        ##make sure we're in the right directory
-        os.chdir(self.project_dir)
         LOG.info('project dir is --> {}'.format(self.project_dir))
         cps_list=[]
-        for cps_file in glob.glob('*.cps'):
+        for cps_file in glob.glob(os.path.join(self.project_dir, '*.cps')):
             cps_list.append(cps_file)
 
         exp_list=[]
         exp_file_types=('*.csv','*.txt')
         for typ in exp_file_types:
 
-            for exp_file in glob.glob(typ):
-                exp_list.append(os.path.abspath(exp_file))
+            for exp_file in glob.glob(os.path.join(self.project_dir, typ)):
+                exp_list.append(exp_file)
         if cps_list==[]:
             raise errors.InputError('No cps files in your project')
         if exp_list==[]:
@@ -4363,6 +4639,11 @@ class ProfileLikelihood(object):
     run                             default: False. Passed on to Run or RunParallel
     max_active                      default: None. number of models to run
                                     simultaneously. None=all. For when run='parallel'
+    scheduler                       default: None. A :py:class:`schedulers.Scheduler`
+                                    to submit the models to instead of running them.
+                                    They are submitted when run is not False or when
+                                    :py:meth:`run_analysis` is called. Their job ids
+                                    are in :py:attr:`job_ids`
     results_directory               default: ProfileLikelihoods in the
                                     :py:attr:`model.root` directory
     method                          default: 'hooke_jeeves'
@@ -4425,6 +4706,7 @@ class ProfileLikelihood(object):
             'cooling_factor': 0.85,
             'max_active': 3,
             'parallel_scan': True,
+            'scheduler': None,
         }
         self.default_properties.update(self.kwargs)
         if self.default_properties.get('run_mode') is not None:
@@ -4453,6 +4735,9 @@ class ProfileLikelihood(object):
         self.to_file()
         # self.model_dct['current_parameters'][r'Ski'].open()
 
+        ## ids of the jobs submitted to a scheduler
+        self.job_ids = None
+
         if self.run is not False:
             self.run_analysis()
 
@@ -4505,8 +4790,8 @@ class ProfileLikelihood(object):
         :return:
             :py:class:`model.Model`
         """
-        query = '//*[@name="Parameter Estimation"]'
-        for i in self.model.xml.xpath(query):
+        query = xpaths.PARAMETER_ESTIMATION
+        for i in query(self.model.xml):
             if 'type' in i.keys():
                 if i.attrib['type'] == 'parameterFitting':
                     for j in i:
@@ -4715,7 +5000,7 @@ class ProfileLikelihood(object):
             etree.SubElement(method_element,'Parameter',attrib=pf)
 
 
-        tasks=self.model.xml.find('{http://www.copasi.org/static/schema}ListOfTasks')
+        tasks=self.model.sections['ListOfTasks']
 
         method = tasks[5][-1]
         parent = method.getparent()
@@ -4740,15 +5025,18 @@ class ProfileLikelihood(object):
             dct['current_parameters'] = self.model
             parameters = self.model.parameters[self.model.fit_item_order]
         else:
-            for i in self.index:
-                I = model.InsertParameters(
-                    self.model, df=self.df,
-                    parameter_path=self.parameter_path, index=i
-                )
-                new_model = I.model
-                dct[i] = new_model
-
-                parameters[i] = I.parameters#new_model.parameters[new_model.fit_item_order]
+            if self.parameter_path is not None:
+                df = viz.Parse(self.parameter_path, copasi_file=self.model.copasi_file).data
+            else:
+                df = self.df
+
+            ## one copy of the model per index, all filled
+            ## in from the same template
+            df = df.iloc[self.index]
+            BW = model.BulkWriter(self.model, df, quantity_type=self.quantity_type)
+            for position, i in enumerate(self.index):
+                dct[i] = BW.to_model(position)
+                parameters[i] = pandas.DataFrame(df.iloc[position]).transpose()
         return dct, parameters
 
 
@@ -4775,9 +5063,10 @@ class ProfileLikelihood(object):
         variables into the profile likelihood directories
         :return:
         """
-        query = '//*[@name="File Name"]'
-        for i in self.model.xml.xpath(query):
-            fle = os.path.abspath(i.attrib['value'])
+        query = xpaths.FILE_NAMES
+        for i in query(self.model.xml):
+            ## relative paths are relative to the model, not the working directory
+            fle = os.path.join(self.model.root, i.attrib['value'])
             i.attrib['value'] = fle
         return self.model
 
@@ -4787,8 +5076,8 @@ class ProfileLikelihood(object):
         remove reports defined elsewhere, i.e. the parameter estimation task
         :return:
         """
-        query = '//*[@target]'
-        for i in self.model.xml.xpath(query):
+        query = xpaths.TARGETS
+        for i in query(self.model.xml):
             if i.attrib['target'] != '':
                 i.attrib['target'] = ''
         return self.model
@@ -4799,33 +5088,14 @@ class ProfileLikelihood(object):
         the parameter estimation task
         :return:
         """
-        query = "//*[@name='FitItem']" #query="//*[@name='FitItem']"
         for model in self.model_dct:
             count = 0
             for param in self.model_dct[model]:
-                # self.model_dct[model][param].open()
-                ##ascertain which parameter this is
-                for i in self.model_dct[model][param].xml.xpath(query):
-                    count = count + 1
-                    for j in i:
-                        if j.attrib['name'] == 'ObjectCN':
-                            ## for globals
-                            global_quantities = re.findall('.*Values\[(.*)\]', j.attrib['value'])
-                            local_parameters = re.findall('.*Reactions\[(.*)\].*Parameter=(.*),', j.attrib['value'])
-                            metabolites = re.findall('.*Metabolites\[(.*)\],', j.attrib['value'])
-                            if local_parameters != []:
-
-                                local_parameters = "({}).{}".format(local_parameters[0][0], local_parameters[0][1])
-                                if local_parameters == param:
-                                    j.getparent().getparent().remove(j.getparent())
-
-                            elif metabolites != []:
-                                if metabolites[0] == param:
-                                    j.getparent().getparent().remove(j.getparent())
-
-                            elif global_quantities != []:
-                                if global_quantities[0] == param:
-                                    j.getparent().getparent().remove(j.getparent())
+                mod = self.model_dct[model][param]
+                fit_items = mod.fit_items
+                count = count + fit_items.shape[0]
+                ## remove the fit item for this parameter
+                mod._remove_fit_items(fit_items.loc[fit_items.index == param, 'cn'])
 
         if count == 0:
             raise errors.NoFitItemsError('Model does not contain any fit items. Please setup a parameter estimation and try again')
@@ -4934,9 +5204,18 @@ class ProfileLikelihood(object):
 
     def run_analysis(self):
         """
+        Run the models, or submit them when there is a scheduler
 
         :return:
+            `list` of job ids when there is a scheduler
         """
+        if self.scheduler is not None:
+            model_list = [self.model_dct[i][j] for i in self.model_dct for j in self.model_dct[i]]
+            ## schedule the scan in each model without running them
+            model_list = RunParallel(model_list, task='scan', run=False).models
+            self.job_ids = self.scheduler.submit_array([i.copasi_file for i in model_list])
+            return self.job_ids
+
         # if self.run == 'multiprocess'
         model_list = []
         if self.run is 'parallel':
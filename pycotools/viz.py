@@ -121,12 +121,13 @@ import scipy
 import os
 import matplotlib
 import itertools
-import tasks,errors, misc, model
+import tasks,errors, misc, model, xpaths
 import seaborn 
 import logging
 from subprocess import check_call,Popen
 import glob
 import re
+import time
 import numpy
 from mixin import Mixin, mixin
 from textwrap import wrap
@@ -303,13 +304,15 @@ class CreateResultsDirectoryMixin(Mixin):
     @staticmethod
     def create_directory(results_directory):
         """
-        create directory for results and switch to it
+        create directory for results. The working
+        directory is left unchanged so save figures
+        with the returned path.
+
         :param results_directory:
         :return:
         """
         if not os.path.isdir(results_directory):
             os.makedirs(results_directory)
-        os.chdir(results_directory)
         return results_directory
 
 class ChiSquaredStatistics(object):
@@ -579,6 +582,7 @@ class Parse(object):
         if folder == None:
             folder = cls_instance.results_directory
         d = {}
+        fit_item_order = cls_instance.model.fit_item_order
 
         for report_name in glob.glob(folder+r'/*.txt'):
             report_name = os.path.abspath(report_name)
@@ -608,8 +612,8 @@ class Parse(object):
                 data = data.drop(data.columns[[0, -2]], axis=1)
                 data.columns = range(data.shape[1])
                 ### parameter of interest has been removed.
-                names = cls_instance.model.fit_item_order+['RSS']
-                if cls_instance.model.fit_item_order == []:
+                names = fit_item_order + ['RSS']
+                if fit_item_order == []:
                     raise errors.SomethingWentHorriblyWrongError('Parameter Estimation task is empty')
                 if len(names) != data.shape[1]:
                     raise errors.SomethingWentHorriblyWrongError('length of parameter estimation data does not equal number of parameters estimated')
@@ -636,6 +640,7 @@ class Parse(object):
             folder = cls_instance.results_directory
 
         d = []
+        names = self.cls_instance.model.fit_item_order + ['RSS']
 
         report_names = glob.glob(os.path.join(folder, '*.txt'))
         for report_name in report_names:
@@ -670,7 +675,6 @@ class Parse(object):
                 width = data.shape[1]
             #     # remove the extra bracket
                 data[width] = data[width].str[1:]
-                names = self.cls_instance.model.fit_item_order + ['RSS']
                 data.columns = names
                 # os.remove(report_name)
                 # data.to_csv(report_name,
@@ -703,7 +707,8 @@ class Parse(object):
                                     ' data with model component names')
         m = model.Model(self.copasi_file)
         ## check that cps has a parameter estimation configured
-        if m.fit_item_order == []:
+        names = m.fit_item_order + ['RSS']
+        if names == ['RSS']:
             raise errors.InputError('No fit items exist. Its possible that you have'
                                     ' not given the copasi file that was used to generate this'
                                     ' parameter estimation data. This is a common error when '
@@ -767,7 +772,6 @@ class Parse(object):
                     data = data.drop(data.columns[[0, -2]], axis=1)
                     data.columns = range(data.shape[1])
                     ### parameter of interest has been removed.
-                    names = m.fit_item_order + ['RSS']
                     if len(names) != data.shape[1]:
                         raise errors.SomethingWentHorriblyWrongError(
                             'length of parameter estimation data does not equal number of parameters estimated')
@@ -782,7 +786,6 @@ class Parse(object):
                 left_bracket_columns = data[data.columns[0]]
                 data = data.drop(data.columns[0], axis=1)
                 data[data.columns[-1]] = float(data[data.columns[-1]].str[1:][0])
-                names = m.fit_item_order + ['RSS']
                 if len(names) != data.shape[1]:
                     raise errors.SomethingWentHorriblyWrongError(
                         'length of parameter estimation data does not equal number of parameters estimated')
@@ -863,16 +866,15 @@ class Parse(object):
             :return:
                 `list` of experiment files
             """
-            query = '//*[@name="File Name"]'
             l = []
-            for i in mod.xml.xpath(query):
-                f = os.path.abspath(i.attrib['value'])
+            for i in xpaths.FILE_NAMES(mod.xml):
+                f = os.path.join(mod.root, i.attrib['value'])
                 if os.path.isfile(f) != True:
                     raise errors.InputError(
                         'Experimental files in use cannot be automatically '
                         ' determined. Please give a list of experiment file '
                         'paths to the experiment_files keyword'.format())
-                l.append(os.path.abspath(i.attrib['value']))
+                l.append(f)
             return l
 
         def dof(mod):
@@ -997,6 +999,179 @@ class Parse(object):
         return parse_data(results, fit_item_order)
 
 
+class ReportTailer(object):
+    """
+    Read the reports of a :py:class:`tasks.MultiParameterEstimation`
+    while CopasiSE is still writing them. Each report is read from
+    where the last read stopped, so only rows appended since then
+    are parsed. The best row of each report so far is kept in
+    :py:attr:`ReportTailer.leaderboard`.
+
+    The first argument is either a :py:class:`tasks.MultiParameterEstimation`
+    or, like :py:class:`Parse`, the folder of reports with the
+    copasi_file that generated them.
+
+    .. highlight::
+
+        >>> tailer = ReportTailer(MPE)
+        >>> for row in tailer.follow(interval=60):
+        ...     print tailer.leaderboard.head()
+    """
+    def __init__(self, cls_instance, copasi_file=None):
+        """
+        :param cls_instance:
+            :py:class:`tasks.MultiParameterEstimation` or `str`. Folder of reports
+
+        :param copasi_file:
+            `str`. The configured model that generated the reports.
+            Only needed when cls_instance is a folder
+        """
+        self.cls_instance = cls_instance
+        self.copasi_file = copasi_file
+
+        if isinstance(self.cls_instance, tasks.MultiParameterEstimation):
+            self.folder = self.cls_instance.results_directory
+            fit_item_order = self.cls_instance.model.fit_item_order
+
+        elif isinstance(self.cls_instance, str):
+            if self.copasi_file is None:
+                raise errors.InputError('To read a folder of parameter estimation reports '
+                                        'specify argument to copasi_file. This should be '
+                                        'the configured model that generated the reports')
+            self.folder = self.cls_instance
+            fit_item_order = model.Model(self.copasi_file).fit_item_order
+
+        else:
+            raise errors.InputError('"{}" is not a MultiParameterEstimation or '
+                                    'a folder of reports'.format(self.cls_instance))
+
+        self.names = fit_item_order + ['RSS']
+        if self.names == ['RSS']:
+            raise errors.InputError('No fit items exist. Its possible that you have not '
+                                    'given the model that was used to generate the reports')
+
+        ## bytes of each report read so far
+        self.positions = {}
+        ## text after the last complete line of each report
+        self._partial = {}
+        ## best row of each report so far
+        self.best = {}
+
+    def __str__(self):
+        return 'ReportTailer(folder="{}", reports={})'.format(self.folder, len(self.positions))
+
+    @property
+    def leaderboard(self):
+        """
+        :return:
+            :py:class:`pandas.DataFrame`. The best row of each report
+            read so far indexed by report name, sorted by RSS
+        """
+        if self.best == {}:
+            return pandas.DataFrame(columns=self.names)
+        return pandas.DataFrame(self.best.values()).sort_values(by='RSS')
+
+    def read(self):
+        """
+        Read the rows appended to each report since the last read
+
+        :return:
+            `list` of :py:class:`pandas.Series`. One for each new row,
+            named by the report it was read from
+        """
+        rows = []
+        for report_name in sorted(glob.glob(os.path.join(self.folder, '*.txt'))):
+            rows += self._read_report(os.path.abspath(report_name))
+        return rows
+
+    def follow(self, interval=1, until=None):
+        """
+        Read the reports every interval seconds and yield rows
+        as they appear. Reports are read one last time once until
+        returns True so the rows written before then are not missed.
+
+        :param interval:
+            `int`, `float`. Seconds to wait between reads
+
+        :param until:
+            callable with no arguments. Stop once it returns True.
+            Defaults to never stopping
+
+        :return:
+            generator of :py:class:`pandas.Series`
+        """
+        while True:
+            finished = until is not None and until()
+            for row in self.read():
+                yield row
+            if finished:
+                return
+            time.sleep(interval)
+
+    def _read_report(self, report_name):
+        """
+        For Developers
+
+        Parse the complete lines appended to report_name since it was
+        last read. A report smaller than what has been read was rewritten,
+        i.e. by :py:class:`Parse`, so it is read again from the start.
+
+        :param report_name:
+            `str`. Full path to a report
+
+        :return:
+            `list` of :py:class:`pandas.Series`
+        """
+        position = self.positions.get(report_name, 0)
+        if os.path.getsize(report_name) < position:
+            position = 0
+            self._partial.pop(report_name, None)
+
+        with open(report_name, 'rb') as f:
+            f.seek(position)
+            lines = (self._partial.pop(report_name, '') + f.read()).split('\n')
+            self.positions[report_name] = f.tell()
+
+        ## CopasiSE may not have finished writing the last line
+        if lines[-1] != '':
+            self._partial[report_name] = lines[-1]
+
+        rows = []
+        for line in lines[:-1]:
+            values = self._parse_line(line)
+            if values is None:
+                continue
+            row = pandas.Series(values, index=self.names, name=report_name)
+            rows.append(row)
+            if report_name not in self.best or row['RSS'] < self.best[report_name]['RSS']:
+                self.best[report_name] = row
+        return rows
+
+    def _parse_line(self, line):
+        """
+        For Developers
+
+        :param line:
+            `str`. A line of a report. Raw lines from CopasiSE have the
+            best parameters in brackets followed by the RSS
+
+        :return:
+            `list` of `float` or None for titles, headers and blank lines
+        """
+        fields = [i.strip('()') for i in line.strip().split('\t')]
+        try:
+            values = [float(i) for i in fields if i != '']
+        except ValueError:
+            return None
+        if values == []:
+            return None
+        if len(values) != len(self.names):
+            raise errors.SomethingWentHorriblyWrongError(
+                'Row of {} values in a report of {} parameters and RSS: "{}"'.format(
+                    len(values), len(self.names) - 1, line))
+        return values
+
+
 @mixin(tasks.UpdatePropertiesMixin)
 @mixin(SaveFigMixin)
 @mixin(ParseMixin)
@@ -1197,7 +1372,7 @@ class PlotTimeCourse(PlotKwargs):
                 if self.separate:
                     fig.savefig(fle, dpi=self.dpi, bbox_inches='tight')
                 else:
-                    fig.savefig(self.filename, dpi=self.dpi, bbox_inches='tight')
+                    fig.savefig(os.path.join(dirs, self.filename), dpi=self.dpi, bbox_inches='tight')
 
         if self.show:
             plt.show()
@@ -3160,7 +3335,6 @@ class ModelSelectionOld(object):
                 save_dir = os.path.join(self.results_directory, 'ModelSelectionGraphs')
                 if os.path.isdir(save_dir) is not True:
                     os.mkdir(save_dir)
-                os.chdir(save_dir)
                 fname = os.path.join(save_dir, 'boxplot_{}.{}'.format(metric, self.ext))
                 plt.savefig(fname, dpi=self.dpi, bbox_inches='tight')
                 LOG.info('boxplot saved to : "{}"'.format(fname))
@@ -3207,7 +3381,6 @@ class ModelSelectionOld(object):
                 save_dir = os.path.join(self.results_directory, 'ModelSelectionGraphs')
                 if os.path.isdir(save_dir) != True:
                     os.mkdir(save_dir)
-                os.chdir(save_dir)
                 fname = os.path.join(save_dir, 'Histogram_{}_{}.{}'.format(label2, label, self.ext))
                 plt.savefig(fname, dpi=self.dpi, bbox_inches='tight')
                 LOG.info('histograms saved to : "{}"'.format(fname))
@@ -3246,7 +3419,6 @@ class ModelSelectionOld(object):
                 save_dir = os.path.join(self.results_directory, 'ModelSelectionGraphs')
                 if os.path.isdir(save_dir) is not True:
                     os.mkdir(save_dir)
-                os.chdir(save_dir)
                 fname = os.path.join(save_dir, 'ViolinPlot_{}.{}'.format(metric, self.ext))
                 plt.savefig(fname, dpi=self.dpi, bbox_inches='tight')
                 LOG.info('Violin plot saved to : "{}"'.format(fname))
@@ -3641,7 +3813,6 @@ class ModelSelection(object):
                 save_dir = os.path.join(self.results_directory, 'ModelSelectionGraphs')
                 if os.path.isdir(save_dir) is not True:
                     os.mkdir(save_dir)
-                os.chdir(save_dir)
                 fname = os.path.join(save_dir, 'ViolinPlot_{}.{}'.format(metric, self.ext))
                 plt.savefig(fname, dpi=self.dpi, bbox_inches='tight')
                 LOG.info('Violin plot saved to : "{}"'.format(fname))
@@ -0,0 +1,134 @@
+# -*-coding: utf-8 -*-
+"""
+
+ This file is part of PyCoTools.
+
+ PyCoTools is free software: you can redistribute it and/or modify
+ it under the terms of the GNU Lesser General Public License as published by
+ the Free Software Foundation, either version 3 of the License, or
+ (at your option) any later version.
+
+ PyCoTools is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ GNU Lesser General Public License for more details.
+
+ You should have received a copy of the GNU Lesser General Public License
+ along with PyCoTools.  If not, see <http://www.gnu.org/licenses/>.
+
+
+ $Author: Ciaran Welsh
+
+Queries into copasiML. The XPath expressions used by
+:py:mod:`model` and :py:mod:`tasks` are compiled once here
+rather than every time they are run and :py:class:`Sections`
+holds direct handles on the top level sections of a model.
+
+Usage:
+    >>> from pycotools import xpaths
+    >>> fit_items = xpaths.FIT_ITEMS(model.xml)
+    >>> reports = model.sections['ListOfReports']
+"""
+
+from lxml import etree
+
+NAMESPACE = 'http://www.copasi.org/static/schema'
+NAMESPACES = {'copasi': NAMESPACE}
+
+
+def tag(name):
+    """
+    :param name:
+        `str`. A copasiML tag without the namespace, i.e. `ListOfTasks`
+
+    :return:
+        `str`. The namespaced tag
+    """
+    return '{{{}}}{}'.format(NAMESPACE, name)
+
+
+def _compile(query):
+    return etree.XPath(query, namespaces=NAMESPACES)
+
+
+## Queries start from the section their matches live in rather than
+## searching the whole document with //. Steps below a top level section
+## use * since pycotools adds some elements, including whole tasks,
+## without the copasi namespace.
+_MODEL = '/copasi:COPASI/copasi:Model'
+_TASK = '/copasi:COPASI/copasi:ListOfTasks/*'
+_PROBLEM = '/copasi:COPASI/copasi:ListOfTasks/*/*'
+
+## parameter sets
+KINETIC_PARAMETERS = _compile(_MODEL + '/copasi:ListOfModelParameterSets/*'
+                                       '/*[@cn="String=Kinetic Parameters"]')
+
+## functions
+PARAMETER_DESCRIPTIONS = _compile('/copasi:COPASI/copasi:ListOfFunctions/copasi:Function'
+                                  '/copasi:ListOfParameterDescriptions/copasi:ParameterDescription')
+
+## tasks
+TIME_COURSE = _compile(_TASK + '[@type="timeCourse"]')
+SCAN = _compile(_TASK + '[@name="Scan"]')
+PARAMETER_FITTING = _compile(_TASK + '[@type="parameterFitting"]')
+## the parameter estimation task and report
+PARAMETER_ESTIMATION = _compile('/copasi:COPASI/*/*[@name="Parameter Estimation"]')
+SCAN_ITEMS = _compile(_PROBLEM + '/*[@name="ScanItems"]')
+EXPERIMENT_SET = _compile(_PROBLEM + '/*[@name="Experiment Set"]')
+VALIDATION_SET = _compile(_PROBLEM + '/*[@name="Validation Set"]')
+FIT_ITEMS = _compile(_TASK + '[@type="parameterFitting"]'
+                               '/*/*[@name="OptimizationItemList"]/*[@name="FitItem"]')
+FILE_NAMES = _compile('/copasi:COPASI/copasi:ListOfTasks//*[@name="File Name"]')
+TARGETS = _compile('/copasi:COPASI/copasi:ListOfTasks//*[@target]')
+
+
+class Sections(object):
+    """
+    Direct handles on the top level sections of a copasiML
+    document. Each section is looked up once and then returned
+    straight from :py:attr:`Sections.handles`. Sections that do
+    not exist yet are looked up again next time so they are found
+    once they are added.
+
+    Usage:
+        >>> sections = Sections(xml)
+        >>> sections['ListOfMetabolites']
+        >>> sections['Model'].attrib['timeUnit']
+    """
+    ## sections which are children of the Model element.
+    ## All others are children of the root element
+    model_sections = ['ListOfCompartments', 'ListOfMetabolites',
+                      'ListOfModelValues', 'ListOfReactions',
+                      'ListOfModelParameterSets', 'StateTemplate',
+                      'InitialState']
+
+    def __init__(self, xml):
+        """
+        :param xml:
+            :py:class:`etree._Element`. The root of a copasiML document
+        """
+        self.xml = xml
+        self.handles = {}
+
+    def __getitem__(self, name):
+        """
+        :param name:
+            `str`. Section tag without the copasi namespace
+
+        :return:
+            :py:class:`etree._Element` or None when the section does not exist
+        """
+        if name in self.model_sections:
+            parent = self['Model']
+        else:
+            parent = self.xml
+        element = self.handles.get(name)
+        ## handles on sections which have since been removed are stale
+        if element is not None and element.getparent() is parent:
+            return element
+        element = parent.find(tag(name))
+        if element is None:
+            self.handles.pop(name, None)
+        else:
+            self.handles[name] = element
+        return element